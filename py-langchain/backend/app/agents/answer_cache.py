@@ -0,0 +1,82 @@
+from typing import Any
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import RunnableBinding, RunnableConfig, ensure_config
+
+from app.agents.history import message_text
+from app.core.answer_cache import answer_cache
+
+RETRIEVAL_TOOL = "get_context_docs"
+
+
+def _opening_question(messages: list[BaseMessage]) -> HumanMessage | None:
+    """The user's message when it opens the thread, follow-ups depend on what came before."""
+    humans = [m for m in messages if isinstance(m, HumanMessage)]
+    # The prompt is the only system message until earlier turns are summarized
+    systems = [m for m in messages if isinstance(m, SystemMessage)]
+    if len(humans) != 1 or len(systems) > 1:
+        return None
+    return humans[0]
+
+
+def _retrieved_documents(turn: list[BaseMessage]) -> list[str] | None:
+    """The documents a turn answered from, None unless it only used the retrieval tool."""
+    document_ids: list[str] = []
+    for message in turn:
+        if isinstance(message, AIMessage) and any(
+            call["name"] != RETRIEVAL_TOOL for call in message.tool_calls
+        ):
+            return None
+        if isinstance(message, ToolMessage):
+            if (
+                message.name != RETRIEVAL_TOOL
+                or message.status == "error"
+                or not isinstance(message.artifact, list)
+            ):
+                return None
+            document_ids.extend(str(id) for id in message.artifact if id)
+    return document_ids if any(isinstance(m, ToolMessage) for m in turn) else None
+
+
+class AnswerCachingModel(RunnableBinding):
+    """
+    The agent's tool calling model, with the answer cache in front of it.
+
+    A question opening a thread is first looked up in the user's cached
+    answers; on a hit the cached answer is the model's response and the turn
+    ends there. Final answers to such questions that were built from
+    retrieved documents only are stored for later threads.
+    """
+
+    async def ainvoke(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> BaseMessage:
+        config = ensure_config(config)
+        messages = input.to_messages() if isinstance(input, PromptValue) else input
+        user = (config.get("configurable", {}).get("_credentials") or {}).get("user") or {}
+        question = _opening_question(messages) if isinstance(messages, list) else None
+        if not user.get("email") or question is None:
+            return await super().ainvoke(input, config, **kwargs)
+
+        question_text = message_text(question)
+        if messages[-1] is question:
+            answer = await answer_cache.lookup(user["email"], question_text)
+            if answer is not None:
+                return AIMessage(answer, response_metadata={"answer_cache": "hit"})
+
+        response = await super().ainvoke(input, config, **kwargs)
+        if isinstance(response, AIMessage) and not response.tool_calls:
+            turn = messages[messages.index(question) + 1 :]
+            document_ids = _retrieved_documents(turn)
+            if document_ids is not None and message_text(response):
+                answer_cache.store(
+                    user["email"], question_text, message_text(response), document_ids
+                )
+        return response
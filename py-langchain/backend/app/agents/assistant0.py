@@ -1,6 +1,16 @@
-from langgraph.prebuilt import ToolNode, create_react_agent
+from langgraph.prebuilt import create_react_agent
 from langchain_openai import ChatOpenAI
 
+from app.agents.answer_cache import AnswerCachingModel
+from app.agents.history import ConversationState, history_manager
+from app.agents.tool_node import CachingToolNode, ToolPolicy
+from app.core.config import settings
+from app.core.fga import authorization_manager
+from app.core.metrics import METRICS_ENABLED, register_stats
+from app.core.rag import query_embedding_cache
+from app.core.user_info import user_info_cache
+from app.core.google_calendar import calendar_event_cache
+from app.core.answer_cache import answer_cache
 from app.agents.tools.shop_online import shop_online
 from app.agents.tools.google_calendar import list_upcoming_events
 from app.agents.tools.user_info import get_user_info
@@ -8,6 +18,13 @@ from app.agents.tools.context_docs import get_context_docs
 from datetime import date
 
 
+if settings.CHECKPOINTER_BACKEND == "postgres":
+    from app.core.checkpointer import install_checkpointer
+
+    checkpointer = install_checkpointer()
+    if METRICS_ENABLED:
+        register_stats("checkpointer", checkpointer.stats)
+
 tools = [get_user_info, list_upcoming_events, shop_online, get_context_docs]
 
 llm = ChatOpenAI(model="gpt-4.1-mini")
@@ -22,8 +39,53 @@ def get_prompt():
         f"Use the tools as needed to answer the user's question. Render the email body as a markdown block, do not wrap it in code blocks. Today is {today_str}."
     )
 
+tool_node = CachingToolNode(
+    tools,
+    default_policy=ToolPolicy(
+        cache_ttl_seconds=settings.TOOL_RESULT_CACHE_TTL_SECONDS,
+        max_concurrency=settings.TOOL_MAX_CONCURRENCY,
+    ),
+    policies={
+        # Every purchase must reach the shop, and waits for the user's approval
+        shop_online.name: ToolPolicy(),
+        # Document access follows the FGA caches, no staler than they are
+        get_context_docs.name: ToolPolicy(
+            cache_ttl_seconds=settings.FGA_LIST_OBJECTS_CACHE_TTL_SECONDS,
+            max_concurrency=settings.TOOL_MAX_CONCURRENCY,
+        ),
+    },
+    cache_size=settings.TOOL_RESULT_CACHE_SIZE,
+    handle_tool_errors=False,
+)
+
+# Retrieved documents must not outlive the user's access to them
+authorization_manager.on_invalidate(
+    lambda user_email, document_id: tool_node.forget(
+        get_context_docs.name, user_email
+    )
+)
+
+model = llm
+if settings.ANSWER_CACHE_ENABLED:
+    model = AnswerCachingModel(
+        bound=llm,
+        kwargs=llm.bind_tools(list(tool_node.tools_by_name.values())).kwargs,
+    )
+
+if METRICS_ENABLED:
+    # Served at /assistant0/metrics by app.agents.server, next to the LangGraph API
+    register_stats("history", history_manager.stats)
+    register_stats("tool_node", tool_node.stats)
+    register_stats("query_embedding_cache", query_embedding_cache.stats)
+    register_stats("authorization", authorization_manager.stats)
+    register_stats("user_info_cache", user_info_cache.stats)
+    register_stats("calendar_event_cache", calendar_event_cache.stats)
+    register_stats("answer_cache", answer_cache.stats)
+
 agent = create_react_agent(
-    llm,
-    tools=ToolNode(tools, handle_tool_errors=False),
+    model,
+    tools=tool_node,
     prompt=get_prompt(),
+    pre_model_hook=history_manager,
+    state_schema=ConversationState,
 )
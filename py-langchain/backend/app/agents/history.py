@@ -0,0 +1,255 @@
+"""
+Keeps the conversation sent to the model within a token budget.
+
+Runs as the agent's pre-model hook. The thread's messages stay whole in the
+checkpoint, only the model input is reduced:
+
+- tool outputs of earlier turns, retrieved documents and calendar listings
+  mostly, are cut down to HISTORY_TOOL_OUTPUT_MAX_TOKENS, the current turn
+  keeps them whole
+- once the history exceeds HISTORY_MAX_TOKENS, the oldest turns are folded
+  into a running summary kept in the thread state, until the recent turns fit
+  into HISTORY_KEEP_TOKENS. Later calls only add the turns that aged out since
+  to the summary, which keeps the summary calls small and rare.
+"""
+
+import json
+import time
+from collections import OrderedDict
+from typing import NotRequired
+
+import tiktoken
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableConfig
+from langchain_openai import ChatOpenAI
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.prebuilt.chat_agent_executor import AgentState
+
+from app.core.config import settings
+
+# Tokenizer of the gpt-4.1 models
+ENCODING_NAME = "o200k_base"
+# Per message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+TOKEN_COUNT_CACHE_SIZE = 10000
+
+SUMMARY_PROMPT = (
+    "You keep the memory of a conversation between a user and their personal assistant. "
+    "Update the summary so far with the messages that follow it. Keep what later turns may "
+    "refer to: names, dates, amounts, products, facts from documents and calendar events, "
+    "decisions and requests that are still open. Leave out greetings and how tools were called. "
+    "Answer with the updated summary only."
+)
+
+
+class ConversationState(AgentState):
+    history_summary: NotRequired[str]
+    # Id of the first message the summary does not cover
+    history_summary_until: NotRequired[str]
+
+
+def message_text(message: AnyMessage) -> str:
+    if isinstance(message.content, str):
+        text = message.content
+    else:
+        text = "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in message.content
+        )
+    if isinstance(message, AIMessage) and message.tool_calls:
+        text += json.dumps([call["args"] for call in message.tool_calls])
+    return text
+
+
+def _transcript(messages: list[AnyMessage]) -> str:
+    lines = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            speaker = "User"
+        elif isinstance(message, ToolMessage):
+            speaker = f"Tool {message.name or ''}".rstrip()
+        elif isinstance(message, AIMessage):
+            speaker = "Assistant"
+        else:
+            continue
+        text = message_text(message)
+        if text:
+            lines.append(f"{speaker}: {text}")
+    return "\n\n".join(lines)
+
+
+class ConversationHistoryManager:
+    def __init__(
+        self,
+        max_tokens: int,
+        keep_tokens: int,
+        tool_output_max_tokens: int,
+        summary_max_tokens: int,
+        summarizer: BaseChatModel | None = None,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_tokens = keep_tokens
+        self.tool_output_max_tokens = tool_output_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self._summarizer = summarizer
+        self._encoding: tiktoken.Encoding | None = None
+        # message id -> (tokens, message as sent from a later turn, its tokens)
+        self._measured: OrderedDict[str, tuple[int, AnyMessage, int]] = OrderedDict()
+
+        self.calls = 0
+        self.summaries = 0
+        self.summary_seconds = 0.0
+        self.tool_outputs_elided = 0
+        self.history_tokens = 0
+        self.tokens_sent = 0
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        # Loaded lazily, tiktoken may need to download the encoding first
+        if self._encoding is None:
+            self._encoding = tiktoken.get_encoding(ENCODING_NAME)
+        return self._encoding
+
+    @property
+    def summarizer(self) -> BaseChatModel:
+        if self._summarizer is None:
+            self._summarizer = ChatOpenAI(
+                model=settings.HISTORY_SUMMARY_MODEL,
+                max_tokens=self.summary_max_tokens,
+            )
+        return self._summarizer
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode_ordinary(text))
+
+    def _measure(self, message: AnyMessage) -> tuple[int, AnyMessage, int]:
+        """Tokens of a message, and the message as sent once its turn is over."""
+        cached = self._measured.get(message.id) if message.id else None
+        if cached is not None:
+            self._measured.move_to_end(message.id)
+            return cached
+
+        text = message_text(message)
+        tokens = self.encoding.encode_ordinary(text)
+        count = len(tokens) + MESSAGE_OVERHEAD_TOKENS
+        measured = (count, message, count)
+        if isinstance(message, ToolMessage) and len(tokens) > self.tool_output_max_tokens:
+            elided = len(tokens) - self.tool_output_max_tokens
+            content = (
+                f"{self.encoding.decode(tokens[: self.tool_output_max_tokens])}\n"
+                f"[{elided} more tokens of this tool output were left out]"
+            )
+            measured = (
+                count,
+                message.model_copy(update={"content": content}),
+                self.count_tokens(content) + MESSAGE_OVERHEAD_TOKENS,
+            )
+
+        if message.id:
+            self._measured[message.id] = measured
+            while len(self._measured) > TOKEN_COUNT_CACHE_SIZE:
+                self._measured.popitem(last=False)
+        return measured
+
+    async def _summarize(self, summary: str, messages: list[AnyMessage]) -> str:
+        started = time.perf_counter()
+        response = await self.summarizer.with_config(tags=[TAG_NOSTREAM]).ainvoke(
+            [
+                SystemMessage(SUMMARY_PROMPT),
+                HumanMessage(
+                    f"Summary so far:\n{summary or '(empty)'}\n\n"
+                    f"Messages:\n{_transcript(messages)}"
+                ),
+            ]
+        )
+        self.summaries += 1
+        self.summary_seconds += time.perf_counter() - started
+        return message_text(response).strip()
+
+    async def __call__(self, state: ConversationState, config: RunnableConfig) -> dict:
+        messages = state["messages"]
+        summary = state.get("history_summary", "")
+        start = 0
+        if summary:
+            until = state.get("history_summary_until")
+            start = next((i for i, m in enumerate(messages) if m.id == until), None)
+            if start is None:
+                # The summarized messages were replaced, start over
+                summary, start = "", 0
+
+        current_turn = max(
+            (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)),
+            default=0,
+        )
+        history_tokens = 0
+        sent: list[AnyMessage] = []
+        counts: list[int] = []
+        for i, message in enumerate(messages):
+            tokens, reduced, reduced_tokens = self._measure(message)
+            history_tokens += tokens
+            if i < start:
+                continue
+            if i < current_turn:
+                if reduced is not message:
+                    self.tool_outputs_elided += 1
+                sent.append(reduced)
+                counts.append(reduced_tokens)
+            else:
+                sent.append(message)
+                counts.append(tokens)
+
+        update: dict = {}
+        summary_tokens = self.count_tokens(summary) if summary else 0
+        if sum(counts) + summary_tokens > self.max_tokens:
+            # Fold the oldest turns into the summary, cutting only in front of a user
+            # message so that tool calls stay next to their results
+            kept = sum(counts)
+            cut = None
+            for i, message in enumerate(sent):
+                if isinstance(message, HumanMessage) and i > 0:
+                    cut = i
+                    if kept <= self.keep_tokens or start + i >= current_turn:
+                        break
+                kept -= counts[i]
+            if cut is not None:
+                summary = await self._summarize(summary, sent[:cut])
+                summary_tokens = self.count_tokens(summary)
+                sent, counts = sent[cut:], counts[cut:]
+                update = {
+                    "history_summary": summary,
+                    "history_summary_until": sent[0].id,
+                }
+
+        if summary:
+            sent.insert(0, SystemMessage(f"Summary of the earlier conversation:\n{summary}"))
+
+        self.calls += 1
+        self.history_tokens += history_tokens
+        self.tokens_sent += sum(counts) + summary_tokens
+        return {"llm_input_messages": sent, **update}
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "summaries": self.summaries,
+            "summary_seconds": round(self.summary_seconds, 3),
+            "tool_outputs_elided": self.tool_outputs_elided,
+            "history_tokens": self.history_tokens,
+            "tokens_sent": self.tokens_sent,
+            "tokens_saved": self.history_tokens - self.tokens_sent,
+        }
+
+
+history_manager = ConversationHistoryManager(
+    max_tokens=settings.HISTORY_MAX_TOKENS,
+    keep_tokens=settings.HISTORY_KEEP_TOKENS,
+    tool_output_max_tokens=settings.HISTORY_TOOL_OUTPUT_MAX_TOKENS,
+    summary_max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS,
+)
@@ -0,0 +1,37 @@
+"""
+Routes the LangGraph server serves next to its own API (langgraph.json "http").
+
+The graph runs in the LangGraph server, so the metrics of tool calls, retrieval
+and the agent's caches are recorded there and not in the API process. The
+server runs this app's lifespan next to its own, it keeps the agent's
+authorization caches in step with the tuple changes the API makes and closes
+the HTTP clients the tools opened.
+"""
+
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+
+from app.core.fga_outbox import fga_invalidation_listener
+from app.core.http import http_clients
+from app.core.metrics import METRICS_ENABLED, register_stats, render_metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    fga_invalidation_listener.start()
+    yield
+    await fga_invalidation_listener.stop()
+    await http_clients.aclose()
+
+
+app = FastAPI(openapi_url=None, lifespan=lifespan)
+
+if METRICS_ENABLED:
+    register_stats("fga_invalidation", fga_invalidation_listener.stats)
+
+    # /metrics is taken by the LangGraph server's own metrics
+    @app.get("/assistant0/metrics", include_in_schema=False)
+    def metrics():
+        content, media_type = render_metrics()
+        return Response(content=content, media_type=media_type)
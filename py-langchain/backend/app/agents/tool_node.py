@@ -0,0 +1,217 @@
+"""
+Runs the agent's tool calls with per tool result caching, concurrency limits and timing.
+
+The model often asks again for what it already looked up earlier in the
+thread, the user's profile or their upcoming events mostly. Results of
+successful calls are kept per thread, user, tool and arguments for the tool's
+TTL, and identical calls running at the same time share one execution. Tools with
+side effects opt out with a TTL of 0. Each tool also has a limit on how many
+of its calls run at once in the process, so a burst of runs does not hit an
+upstream API all at the same time.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Literal, Sequence
+
+from langchain_core.messages import ToolCall, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.errors import GraphBubbleUp
+from langgraph.prebuilt import ToolNode
+
+from app.core.metrics import TOOL_CACHE_HITS, TOOL_CALL_SECONDS
+
+
+@dataclass(frozen=True)
+class ToolPolicy:
+    # 0 never reuses a result
+    cache_ttl_seconds: float = 0
+    # None runs every call right away
+    max_concurrency: int | None = None
+
+
+@dataclass
+class _ToolStats:
+    calls: int = 0
+    cache_hits: int = 0
+    errors: int = 0
+    queued: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    durations: list[float] = field(default_factory=list)
+
+
+class CachingToolNode(ToolNode):
+    def __init__(
+        self,
+        tools: Sequence[BaseTool],
+        *,
+        default_policy: ToolPolicy,
+        policies: dict[str, ToolPolicy] | None = None,
+        cache_size: int = 1000,
+        **kwargs,
+    ):
+        super().__init__(tools, **kwargs)
+        self.policies = {
+            name: (policies or {}).get(name, default_policy) for name in self.tools_by_name
+        }
+        self.cache_size = cache_size
+        self._semaphores = {
+            name: asyncio.Semaphore(policy.max_concurrency)
+            for name, policy in self.policies.items()
+            if policy.max_concurrency
+        }
+        # (thread id, user email, tool, arguments) -> (expiry, result)
+        self._lru: OrderedDict[tuple, tuple[float, ToolMessage]] = OrderedDict()
+        self._in_flight: dict[tuple, asyncio.Future] = {}
+        self._stats = {name: _ToolStats() for name in self.tools_by_name}
+
+    def _cache_key(self, call: ToolCall, config: RunnableConfig) -> tuple | None:
+        policy = self.policies.get(call["name"])
+        thread_id = config.get("configurable", {}).get("thread_id")
+        if not policy or not policy.cache_ttl_seconds or not thread_id:
+            return None
+        arguments = json.dumps(call["args"], sort_keys=True, default=str)
+        # The user the tool ran for, results are forgotten per user
+        user = config["configurable"].get("_credentials", {}).get("user", {})
+        return (thread_id, user.get("email"), call["name"], arguments)
+
+    @staticmethod
+    def _answer(cached: ToolMessage, call: ToolCall) -> ToolMessage:
+        return cached.model_copy(update={"tool_call_id": call["id"], "id": None})
+
+    async def _timed_run(
+        self,
+        call: ToolCall,
+        input_type: Literal["list", "dict", "tool_calls"],
+        config: RunnableConfig,
+    ):
+        stats = self._stats[call["name"]]
+        semaphore = self._semaphores.get(call["name"])
+        if semaphore is not None:
+            if semaphore.locked():
+                stats.queued += 1
+            await semaphore.acquire()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            output = await super()._arun_one(call, input_type, config)
+            outcome = (
+                "error"
+                if isinstance(output, ToolMessage) and output.status == "error"
+                else "ok"
+            )
+        except GraphBubbleUp:
+            # Waiting for the user's authorization
+            outcome = "interrupted"
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+            elapsed = time.perf_counter() - started
+            TOOL_CALL_SECONDS.labels(call["name"], outcome).observe(elapsed)
+            stats.calls += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            stats.durations.append(elapsed)
+            del stats.durations[:-1000]
+        if isinstance(output, ToolMessage) and output.status == "error":
+            stats.errors += 1
+        return output
+
+    async def _arun_one(
+        self,
+        call: ToolCall,
+        input_type: Literal["list", "dict", "tool_calls"],
+        config: RunnableConfig,
+    ):
+        if call["name"] not in self.tools_by_name:
+            return await super()._arun_one(call, input_type, config)
+
+        key = self._cache_key(call, config)
+        if key is None:
+            return await self._timed_run(call, input_type, config)
+
+        stats = self._stats[call["name"]]
+        cached = self._lru.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._lru.move_to_end(key)
+            stats.cache_hits += 1
+            TOOL_CACHE_HITS.labels(call["name"]).inc()
+            return self._answer(cached[1], call)
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            shared = await asyncio.shield(in_flight)
+            # None when the execution was cancelled or returned a command
+            if shared is None:
+                return await self._timed_run(call, input_type, config)
+            stats.cache_hits += 1
+            TOOL_CACHE_HITS.labels(call["name"]).inc()
+            return self._answer(shared, call)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            output = await self._timed_run(call, input_type, config)
+        except asyncio.CancelledError:
+            # The cancellation is not the waiters', they run the tool themselves
+            future.set_result(None)
+            raise
+        except Exception as e:
+            # Interrupts for authorization included, whoever shares the call sees them too
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            if not isinstance(output, ToolMessage):
+                # Commands update the graph state, they are not reused. Callers
+                # sharing this execution run the tool themselves
+                future.set_result(None)
+                return output
+            future.set_result(output)
+            # Failures are not remembered, the next call tries again
+            if output.status != "error":
+                ttl = self.policies[call["name"]].cache_ttl_seconds
+                self._lru[key] = (time.monotonic() + ttl, output)
+                self._lru.move_to_end(key)
+                while len(self._lru) > self.cache_size:
+                    self._lru.popitem(last=False)
+            return output
+        finally:
+            del self._in_flight[key]
+
+    def forget(self, tool_name: str, user_email: str = "*"):
+        """Drop the cached results of a tool for a user, or for everyone with "*"."""
+        for key in [
+            key
+            for key in self._lru
+            if key[2] == tool_name and user_email in ("*", key[1])
+        ]:
+            del self._lru[key]
+
+    def stats(self) -> dict:
+        tools = {}
+        for name, stats in self._stats.items():
+            durations = sorted(stats.durations)
+            tools[name] = {
+                "calls": stats.calls,
+                "cache_hits": stats.cache_hits,
+                "errors": stats.errors,
+                "queued": stats.queued,
+                "avg_ms": round(stats.total_seconds / stats.calls * 1000, 2)
+                if stats.calls
+                else 0.0,
+                "p95_ms": round(durations[int(len(durations) * 0.95)] * 1000, 2)
+                if durations
+                else 0.0,
+                "max_ms": round(stats.max_seconds * 1000, 2),
+            }
+        return {"cache_size": len(self._lru), "tools": tools}
@@ -1,10 +1,13 @@
+import asyncio
+
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import StructuredTool
-from auth0_ai_langchain import FGARetriever
-from openfga_sdk.client.models import ClientBatchCheckItem
 from pydantic import BaseModel
 
-from app.core.rag import get_vector_store
+from app.core.config import settings
+from app.core.fga import authorization_manager
+from app.core.metrics import VECTOR_SEARCH_SECONDS
+from app.core.rag import get_vector_store, query_embedding_cache
 
 
 class GetContextDocsSchema(BaseModel):
@@ -14,32 +17,55 @@ class GetContextDocsSchema(BaseModel):
 async def get_context_docs_fn(question: str, config: RunnableConfig):
     """Use the tool when user asks for documents or projects or anything that is stored in the knowledge base."""
 
+    # The artifact lists the documents the chunks came from, for the answer cache
     if "configurable" not in config or "_credentials" not in config["configurable"]:
-        return "There is no user logged in."
+        return "There is no user logged in.", None
 
     credentials = config["configurable"]["_credentials"]
     user = credentials.get("user")
 
     if not user:
-        return "There is no user logged in."
+        return "There is no user logged in.", None
 
     user_email = user.get("email")
     vector_store = await get_vector_store()
 
     if not vector_store:
-        return "There is no vector store."
+        return "There is no vector store.", None
 
-    retriever = FGARetriever(
-        retriever=vector_store.as_retriever(),
-        build_query=lambda doc: ClientBatchCheckItem(
-            user=f"user:{user_email}",
-            object=f"doc:{doc.metadata.get('document_id')}",
-            relation="can_view",
-        ),
-    )
+    if settings.RETRIEVAL_MODE == "prefilter":
+        # Only chunks of viewable documents are searched, so all k results are usable.
+        # The FGA lookup and the question embedding are independent, run them together.
+        document_ids, embedding = await asyncio.gather(
+            authorization_manager.list_viewable_documents(user_email),
+            query_embedding_cache.aembed_query(question),
+        )
+        documents = []
+        if document_ids:
+            with VECTOR_SEARCH_SECONDS.labels("prefilter").time():
+                documents = await vector_store.asimilarity_search_by_vector(
+                    embedding,
+                    k=settings.RETRIEVAL_TOP_K,
+                    filter={"document_id": {"$in": document_ids}},
+                )
+    else:
+        # Global top-k, then drop the chunks of documents the user cannot view.
+        # Chunks of the same document share one cached FGA decision.
+        embedding = await query_embedding_cache.aembed_query(question)
+        with VECTOR_SEARCH_SECONDS.labels("postfilter").time():
+            documents = await vector_store.asimilarity_search_by_vector(
+                embedding, k=settings.RETRIEVAL_TOP_K
+            )
+        allowed = await authorization_manager.check_documents(
+            user_email, [doc.metadata.get("document_id") for doc in documents]
+        )
+        documents = [
+            doc for doc in documents if doc.metadata.get("document_id") in allowed
+        ]
 
-    documents = retriever.invoke(question)
-    return "\n\n".join([document.page_content for document in documents])
+    return "\n\n".join([document.page_content for document in documents]), [
+        doc.metadata.get("document_id") for doc in documents
+    ]
 
 
 get_context_docs = StructuredTool(
@@ -47,4 +73,5 @@ get_context_docs = StructuredTool(
     description="Use the tool when user asks for documents or projects or anything that is stored in the knowledge base.",
     args_schema=GetContextDocsSchema,
     coroutine=get_context_docs_fn,
+    response_format="content_and_artifact",
 )
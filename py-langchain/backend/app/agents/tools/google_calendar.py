@@ -1,14 +1,14 @@
+from langchain_core.runnables import ensure_config
 from langchain_core.tools import StructuredTool
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from pydantic import BaseModel
 from auth0_ai_langchain.token_vault import (
     get_access_token_from_token_vault,
 )
-import datetime
+import hashlib
 import json
 
 from app.core.auth0_ai import with_calendar_access
+from app.core.google_calendar import calendar_event_cache
 
 
 async def list_upcoming_events_fn():
@@ -19,25 +19,14 @@ async def list_upcoming_events_fn():
             "Authorization required to access the Token Vault API"
         )
 
-    calendar_service = build(
-        "calendar",
-        "v3",
-        credentials=Credentials(google_access_token),
-    )
+    # Events are cached per user, fall back to the token when there is none
+    credentials = ensure_config().get("configurable", {}).get("_credentials") or {}
+    user_key = (credentials.get("user") or {}).get("sub") or hashlib.sha256(
+        google_access_token.encode()
+    ).hexdigest()
 
-    events = (
-        calendar_service.events()
-        .list(
-            calendarId="primary",
-            timeMin=datetime.datetime.now().isoformat() + "Z",
-            timeMax=(datetime.datetime.now() + datetime.timedelta(days=7)).isoformat()
-            + "Z",
-            maxResults=5,
-            singleEvents=True,
-            orderBy="startTime",
-        )
-        .execute()
-        .get("items", [])
+    events = await calendar_event_cache.upcoming_events(
+        user_key, google_access_token, days=7, limit=5
     )
 
     return json.dumps(
@@ -5,6 +5,7 @@ from pydantic import BaseModel
 
 from app.core.auth0_ai import with_async_authorization
 from app.core.config import settings
+from app.core.http import http_clients
 
 
 class BuyOnlineSchema(BaseModel):
@@ -37,12 +38,11 @@ async def shop_online_fn(product: str, quantity: int):
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                api_url,
-                headers=headers,
-                json=data,
-            )
+        response = await http_clients.get("shop").post(
+            api_url,
+            headers=headers,
+            json=data,
+        )
 
         if response.status_code != 200:
             raise ValueError(f"Failed to buy product: {response.text}")
@@ -1,9 +1,8 @@
-import httpx
 from langchain_core.tools import StructuredTool
 from langchain_core.runnables.config import RunnableConfig
 from pydantic import BaseModel
 
-from app.core.config import settings
+from app.core.user_info import user_info_cache
 
 
 class UserInfoSchema(BaseModel):
@@ -24,19 +23,12 @@ async def get_user_info_fn(config: RunnableConfig):
         return "There is no user logged in."
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://{settings.AUTH0_DOMAIN}/userinfo",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                },
-            )
-
-            if response.status_code == 200:
-                user_info = response.json()
-                return f"User information: {user_info}"
-            else:
-                return "I couldn't verify your identity"
+        user_info = await user_info_cache.get(access_token, credentials.get("user"))
+
+        if user_info is not None:
+            return f"User information: {user_info}"
+        else:
+            return "I couldn't verify your identity"
 
     except Exception as e:
         return f"Error getting user info: {str(e)}"
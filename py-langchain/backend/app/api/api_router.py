@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from app.api.routes.chat import agent_router
 from app.api.routes.documents import documents_router
+from app.api.routes.stats import stats_router
 from app.core.auth import auth_router
 
 api_router = APIRouter()
@@ -10,3 +11,4 @@ api_router.include_router(agent_router)
 
 api_router.include_router(auth_router, tags=["auth"])
 api_router.include_router(documents_router)
+api_router.include_router(stats_router)
@@ -1,80 +1,199 @@
 import json
+import time
+from typing import Any, AsyncIterator
+
 import httpx
 from fastapi.responses import StreamingResponse, JSONResponse
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, Request
 
 from app.core.config import settings
 from app.core.auth import auth_client
+from app.core.http import http_clients
+from app.core.metrics import (
+    AGENT_PROXY_BYTES,
+    AGENT_PROXY_FIRST_BYTE_SECONDS,
+    METRICS_ENABLED,
+)
 
 agent_router = APIRouter(prefix="/agent", tags=["agent"])
 
+# Request headers passed on to the LangGraph server, besides x-*
+FORWARDED_REQUEST_HEADERS = {
+    "authorization",
+    "content-type",
+    "accept",
+    "accept-encoding",
+    "last-event-id",
+}
+
+# Headers that describe a single connection and must not be proxied
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+def splice_json_fields(
+    body: bytes, fields: dict[str, Any], defaults: dict[str, Any] | None = None
+) -> bytes:
+    """
+    Add top level fields to a JSON object body.
+
+    `fields` replace the client's values, `defaults` only fill in missing ones.
+    When the body mentions none of the keys they are spliced in front of it
+    without decoding the rest, otherwise the body is decoded and re-encoded.
+    A malformed body stays malformed and is rejected by the LangGraph server.
+    Raises ValueError when the body is valid JSON but not an object.
+    """
+    defaults = defaults or {}
+    stripped = body.lstrip()
+    keys = [f'"{key}"'.encode() for key in (*fields, *defaults)]
+
+    # Escaped keys could hide a duplicate, those bodies take the slow path
+    if stripped.startswith(b"{") and b"\\u" not in body and not any(
+        key in body for key in keys
+    ):
+        prefix = json.dumps({**fields, **defaults}).encode()[:-1]
+        rest = stripped[1:].lstrip()
+        return prefix + (rest if rest.startswith(b"}") else b", " + rest)
+
+    content = json.loads(body)
+    if not isinstance(content, dict):
+        raise ValueError("The body is not a JSON object")
+    content.update(fields)
+    for key, value in defaults.items():
+        content.setdefault(key, value)
+    return json.dumps(content).encode("utf-8")
+
+
+def _credentials_config(auth_session: dict) -> dict:
+    return {
+        "configurable": {
+            "_credentials": {
+                "access_token": auth_session.get("token_sets")[0].get("access_token"),
+                "refresh_token": auth_session.get("refresh_token"),
+                "user": auth_session.get("user"),
+            }
+        }
+    }
+
+
+def _proxy_headers(request: Request) -> dict[str, str]:
+    headers = {
+        k: v
+        for k, v in request.headers.items()
+        if k.lower().startswith("x-") or k.lower() in FORWARDED_REQUEST_HEADERS
+    }
+    headers["x-api-key"] = settings.LANGGRAPH_API_KEY
+    # Response bodies are passed through as is, only ask for encodings the client accepts
+    headers.setdefault("accept-encoding", "identity")
+    return headers
+
+
+def _response_headers(upstream: httpx.Response) -> dict[str, str]:
+    return {
+        k: v
+        for k, v in upstream.headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS
+        # CORS is answered by this app
+        and not k.lower().startswith("access-control-")
+    }
+
+
+class UpstreamResponse(StreamingResponse):
+    """
+    Streams a LangGraph response to the client as it arrives.
+
+    Chunks are read from upstream only when the previous one has been sent,
+    so a slow client slows the upstream read down instead of piling data up
+    in memory. The upstream response is closed however the stream ends; when
+    the client goes away first the upstream connection is dropped, which
+    makes the server cancel runs started with on_disconnect=cancel.
+    """
+
+    def __init__(self, upstream: httpx.Response, started: float):
+        self.upstream = upstream
+        self.started = started
+        super().__init__(
+            self._measured_body() if METRICS_ENABLED else upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers=_response_headers(upstream),
+        )
+
+    async def _measured_body(self) -> AsyncIterator[bytes]:
+        method = self.upstream.request.method
+        streamed = AGENT_PROXY_BYTES.labels(method)
+        first = True
+        async for chunk in self.upstream.aiter_raw():
+            if first:
+                AGENT_PROXY_FIRST_BYTE_SECONDS.labels(method).observe(
+                    time.perf_counter() - self.started
+                )
+                first = False
+            streamed.inc(len(chunk))
+            yield chunk
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.upstream.aclose()
+
 
 @agent_router.api_route(
-    "/{full_path:path}", methods=["GET", "POST", "DELETE", "PATCH", "PUT", "OPTIONS"]
+    "/{full_path:path}",
+    methods=["GET", "POST", "DELETE", "PATCH", "PUT", "HEAD", "OPTIONS"],
 )
 async def api_route(
     request: Request, full_path: str, auth_session=Depends(auth_client.require_session)
 ):
-    try:
-        # Build target URL
-        query_string = str(request.url.query)
-        target_url = f"{settings.LANGGRAPH_API_URL}/{full_path}"
-        if query_string:
-            target_url += f"?{query_string}"
-
-        # Prepare headers
-        headers = {
-            k: v
-            for k, v in request.headers.items()
-            if k.lower().startswith("x-") or k.lower() == "authorization"
-        }
-        headers["x-api-key"] = settings.LANGGRAPH_API_KEY
-
-        # Prepare body
-        body = await request.body()
-        if request.method in ("POST", "PUT", "PATCH") and body:
-            content = await request.json()
-            content["config"] = {
-                "configurable": {
-                    "_credentials": {
-                        "access_token": auth_session.get("token_sets")[0].get(
-                            "access_token"
-                        ),
-                        "refresh_token": auth_session.get("refresh_token"),
-                        "user": auth_session.get("user"),
-                    }
-                }
-            }
-            body = json.dumps(content).encode("utf-8")
-
-            # Stream the response back
-            async def stream_response():
-                # Make proxied request
-                async with httpx.AsyncClient(timeout=None) as client:
-                    async with client.stream(
-                        method=request.method,
-                        url=target_url,
-                        headers=headers,
-                        content=(
-                            body if request.method in ("POST", "PUT", "PATCH") else None
-                        ),
-                    ) as proxied_response:
-                        if proxied_response.status_code != 200:
-                            response_text = await proxied_response.aread()
-                            raise HTTPException(
-                                status_code=proxied_response.status_code,
-                                detail=response_text.decode(),
-                            )
-
-                        async for chunk in proxied_response.aiter_bytes():
-                            yield chunk
-
-            # Stream the response back
-            return StreamingResponse(
-                stream_response(),
-                status_code=200,
-                media_type="stream/text",
+    started = time.perf_counter()
+    # Build target URL
+    query_string = str(request.url.query)
+    target_url = f"{settings.LANGGRAPH_API_URL}/{full_path}"
+    if query_string:
+        target_url += f"?{query_string}"
+
+    headers = _proxy_headers(request)
+
+    content: bytes | None = None
+    if request.method in ("POST", "PUT", "PATCH"):
+        # Every body is buffered: the LangGraph server parses JSON whatever its
+        # content type, so none may reach it without the session's credentials
+        content = await request.body()
+
+    if content:
+        headers["content-type"] = "application/json"
+        try:
+            # Runs get the user's credentials, values sent by the client are replaced
+            content = splice_json_fields(
+                content,
+                fields={"config": _credentials_config(auth_session)},
+                # Stop spending tokens on runs nobody is listening to anymore
+                defaults=(
+                    {"on_disconnect": "cancel"}
+                    if full_path.endswith("runs/stream")
+                    else None
+                ),
             )
+        except ValueError:
+            return JSONResponse(status_code=400, content={"error": "Invalid JSON body"})
+
+    client = http_clients.get("langgraph")
+    try:
+        upstream = await client.send(
+            client.build_request(
+                request.method, target_url, headers=headers, content=content
+            ),
+            stream=True,
+        )
+    except httpx.HTTPError as e:
+        return JSONResponse(status_code=502, content={"error": str(e)})
 
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
+    return UpstreamResponse(upstream, started)
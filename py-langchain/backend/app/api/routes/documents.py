@@ -1,18 +1,32 @@
 from datetime import datetime
 import base64
 import uuid
-import PyPDF2
-from io import BytesIO
-from fastapi import APIRouter, Depends, File, UploadFile
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, Query, Request
 from fastapi.exceptions import HTTPException
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from sqlmodel import Session, select, update, col, delete
+from python_multipart.exceptions import MultipartParseError
+from sqlalchemy import tuple_, union
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select, col, delete, func
 
+from app.core.answer_cache import invalidate_answers
 from app.core.auth import auth_client
 from app.core.db import engine
-from app.core.fga import authorization_manager
-from app.models.documents import Document, DocumentWithoutContent
-from app.core.rag import generate_embeddings
+from app.core.downloads import (
+    RangeNotSatisfiableError,
+    etag_matches,
+    iter_blob,
+    iter_legacy_content,
+    parse_range,
+)
+from app.core.fga import Relation
+from app.core.fga_outbox import enqueue_relations, fga_outbox_dispatcher
+from app.models.documents import Document, DocumentShare, DocumentWithoutContent
+from app.core.ingestion import IngestionStage, ingestion_pipeline
+from app.core.storage import blob_store
+from app.core.uploads import UploadError, UploadTooLargeError, receive_upload
 
 documents_router = APIRouter(prefix="/documents", tags=["documents"])
 
@@ -21,11 +35,71 @@ MAX_FILE_SIZE_MB = 10
 MAX_FILE_SIZE = MAX_FILE_SIZE_MB * 1024 * 1024
 
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Class of the Postgres advisory locks taken on a blob, the key is its hash
+BLOB_LOCK_CLASS = 7_146_602
+
+
+def _lock_blob(db_session: Session, key: str):
+    """Serialize the uploads and deletes of a blob until the transaction ends."""
+    db_session.exec(
+        select(func.pg_advisory_xact_lock(BLOB_LOCK_CLASS, func.hashtext(key)))
+    )
+
+
+def _encode_cursor(created_at: datetime, document_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(
+        f"{created_at.isoformat()}|{document_id}".encode("utf-8")
+    ).decode("utf-8")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        created_at, document_id = (
+            base64.urlsafe_b64decode(cursor.encode("utf-8")).decode("utf-8").split("|")
+        )
+        return datetime.fromisoformat(created_at), uuid.UUID(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @documents_router.get("/")
 def get_documents(
+    response: Response,
+    cursor: str | None = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
     auth_session=Depends(auth_client.require_session),
 ) -> list[DocumentWithoutContent]:
+    """
+    List the documents owned by or shared with the user, most recently uploaded first.
+
+    Pages are keyed on (created_at, id), which never change, so documents
+    that finish processing or get shared while the user pages through them
+    keep their place. When there are more documents the cursor of the next
+    page is returned in the X-Next-Cursor header.
+    """
     user = auth_session.get("user")
+    order = (col(Document.created_at).desc(), col(Document.id).desc())
+
+    # The owned branch walks the user's index and stops after one page. The
+    # shared branch sorts all the documents shared with the user, no index
+    # orders them, which is fine as long as a user gets few shares
+    owned = select(Document.id).where(Document.user_id == user.get("sub"))
+    shared = (
+        select(Document.id)
+        .join(DocumentShare, col(DocumentShare.document_id) == col(Document.id))
+        .where(DocumentShare.user_email == user.get("email"))
+    )
+    if cursor:
+        after = tuple_(*_decode_cursor(cursor))
+        owned = owned.where(tuple_(Document.created_at, Document.id) < after)
+        shared = shared.where(tuple_(Document.created_at, Document.id) < after)
+    page = union(
+        owned.order_by(*order).limit(limit + 1),
+        shared.order_by(*order).limit(limit + 1),
+    ).subquery()
 
     with Session(engine) as db_session:
         documents = db_session.exec(
@@ -37,10 +111,27 @@ def get_documents(
                 Document.updated_at,
                 Document.user_id,
                 Document.user_email,
-                Document.shared_with,
-            ).where(Document.user_id == user.get("sub"))
+                Document.status,
+                Document.error,
+            )
+            .join(page, page.c.id == col(Document.id))
+            .order_by(*order)
+            .limit(limit + 1)
         ).all()
 
+        if len(documents) > limit:
+            documents = documents[:limit]
+            last = documents[-1]
+            response.headers["X-Next-Cursor"] = _encode_cursor(last.created_at, last.id)
+
+        shared_with: dict[uuid.UUID, list[str]] = {doc.id: [] for doc in documents}
+        for share in db_session.exec(
+            select(DocumentShare.document_id, DocumentShare.user_email).where(
+                col(DocumentShare.document_id).in_(shared_with.keys())
+            )
+        ).all():
+            shared_with[share.document_id].append(share.user_email)
+
         return [
             DocumentWithoutContent(
                 id=doc.id,
@@ -50,7 +141,10 @@ def get_documents(
                 updated_at=doc.updated_at,
                 user_id=doc.user_id,
                 user_email=doc.user_email,
-                shared_with=doc.shared_with,
+                shared_with=shared_with[doc.id],
+                status=doc.status,
+                error=doc.error,
+                is_owner=doc.user_id == user.get("sub"),
             )
             for doc in documents
         ]
@@ -58,69 +152,120 @@ def get_documents(
 
 @documents_router.post("/upload")
 async def upload_document(
-    file: UploadFile = File(), auth_session=Depends(auth_client.require_session)
+    request: Request, auth_session=Depends(auth_client.require_session)
 ) -> DocumentWithoutContent:
     user = auth_session.get("user")
 
-    binary_content = await file.read()
-
-    file_name = file.filename
-    file_type = file.content_type
-
-    if not file_name:
-        raise HTTPException(status_code=400, detail="File name is required")
-
-    if file_type not in ALLOWED_FILE_TYPES:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed file types are: {','.join(ALLOWED_FILE_TYPES)}",
+    # The file is streamed to the blob store instead of being buffered in memory
+    try:
+        upload = await receive_upload(
+            request, blob_store, MAX_FILE_SIZE, ALLOWED_FILE_TYPES
         )
-
-    if len(binary_content) > MAX_FILE_SIZE:
+    except UploadTooLargeError:
         raise HTTPException(
             status_code=400,
             detail=f"File size exceeds the maximum allowed size of {MAX_FILE_SIZE_MB} MB",
         )
+    except (UploadError, MultipartParseError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Get the document's content
-    file_text = ""
-    if file_type == "application/pdf":
-        pdf_stream = BytesIO(binary_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_stream)
-        for page in pdf_reader.pages:
-            file_text += page.extract_text()
-    else:
-        file_text = binary_content.decode("utf-8")
+    if not upload.file_name:
+        upload.abort()
+        raise HTTPException(status_code=400, detail="File name is required")
 
     with Session(engine) as db_session:
-        # Create the document
+        # Identical uploads share a blob. It is stored under the lock, which is
+        # held until the document is committed, so a concurrent delete of the
+        # same content can't remove it before this document references it
+        _lock_blob(db_session, upload.sha256)
+        blob = await upload.commit()
+
+        # Create the document, its content is processed in the background
         document = Document(
-            content=binary_content,
-            file_name=file_name,
-            file_type=file_type,
+            content_ref=blob.key,
+            content_hash=blob.sha256,
+            content_size=blob.size,
+            file_name=upload.file_name,
+            file_type=upload.content_type,
             created_at=datetime.now(),
             updated_at=datetime.now(),
             user_id=user.get("sub"),
             user_email=user.get("email"),
-            shared_with=[],
+            status="processing",
         )
 
         db_session.add(document)
+        # The owner tuple is sent to FGA once the document is committed
+        enqueue_relations(
+            db_session, writes=[Relation(document.user_email, str(document.id), "owner")]
+        )
+        invalidate_answers(db_session, user_emails=[document.user_email])
+        db_session.commit()
+        db_session.refresh(document)
+        fga_outbox_dispatcher.notify()
 
-        embeddings = generate_embeddings(
-            document_id=document.id, file_name=file_name, text=file_text
+        ingestion_pipeline.submit(
+            document_id=document.id,
+            file_name=upload.file_name,
+            file_type=upload.content_type,
+            user_email=user.get("email"),
+            content_ref=blob.key,
         )
 
-        if len(embeddings) > 0:
-            db_session.add_all(embeddings)
+        return DocumentWithoutContent.model_validate(document, update={"is_owner": True})
 
-        doc_id = str(document.id)
-        db_session.commit()
 
-        # Write the relationship tuple to FGA
-        await authorization_manager.add_relation(user.get("email"), doc_id)
+class DocumentStatusResponse(BaseModel):
+    id: uuid.UUID
+    status: str
+    # None while the document is processed on another worker
+    stage: str | None
+    pages_extracted: int | None = None
+    chunks_total: int | None = None
+    chunks_embedded: int | None = None
+    error: str | None = None
+
+
+@documents_router.get(
+    "/{document_id}/status",
+    dependencies=[Depends(auth_client.require_session)],
+)
+def get_document_status(document_id: uuid.UUID) -> DocumentStatusResponse:
+    job = ingestion_pipeline.get_job(document_id)
+
+    if job:
+        return DocumentStatusResponse(
+            id=job.document_id,
+            status=job.status,
+            stage=job.stage.value,
+            pages_extracted=job.pages_extracted,
+            chunks_total=job.chunks_total,
+            chunks_embedded=job.chunks_embedded,
+            error=job.error,
+        )
+
+    # The job finished a while ago or ran on another worker
+    with Session(engine) as db_session:
+        document = db_session.exec(
+            select(Document.id, Document.status, Document.error).where(
+                col(Document.id) == document_id
+            )
+        ).first()
+
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
 
-        return document
+        # Only the worker running the job knows its stage
+        return DocumentStatusResponse(
+            id=document.id,
+            status=document.status,
+            stage=(
+                IngestionStage(document.status).value
+                if document.status != "processing"
+                else None
+            ),
+            error=document.error,
+        )
 
 
 @documents_router.get(
@@ -134,42 +279,131 @@ def get_document_content(document_id: str):
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
 
-        encoded_content = base64.b64encode(document.content).decode("utf-8")
+        if document.content_ref:
+            with blob_store.open(document.content_ref) as blob:
+                content = blob.read()
+        else:
+            content = document.content
+
+        encoded_content = base64.b64encode(content).decode("utf-8")
 
         return encoded_content
 
 
+@documents_router.get(
+    "/{document_id}/download",
+    dependencies=[Depends(auth_client.require_session)],
+)
+def download_document(document_id: uuid.UUID, request: Request) -> Response:
+    with Session(engine) as db_session:
+        document = db_session.exec(
+            select(
+                Document.file_name,
+                Document.file_type,
+                Document.content_ref,
+                # Legacy rows are measured and hashed in the database
+                func.coalesce(Document.content_size, func.length(Document.content)),
+                func.coalesce(Document.content_hash, func.md5(Document.content)),
+            ).where(col(Document.id) == document_id)
+        ).first()
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    file_name, file_type, content_ref, size, content_hash = document
+    size = size or 0
+    etag = f'"{content_hash}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or etag_matches(if_range, etag):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiableError:
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+    start, end = byte_range or (0, size - 1)
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1 if size else 0)
+    headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(file_name)}"
+
+    if content_ref:
+        body = iter_blob(blob_store.open(content_ref), start, end)
+    else:
+        body = iter_legacy_content(document_id, start, end)
+
+    return StreamingResponse(
+        body, status_code=status_code, media_type=file_type, headers=headers
+    )
+
+
 class ShareDocumentRequest(BaseModel):
     email_addresses: list[str]
 
 
+class ShareDocumentResponse(BaseModel):
+    shared_with: list[str]
+
+
 @documents_router.post("/{document_id}/share")
 async def share_document(
     document_id: str,
     input: ShareDocumentRequest,
     auth_session=Depends(auth_client.require_session),
-):
+) -> ShareDocumentResponse:
     with Session(engine) as db_session:
-        shared_with = db_session.exec(
-            select(Document.shared_with).where(col(Document.id) == document_id)
+        document = db_session.exec(
+            select(Document.id, Document.user_id).where(col(Document.id) == document_id)
         ).first()
 
-        if shared_with is None:
+        if document is None:
             raise HTTPException(status_code=404, detail="Document not found")
+        if document.user_id != auth_session.get("user").get("sub"):
+            raise HTTPException(
+                status_code=403, detail="Only the owner can share the document"
+            )
 
-        merged_shared_with = list(
-            set([email for email in shared_with] + input.email_addresses)
-        )
-
-        db_session.exec(
-            update(Document)
-            .where(col(Document.id) == document_id)
-            .values(shared_with=merged_shared_with)
-        )
-        db_session.commit()
+        email_addresses = list(dict.fromkeys(input.email_addresses))
+        if email_addresses:
+            db_session.exec(
+                insert(DocumentShare)
+                .values(
+                    [
+                        {
+                            "document_id": document.id,
+                            "user_email": email,
+                            "created_at": datetime.now(),
+                        }
+                        for email in email_addresses
+                    ]
+                )
+                .on_conflict_do_nothing()
+            )
+            enqueue_relations(
+                db_session,
+                writes=[
+                    Relation(email, str(document.id), "viewer") for email in email_addresses
+                ],
+            )
+            invalidate_answers(db_session, user_emails=email_addresses)
+            db_session.commit()
+            fga_outbox_dispatcher.notify()
 
-        for email in input.email_addresses:
-            await authorization_manager.add_relation(email, str(document_id), "viewer")
+        return ShareDocumentResponse(shared_with=email_addresses)
 
 
 @documents_router.delete("/{document_id}")
@@ -177,25 +411,55 @@ async def delete_document(
     document_id: str, auth_session=Depends(auth_client.require_session)
 ):
     with Session(engine) as db_session:
-        shared_with = db_session.exec(
-            select(Document.shared_with).where(col(Document.id) == document_id)
+        document = db_session.exec(
+            select(
+                Document.id, Document.user_id, Document.user_email, Document.content_ref
+            ).where(col(Document.id) == document_id)
         ).first()
 
-        if shared_with is None:
+        if document is None:
             raise HTTPException(status_code=404, detail="Document not found")
+        if document.user_id != auth_session.get("user").get("sub"):
+            raise HTTPException(
+                status_code=403, detail="Only the owner can delete the document"
+            )
 
-        # Remove the relationship tuple from FGA
-        user = auth_session.get("user")
-        await authorization_manager.delete_relation(user.get("email"), str(document_id))
-
-        # Delete the shared_with relationships from FGA
-        for shared_with_email in shared_with:
-            await authorization_manager.delete_relation(
-                shared_with_email, str(document_id), "viewer"
+        shared_with = db_session.exec(
+            select(DocumentShare.user_email).where(
+                col(DocumentShare.document_id) == document_id
             )
+        ).all()
 
-        # Delete the document from the database
+        # The document and its tuples go away together, shares are deleted with it
+        enqueue_relations(
+            db_session,
+            deletes=[
+                Relation(document.user_email, str(document.id), "owner"),
+                *(
+                    Relation(email, str(document.id), "viewer")
+                    for email in shared_with
+                ),
+            ],
+        )
+        invalidate_answers(
+            db_session,
+            user_emails=[document.user_email, *shared_with],
+            document_ids=[str(document.id)],
+        )
         db_session.exec(delete(Document).where(col(Document.id) == document_id))
         db_session.commit()
+        fga_outbox_dispatcher.notify()
+
+        # Identical uploads share a blob, only remove it once it is unused. It goes
+        # after the commit, so a failed delete never leaves a document without its
+        # content, and in a transaction of its own: the lock keeps an upload of the
+        # same content from reusing it meanwhile
+        if document.content_ref:
+            _lock_blob(db_session, document.content_ref)
+            if not db_session.exec(
+                select(Document.id).where(Document.content_ref == document.content_ref)
+            ).first():
+                blob_store.delete(document.content_ref)
+            db_session.commit()
 
         return {"message": "Document deleted successfully"}
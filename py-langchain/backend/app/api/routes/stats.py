@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+
+from app.core.async_authorization import async_authorization_resumer
+from app.core.auth import auth_client
+from app.core.embedding_cache import embedding_cache
+from app.core.fga import authorization_manager
+from app.core.fga_outbox import fga_outbox_dispatcher
+from app.core.rag import embedding_batcher
+
+stats_router = APIRouter(
+    prefix="/stats",
+    tags=["stats"],
+    dependencies=[Depends(auth_client.require_session)],
+)
+
+
+@stats_router.get("/")
+def get_stats():
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "authorization": authorization_manager.stats(),
+        "fga_outbox": fga_outbox_dispatcher.stats(),
+        "async_authorization": async_authorization_resumer.stats(),
+    }
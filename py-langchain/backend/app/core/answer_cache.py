@@ -0,0 +1,173 @@
+"""
+Per user cache of the agent's answers to knowledge base questions.
+
+When a thread opens with a question the agent answers from the user's
+documents, the question's embedding, the answer and the documents it drew on
+are stored. A later thread opening with a question this close to it
+(ANSWER_CACHE_MIN_SIMILARITY, cosine) gets the stored answer without a model
+call or a retrieval. Follow-up questions are neither stored nor answered from
+the cache, their meaning depends on the conversation before them.
+
+The document routes invalidate the answers of every user whose viewable
+documents change, in the same transaction as the change. FGA and its list
+cache only catch up a little later, so answers given in the meantime are
+not reused either.
+"""
+
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, delete, or_, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.rag import query_embedding_cache
+from app.models.answer_cache import AnswerCacheInvalidation, CachedAnswer
+
+# Time for a tuple change to leave the FGA outbox, on top of the list cache TTL
+FGA_PROPAGATION_SECONDS = 10
+# Questions asked but not answered yet, to date their answers
+MAX_PENDING_QUESTIONS = 1000
+
+
+def invalidate_answers(
+    db_session: Session,
+    user_emails: list[str] | None = None,
+    document_ids: list[str] | None = None,
+) -> None:
+    """Drop the cached answers of users and documents, once the session commits."""
+    if user_emails:
+        valid_after = datetime.now() + timedelta(
+            seconds=settings.FGA_LIST_OBJECTS_CACHE_TTL_SECONDS + FGA_PROPAGATION_SECONDS
+        )
+        statement = insert(AnswerCacheInvalidation).values(
+            [
+                {"user_email": email, "valid_after": valid_after}
+                for email in dict.fromkeys(user_emails)
+            ]
+        )
+        db_session.exec(
+            statement.on_conflict_do_update(
+                index_elements=["user_email"],
+                set_={"valid_after": statement.excluded.valid_after},
+            )
+        )
+        db_session.exec(
+            delete(CachedAnswer).where(col(CachedAnswer.user_email).in_(user_emails))
+        )
+    if document_ids:
+        db_session.exec(
+            delete(CachedAnswer).where(
+                col(CachedAnswer.document_ids).overlap([str(id) for id in document_ids])
+            )
+        )
+
+
+class AnswerCache:
+    def __init__(self, min_similarity: float, ttl_seconds: int):
+        self.min_similarity = min_similarity
+        self.ttl_seconds = ttl_seconds
+        # (user email, question) -> when it was asked
+        self._asked_at: OrderedDict[tuple[str, str], datetime] = OrderedDict()
+        self._store_tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.errors = 0
+
+    def _find(self, user_email: str, embedding: list[float]) -> str | None:
+        distance = col(CachedAnswer.embedding).cosine_distance(embedding)
+        with Session(engine) as db_session:
+            row = db_session.exec(
+                select(CachedAnswer.answer, distance.label("distance"))
+                .outerjoin(
+                    AnswerCacheInvalidation,
+                    col(AnswerCacheInvalidation.user_email) == col(CachedAnswer.user_email),
+                )
+                .where(
+                    CachedAnswer.user_email == user_email,
+                    col(CachedAnswer.created_at)
+                    > datetime.now() - timedelta(seconds=self.ttl_seconds),
+                    or_(
+                        col(AnswerCacheInvalidation.valid_after).is_(None),
+                        col(CachedAnswer.created_at) > col(AnswerCacheInvalidation.valid_after),
+                    ),
+                )
+                .order_by(distance)
+                .limit(1)
+            ).first()
+        if row is None or 1 - row.distance < self.min_similarity:
+            return None
+        return row.answer
+
+    async def lookup(self, user_email: str, question: str) -> str | None:
+        """A cached answer to the user's question, if there is one."""
+        self._asked_at[(user_email, question)] = datetime.now()
+        while len(self._asked_at) > MAX_PENDING_QUESTIONS:
+            self._asked_at.popitem(last=False)
+
+        try:
+            embedding = await query_embedding_cache.aembed_query(question)
+            answer = await asyncio.to_thread(self._find, user_email, embedding)
+        except Exception as e:
+            # The agent answers without the cache
+            self.errors += 1
+            print(f"Answer cache lookup failed: {e}")
+            return None
+
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def _insert(self, answer: CachedAnswer):
+        with Session(engine) as db_session:
+            db_session.add(answer)
+            db_session.commit()
+
+    async def _store(
+        self, user_email: str, question: str, answer: str, document_ids: list[str]
+    ):
+        # Dated when the question was asked, a change during the turn invalidates it
+        asked_at = self._asked_at.pop((user_email, question), None) or datetime.now()
+        try:
+            await asyncio.to_thread(
+                self._insert,
+                CachedAnswer(
+                    user_email=user_email,
+                    question=question,
+                    embedding=await query_embedding_cache.aembed_query(question),
+                    answer=answer,
+                    document_ids=sorted(set(document_ids)),
+                    created_at=asked_at,
+                ),
+            )
+            self.stored += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Could not cache answer: {e}")
+
+    def store(self, user_email: str, question: str, answer: str, document_ids: list[str]):
+        """Store an answer in the background, the response does not wait for it."""
+        task = asyncio.create_task(self._store(user_email, question, answer, document_ids))
+        self._store_tasks.add(task)
+        task.add_done_callback(self._store_tasks.discard)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stored": self.stored,
+            "errors": self.errors,
+        }
+
+
+answer_cache = AnswerCache(
+    min_similarity=settings.ANSWER_CACHE_MIN_SIMILARITY,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,223 @@
+"""
+Resumes threads suspended on a purchase approval.
+
+With ASYNC_AUTHORIZATION_MODE=interrupt the shop_online tool does not wait for
+the user to approve the CIBA request, it interrupts the graph and the run ends
+with the thread checkpointed. The resumer in the API process keeps track of
+every interrupted thread that waits on a pending request and runs it again
+from its checkpoint, which makes the tool check the request once: it either
+gets the token and completes the purchase or interrupts again.
+
+The resumer is the GraphResumer of auth0_ai_langchain, which finds the
+interrupted threads and resumes them, with its fixed schedule replaced. Auth0
+hands out the token of an approved request only once, so the check has to
+happen inside the tool and every pending approval costs one run per check.
+The checks start at the interval Auth0 asked for and back off exponentially up
+to ASYNC_AUTHORIZATION_MAX_POLL_INTERVAL_SECONDS, the last one happens when the
+request expires so that the thread ends with the expiry instead of staying
+interrupted.
+"""
+
+import asyncio
+import time
+from contextlib import suppress
+
+import httpx
+from auth0_ai.authorizers.async_authorization import AsyncAuthorizationRequest
+from auth0_ai.interrupts.async_authorization_interrupts import (
+    AuthorizationPendingInterrupt,
+    AuthorizationPollingInterrupt,
+)
+from auth0_ai_langchain.async_authorization import GraphResumer
+from auth0_ai_langchain.async_authorization.graph_resumer import WatchedThread
+from auth0_ai_langchain.utils.interrupt import get_auth0_interrupts
+from langgraph_sdk import get_client
+from langgraph_sdk.client import LangGraphClient
+from langgraph_sdk.schema import Thread
+
+from app.core.config import settings
+
+GRAPH_ID = "agent"
+# Added to the interval when Auth0 answers slow_down without a Retry-After
+SLOW_DOWN_SECONDS = 5
+
+
+class PendingApproval(WatchedThread, total=False):
+    expires_at: float
+    interval: float
+    next_check_at: float
+    checks: int
+    # Check after which the interval was last raised for a slow_down
+    slowed_down_at: int
+
+
+def pending_request(thread: Thread) -> dict | None:
+    """The pending async authorization interrupt of a thread, if it has one."""
+    for interrupt in get_auth0_interrupts(thread):
+        value = interrupt["value"]
+        if (
+            AuthorizationPendingInterrupt.is_interrupt(value)
+            or AuthorizationPollingInterrupt.is_interrupt(value)
+        ) and isinstance(value.get("_request"), dict):
+            return value
+    return None
+
+
+class AsyncAuthorizationResumer(GraphResumer):
+    map: dict[str, PendingApproval]
+
+    def __init__(self, lang_graph: LangGraphClient | None = None):
+        # Without a client, start() connects to LANGGRAPH_API_URL
+        super().__init__(lang_graph, {"graph_id": GRAPH_ID})
+        self._checking: dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(
+            settings.ASYNC_AUTHORIZATION_MAX_CONCURRENT_RESUMES
+        )
+        self.scans = 0
+        self.checks = 0
+        self.resolved = 0
+        self.slow_downs = 0
+        self.last_error: str | None = None
+        self.on_error(self._record_error)
+
+    def _record_error(self, error: Exception):
+        self.last_error = str(error)
+
+    def start(self):
+        if self._loop_task is None:
+            if self.lang_graph is None:
+                self.lang_graph = get_client(
+                    url=settings.LANGGRAPH_API_URL,
+                    api_key=settings.LANGGRAPH_API_KEY or None,
+                )
+            self._stop_event.clear()
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._loop_task is None:
+            return
+        self._stop_event.set()
+        self._loop_task.cancel()
+        for task in self._checking.values():
+            task.cancel()
+        with suppress(asyncio.CancelledError):
+            await asyncio.gather(self._loop_task, *self._checking.values())
+        self._loop_task = None
+        self._checking.clear()
+        await self.lang_graph.http.client.aclose()
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                await self.loop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._emit_error(e)
+            await asyncio.sleep(settings.ASYNC_AUTHORIZATION_SCAN_INTERVAL_SECONDS)
+
+    def track(self, thread: Thread, now: float) -> str | None:
+        """Add or update the pending approval of an interrupted thread, returns its key."""
+        value = pending_request(thread)
+        if value is None:
+            return None
+
+        request: AsyncAuthorizationRequest = value["_request"]
+        key = self._get_hash_map_id(thread)
+        approval = self.map.get(key)
+        if approval is None:
+            approval = self.map[key] = PendingApproval(
+                thread_id=thread["thread_id"],
+                assistant_id=thread["metadata"].get("assistant_id", GRAPH_ID),
+                interruption_id=next(iter(thread["interrupts"])),
+                auth_request=request,
+                config={},
+                expires_at=request["requested_at"] + request["expires_in"],
+                interval=request["interval"],
+                next_check_at=request["requested_at"] + request["interval"],
+                checks=0,
+                slowed_down_at=0,
+            )
+        elif (
+            AuthorizationPollingInterrupt.is_interrupt(value)
+            and key not in self._checking
+            and approval["slowed_down_at"] < approval["checks"]
+        ):
+            # Auth0 answered slow_down to the last check
+            self.slow_downs += 1
+            approval["slowed_down_at"] = approval["checks"]
+            approval["interval"] = max(
+                value.get("retry_after") or 0,
+                approval["interval"] + SLOW_DOWN_SECONDS,
+            )
+            approval["next_check_at"] = max(
+                approval["next_check_at"], now + approval["interval"]
+            )
+        return key
+
+    def _schedule_next(self, approval: PendingApproval, now: float):
+        delay = min(
+            approval["interval"] * 2 ** approval["checks"],
+            max(
+                approval["interval"],
+                settings.ASYNC_AUTHORIZATION_MAX_POLL_INTERVAL_SECONDS,
+            ),
+        )
+        approval["next_check_at"] = min(now + delay, approval["expires_at"])
+
+    async def loop(self):
+        """Reconcile the pending approvals with the interrupted threads and check the due ones."""
+        now = time.time()
+        active = {
+            key
+            for thread in await self._get_all_interrupted_threads()
+            if (key := self.track(thread, now)) is not None
+        }
+        self.scans += 1
+
+        # The thread went on, was deleted or got a new request
+        for key in list(self.map):
+            if key not in active and key not in self._checking:
+                del self.map[key]
+                self.resolved += 1
+
+        for key, approval in self.map.items():
+            if key not in self._checking and approval["next_check_at"] <= now:
+                self._checking[key] = asyncio.create_task(
+                    self._resume_thread(key, approval)
+                )
+
+    async def _resume_thread(self, key: str, approval: PendingApproval):
+        try:
+            async with self._semaphore:
+                self.checks += 1
+                self._emit_resume(approval)
+                await self.lang_graph.runs.wait(
+                    approval["thread_id"], approval["assistant_id"], raise_error=False
+                )
+                approval["last_run"] = time.time()
+        except httpx.HTTPStatusError as e:
+            # 409: the thread already has a run, e.g. the user sent a message
+            if e.response.status_code != 409:
+                self._emit_error(e)
+        except Exception as e:
+            self._emit_error(e)
+        finally:
+            approval["checks"] += 1
+            self._schedule_next(approval, time.time())
+            del self._checking[key]
+
+    def stats(self) -> dict:
+        return {
+            "mode": settings.ASYNC_AUTHORIZATION_MODE,
+            "pending": len(self.map),
+            "checking": len(self._checking),
+            "scans": self.scans,
+            "checks": self.checks,
+            "resolved": self.resolved,
+            "slow_downs": self.slow_downs,
+            "last_error": self.last_error,
+        }
+
+
+async_authorization_resumer = AsyncAuthorizationResumer()
@@ -1,3 +1,5 @@
+from urllib.parse import urlsplit
+
 from auth0_ai.authorizers.types import Auth0ClientParams
 from auth0_ai_langchain.auth0_ai import Auth0AI
 from langchain_core.runnables import ensure_config
@@ -19,7 +21,22 @@ with_calendar_access = auth0_ai.with_token_vault(
     scopes=["https://www.googleapis.com/auth/calendar.events"],
 )
 
-with_async_authorization = auth0_ai.with_async_authorization(
+if settings.ASYNC_AUTHORIZATION_AUTH0_URL:
+    ciba_url = urlsplit(settings.ASYNC_AUTHORIZATION_AUTH0_URL)
+    ciba_auth0_ai = Auth0AI(
+        Auth0ClientParams(
+            {
+                "domain": ciba_url.netloc,
+                "protocol": ciba_url.scheme,
+                "client_id": settings.AUTH0_CLIENT_ID,
+                "client_secret": settings.AUTH0_CLIENT_SECRET,
+            }
+        )
+    )
+else:
+    ciba_auth0_ai = auth0_ai
+
+with_async_authorization = ciba_auth0_ai.with_async_authorization(
     audience=settings.SHOP_API_AUDIENCE,
     # add any scopes you want to use with your API
     scopes=["openid", "product:buy"],
@@ -38,7 +55,10 @@ with_async_authorization = auth0_ai.with_async_authorization(
     #
     # In practice, the process that is awaiting the user confirmation
     # could crash or timeout before the user approves the request.
-    on_authorization_request="block",
+    #
+    # With `interrupt` the thread is suspended while the request is pending,
+    # see app/core/async_authorization.py for how it gets resumed.
+    on_authorization_request=settings.ASYNC_AUTHORIZATION_MODE,
     # Controls how long the authorization request is valid.
     # requested_expiry=301,
 )
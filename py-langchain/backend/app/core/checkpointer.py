@@ -0,0 +1,662 @@
+"""
+Postgres persistence for the checkpoints of the agent graph.
+
+The LangGraph server of this project runs on its in-memory runtime, which keeps
+the checkpoints of every thread in the server process. With
+CHECKPOINTER_BACKEND=postgres the graph module swaps the runtime's checkpointer
+for PostgresCheckpointer, which still serves the threads in use from memory
+but also:
+
+- writes every checkpoint, channel value and pending write to Postgres from a
+  background thread, in the runtime's msgpack encoding and zlib compressed
+- drops threads from memory once they have been idle for
+  CHECKPOINT_MEMORY_IDLE_SECONDS and everything they wrote is stored, and
+  loads them back from Postgres when they are used again
+- compacts the tables every CHECKPOINT_COMPACTION_INTERVAL_SECONDS, keeping
+  the last CHECKPOINT_KEEP_LAST checkpoints of each thread and deleting the
+  threads not used for CHECKPOINT_THREAD_TTL_DAYS
+
+Memory use then follows the threads in use instead of every thread ever
+created, and conversations survive restarts of the server. Compaction can also
+be run by hand:
+
+    python -m app.core.checkpointer compact
+"""
+
+import argparse
+import asyncio
+import queue
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import InMemorySaver as MemorySaver
+from langgraph_runtime_inmem import checkpoint as runtime_checkpoint
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, delete, select, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models.checkpoints import (
+    AgentCheckpoint,
+    AgentCheckpointBlob,
+    AgentCheckpointWrite,
+)
+
+# Values smaller than this are stored as they are
+COMPRESSION_MIN_BYTES = 256
+COMPRESSED_SUFFIX = "+zlib"
+# Operations written to Postgres in one transaction
+WRITE_BATCH_SIZE = 500
+# How often idle threads are looked for
+EVICTION_INTERVAL_SECONDS = 30
+MAX_RETRY_SECONDS = 30
+
+TypedValue = tuple[str, bytes]
+
+
+def compress_value(value: TypedValue) -> TypedValue:
+    value_type, data = value
+    if len(data) >= COMPRESSION_MIN_BYTES:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return value_type + COMPRESSED_SUFFIX, compressed
+    return value_type, data
+
+
+def decompress_value(value_type: str, data: bytes) -> TypedValue:
+    if value_type.endswith(COMPRESSED_SUFFIX):
+        return value_type.removesuffix(COMPRESSED_SUFFIX), zlib.decompress(data)
+    return value_type, data
+
+
+class _Checkpoints(dict):
+    """Checkpoints of a thread namespace, deleting one deletes it from Postgres too."""
+
+    def __init__(self, saver: "PostgresCheckpointer", thread_id: str, checkpoint_ns: str):
+        super().__init__()
+        self.saver = saver
+        self.thread_id = thread_id
+        self.checkpoint_ns = checkpoint_ns
+
+    def __delitem__(self, checkpoint_id: str):
+        super().__delitem__(checkpoint_id)
+        self.saver._enqueue(
+            self.thread_id,
+            ("delete_checkpoint", self.thread_id, self.checkpoint_ns, checkpoint_id),
+        )
+
+
+class _Namespaces(dict):
+    def __init__(self, saver: "PostgresCheckpointer", thread_id: str):
+        super().__init__()
+        self.saver = saver
+        self.thread_id = thread_id
+
+    def __missing__(self, checkpoint_ns: str) -> _Checkpoints:
+        checkpoints = self[checkpoint_ns] = _Checkpoints(
+            self.saver, self.thread_id, checkpoint_ns
+        )
+        return checkpoints
+
+
+class _Threads(dict):
+    """
+    The in-memory checkpoints by thread. Threads that are not in memory are
+    loaded from Postgres when they are looked up.
+    """
+
+    def __init__(self, saver: "PostgresCheckpointer"):
+        super().__init__()
+        self.saver = saver
+
+    def __missing__(self, thread_id: str) -> _Namespaces:
+        if thread_id not in self.saver._last_used:
+            self.saver._load_thread(thread_id)
+            if super().__contains__(thread_id):
+                return super().__getitem__(thread_id)
+        namespaces = self[thread_id] = _Namespaces(self.saver, thread_id)
+        return namespaces
+
+    def __contains__(self, thread_id: object) -> bool:
+        return super().__contains__(thread_id) or (
+            isinstance(thread_id, str)
+            and thread_id not in self.saver._last_used
+            and self.saver._is_stored(thread_id)
+        )
+
+    def __delitem__(self, thread_id: str):
+        self.pop(thread_id, None)
+        self.saver._forget_thread(thread_id)
+
+
+class PostgresCheckpointer(runtime_checkpoint.InMemorySaver):
+    def __init__(self, idle_seconds: int, keep_last: int, ttl_days: int):
+        # Skips the runtime's pickle files, Postgres takes their place
+        from langgraph_api.serde import Serializer
+
+        MemorySaver.__init__(self, serde=Serializer())
+        self.filename = ""
+        self.storage = _Threads(self)
+        self.idle_seconds = idle_seconds
+        self.keep_last = keep_last
+        self.ttl_days = ttl_days
+
+        # Threads in memory, by the time they were last used
+        self._last_used: dict[str, float] = {}
+        # Threads with operations not yet stored
+        self._unflushed: defaultdict[str, int] = defaultdict(int)
+        self._unflushed_lock = threading.Lock()
+        self._next_eviction = time.monotonic() + EVICTION_INTERVAL_SECONDS
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="checkpoint-writer", daemon=True
+        )
+        self._writer.start()
+
+        self.loads = 0
+        self.evictions = 0
+        self.checkpoints_written = 0
+        self.bytes_encoded = 0
+        self.bytes_stored = 0
+        self.last_compaction: dict | None = None
+        self.last_error: str | None = None
+
+    # Loading and evicting threads
+
+    def _is_stored(self, thread_id: str) -> bool:
+        with Session(engine) as db_session:
+            return (
+                db_session.exec(
+                    select(AgentCheckpoint.checkpoint_id)
+                    .where(AgentCheckpoint.thread_id == thread_id)
+                    .limit(1)
+                ).first()
+                is not None
+            )
+
+    def _fetch_thread(self, thread_id: str) -> tuple[list, list, list]:
+        with Session(engine) as db_session:
+            return (
+                db_session.exec(
+                    select(AgentCheckpoint).where(AgentCheckpoint.thread_id == thread_id)
+                ).all(),
+                db_session.exec(
+                    select(AgentCheckpointBlob).where(
+                        AgentCheckpointBlob.thread_id == thread_id
+                    )
+                ).all(),
+                db_session.exec(
+                    select(AgentCheckpointWrite).where(
+                        AgentCheckpointWrite.thread_id == thread_id
+                    )
+                ).all(),
+            )
+
+    def _apply_thread(
+        self,
+        thread_id: str,
+        checkpoints: list[AgentCheckpoint],
+        blobs: list[AgentCheckpointBlob],
+        writes: list[AgentCheckpointWrite],
+    ):
+        if thread_id in self._last_used:
+            # Loaded by someone else in the meantime
+            return
+        self._last_used[thread_id] = time.monotonic()
+        if not checkpoints:
+            return
+
+        self.loads += 1
+        namespaces = _Namespaces(self, thread_id)
+        for row in checkpoints:
+            # Plain dict item assignment, loading is not a change
+            dict.__setitem__(
+                namespaces[row.checkpoint_ns],
+                row.checkpoint_id,
+                (
+                    decompress_value(row.checkpoint_type, row.checkpoint),
+                    decompress_value(row.meta_type, row.meta),
+                    row.parent_checkpoint_id,
+                ),
+            )
+        for row in blobs:
+            self.blobs[(thread_id, row.checkpoint_ns, row.channel, row.version)] = (
+                decompress_value(row.value_type, row.value)
+            )
+        for row in writes:
+            self.writes[(thread_id, row.checkpoint_ns, row.checkpoint_id)][
+                (row.task_id, row.idx)
+            ] = (
+                row.task_id,
+                row.channel,
+                decompress_value(row.value_type, row.value),
+                row.task_path,
+            )
+        dict.__setitem__(self.storage, thread_id, namespaces)
+
+    def _load_thread(self, thread_id: str):
+        self._apply_thread(thread_id, *self._fetch_thread(thread_id))
+
+    async def _aload_thread(self, thread_id: str):
+        if thread_id not in self._last_used:
+            rows = await asyncio.to_thread(self._fetch_thread, thread_id)
+            self._apply_thread(thread_id, *rows)
+
+    def _touch(self, thread_id: str):
+        if thread_id not in self._last_used:
+            self._load_thread(thread_id)
+        now = time.monotonic()
+        self._last_used[thread_id] = now
+        if now >= self._next_eviction:
+            self._next_eviction = now + EVICTION_INTERVAL_SECONDS
+            self.evict_idle(now - self.idle_seconds)
+
+    def _drop_from_memory(self, thread_ids: set[str]):
+        for thread_id in thread_ids:
+            self._last_used.pop(thread_id, None)
+            dict.pop(self.storage, thread_id, None)
+        for key in [key for key in self.writes if key[0] in thread_ids]:
+            del self.writes[key]
+        for key in [key for key in self.blobs if key[0] in thread_ids]:
+            del self.blobs[key]
+
+    def evict_idle(self, used_before: float) -> int:
+        """Drop the threads last used before `used_before` from memory, if they are stored."""
+        with self._unflushed_lock:
+            idle = {
+                thread_id
+                for thread_id, last_used in self._last_used.items()
+                if last_used < used_before and not self._unflushed.get(thread_id)
+            }
+        if idle:
+            self._drop_from_memory(idle)
+            self.evictions += len(idle)
+        return len(idle)
+
+    def _forget_thread(self, thread_id: str):
+        self._drop_from_memory({thread_id})
+        self._enqueue(thread_id, ("delete_thread", thread_id))
+
+    # Writing to Postgres
+
+    def _enqueue(self, thread_id: str, operation: tuple):
+        with self._unflushed_lock:
+            self._unflushed[thread_id] += 1
+        self._queue.put((thread_id, operation))
+
+    def _write_loop(self):
+        next_compaction = time.monotonic() + settings.CHECKPOINT_COMPACTION_INTERVAL_SECONDS
+        while True:
+            try:
+                batch = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch:
+                retry_in = 1
+                while True:
+                    try:
+                        self._write_batch([operation for _, operation in batch])
+                        break
+                    except Exception as e:
+                        # Threads with unstored changes stay in memory in the meantime
+                        self.last_error = str(e)
+                        print(f"Could not store checkpoints, retrying in {retry_in}s: {e}")
+                        time.sleep(retry_in)
+                        retry_in = min(retry_in * 2, MAX_RETRY_SECONDS)
+                with self._unflushed_lock:
+                    for thread_id, _ in batch:
+                        self._unflushed[thread_id] -= 1
+                        if not self._unflushed[thread_id]:
+                            del self._unflushed[thread_id]
+                for _ in batch:
+                    self._queue.task_done()
+
+            if time.monotonic() >= next_compaction:
+                next_compaction = (
+                    time.monotonic() + settings.CHECKPOINT_COMPACTION_INTERVAL_SECONDS
+                )
+                try:
+                    self.last_compaction = compact_checkpoints(self.keep_last, self.ttl_days)
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"Could not compact the checkpoints: {e}")
+
+    def _write_batch(self, operations: list[tuple]):
+        # Rows keyed by primary key, a statement may not update the same row twice
+        checkpoints: dict[tuple, dict] = {}
+        blobs: dict[tuple, dict] = {}
+        writes: dict[tuple, dict] = {}
+
+        with Session(engine) as db_session:
+
+            def flush_rows():
+                for model, rows in (
+                    (AgentCheckpoint, checkpoints),
+                    (AgentCheckpointBlob, blobs),
+                    (AgentCheckpointWrite, writes),
+                ):
+                    if not rows:
+                        continue
+                    statement = insert(model)
+                    keys = [column.name for column in model.__table__.primary_key]
+                    db_session.exec(
+                        statement.on_conflict_do_update(
+                            index_elements=keys,
+                            set_={
+                                name: statement.excluded[name]
+                                for name in next(iter(rows.values()))
+                                if name not in keys
+                            },
+                        ),
+                        params=list(rows.values()),
+                    )
+                    rows.clear()
+
+            for kind, *payload in operations:
+                if kind == "checkpoint":
+                    row, blob_rows = payload
+                    checkpoints[
+                        (row["thread_id"], row["checkpoint_ns"], row["checkpoint_id"])
+                    ] = row
+                    for blob in blob_rows:
+                        blobs[
+                            (
+                                blob["thread_id"],
+                                blob["checkpoint_ns"],
+                                blob["channel"],
+                                blob["version"],
+                            )
+                        ] = blob
+                elif kind == "writes":
+                    for row in payload[0]:
+                        writes[
+                            (
+                                row["thread_id"],
+                                row["checkpoint_ns"],
+                                row["checkpoint_id"],
+                                row["task_id"],
+                                row["idx"],
+                            )
+                        ] = row
+                else:
+                    # Deletes apply to what was written before them
+                    flush_rows()
+                    if kind == "delete_thread":
+                        for model in (AgentCheckpoint, AgentCheckpointBlob, AgentCheckpointWrite):
+                            db_session.exec(
+                                delete(model).where(col(model.thread_id) == payload[0])
+                            )
+                    else:
+                        thread_id, checkpoint_ns, checkpoint_id = payload
+                        for model in (AgentCheckpoint, AgentCheckpointWrite):
+                            db_session.exec(
+                                delete(model).where(
+                                    col(model.thread_id) == thread_id,
+                                    col(model.checkpoint_ns) == checkpoint_ns,
+                                    col(model.checkpoint_id) == checkpoint_id,
+                                )
+                            )
+            flush_rows()
+            db_session.commit()
+
+    def _stored_value(self, value: TypedValue) -> tuple[str, bytes]:
+        stored = compress_value(value)
+        self.bytes_encoded += len(value[1])
+        self.bytes_stored += len(stored[1])
+        return stored
+
+    def flush(self):
+        """Wait until everything written so far is stored."""
+        self._queue.join()
+
+    # Checkpointer interface, the in-memory parts are inherited
+
+    def get_tuple(self, config: RunnableConfig):
+        self._touch(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    async def aget_tuple(self, config: RunnableConfig):
+        await self._aload_thread(config["configurable"]["thread_id"])
+        return await super().aget_tuple(config)
+
+    def list(self, config: RunnableConfig | None, **kwargs):
+        if config:
+            self._touch(config["configurable"]["thread_id"])
+        return super().list(config, **kwargs)
+
+    async def alist(self, config: RunnableConfig | None, **kwargs):
+        if config:
+            await self._aload_thread(config["configurable"]["thread_id"])
+        async for item in super().alist(config, **kwargs):
+            yield item
+
+    def put(self, config: RunnableConfig, checkpoint, metadata, new_versions):
+        self._touch(config["configurable"]["thread_id"])
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = next_config["configurable"]["thread_id"]
+        checkpoint_ns = next_config["configurable"]["checkpoint_ns"]
+        checkpoint_id = next_config["configurable"]["checkpoint_id"]
+
+        encoded, encoded_meta, parent_id = self.storage[thread_id][checkpoint_ns][
+            checkpoint_id
+        ]
+        checkpoint_type, checkpoint_data = self._stored_value(encoded)
+        meta_type, meta_data = self._stored_value(encoded_meta)
+        blob_rows = []
+        for channel, version in new_versions.items():
+            value_type, value = self._stored_value(
+                self.blobs[(thread_id, checkpoint_ns, channel, version)]
+            )
+            blob_rows.append(
+                {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "channel": channel,
+                    "version": str(version),
+                    "value_type": value_type,
+                    "value": value,
+                }
+            )
+        self.checkpoints_written += 1
+        self._enqueue(
+            thread_id,
+            (
+                "checkpoint",
+                {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": str(checkpoint_id),
+                    "parent_checkpoint_id": parent_id and str(parent_id),
+                    "checkpoint_type": checkpoint_type,
+                    "checkpoint": checkpoint_data,
+                    "meta_type": meta_type,
+                    "meta": meta_data,
+                    "channel_versions": {
+                        channel: str(version)
+                        for channel, version in checkpoint["channel_versions"].items()
+                    },
+                    "created_at": datetime.now(),
+                },
+                blob_rows,
+            ),
+        )
+        return next_config
+
+    async def aput(self, config: RunnableConfig, checkpoint, metadata, new_versions):
+        await self._aload_thread(config["configurable"]["thread_id"])
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config: RunnableConfig, writes, task_id: str, task_path: str = ""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        self._touch(thread_id)
+        super().put_writes(config, writes, task_id, task_path)
+
+        rows = []
+        stored = self.writes.get((thread_id, checkpoint_ns, checkpoint_id), {})
+        for (write_task_id, idx), (_, channel, value, path) in stored.items():
+            if write_task_id != task_id:
+                continue
+            value_type, data = self._stored_value(value)
+            rows.append(
+                {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": str(checkpoint_id),
+                    "task_id": task_id,
+                    "idx": idx,
+                    "channel": channel,
+                    "value_type": value_type,
+                    "value": data,
+                    "task_path": path,
+                }
+            )
+        if rows:
+            self._enqueue(thread_id, ("writes", rows))
+
+    async def aput_writes(
+        self, config: RunnableConfig, writes, task_id: str, task_path: str = ""
+    ):
+        await self._aload_thread(config["configurable"]["thread_id"])
+        return await super().aput_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str):
+        super().delete_thread(thread_id)
+        self._forget_thread(thread_id)
+
+    def clear(self):
+        self._drop_from_memory(set(self._last_used) | set(dict.keys(self.storage)))
+        self.flush()
+        with Session(engine) as db_session:
+            for model in (AgentCheckpoint, AgentCheckpointBlob, AgentCheckpointWrite):
+                db_session.exec(delete(model))
+            db_session.commit()
+
+    def __exit__(self, *exc_info: Any):
+        self.flush()
+        return super().__exit__(*exc_info)
+
+    async def __aexit__(self, *exc_info: Any):
+        await asyncio.to_thread(self.flush)
+        return await super().__aexit__(*exc_info)
+
+    def stats(self) -> dict:
+        return {
+            "threads_in_memory": len(self._last_used),
+            "queued_operations": self._queue.qsize(),
+            "threads_unstored": len(self._unflushed),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "checkpoints_written": self.checkpoints_written,
+            "bytes_encoded": self.bytes_encoded,
+            "bytes_stored": self.bytes_stored,
+            "last_compaction": self.last_compaction,
+            "last_error": self.last_error,
+        }
+
+
+def compact_checkpoints(keep_last: int, ttl_days: int) -> dict:
+    """Keep the last checkpoints of each thread and delete expired threads."""
+    result = {"expired_threads": 0}
+    with Session(engine) as db_session:
+        if ttl_days > 0:
+            expired = db_session.exec(
+                text(
+                    "SELECT thread_id FROM agent_checkpoint GROUP BY thread_id "
+                    "HAVING max(created_at) < :cutoff"
+                ),
+                params={"cutoff": datetime.now() - timedelta(days=ttl_days)},
+            ).all()
+            thread_ids = [row.thread_id for row in expired]
+            for model in (AgentCheckpoint, AgentCheckpointBlob, AgentCheckpointWrite):
+                db_session.exec(delete(model).where(col(model.thread_id).in_(thread_ids)))
+            result["expired_threads"] = len(thread_ids)
+
+        result["checkpoints"] = db_session.exec(
+            text(
+                """
+                DELETE FROM agent_checkpoint c USING (
+                    SELECT thread_id, checkpoint_ns, checkpoint_id, row_number() OVER (
+                        PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                    ) AS position
+                    FROM agent_checkpoint
+                ) ranked
+                WHERE c.thread_id = ranked.thread_id
+                AND c.checkpoint_ns = ranked.checkpoint_ns
+                AND c.checkpoint_id = ranked.checkpoint_id
+                AND ranked.position > :keep_last
+                """
+            ),
+            params={"keep_last": keep_last},
+        ).rowcount
+        result["writes"] = db_session.exec(
+            text(
+                """
+                DELETE FROM agent_checkpoint_write w WHERE NOT EXISTS (
+                    SELECT 1 FROM agent_checkpoint c
+                    WHERE c.thread_id = w.thread_id
+                    AND c.checkpoint_ns = w.checkpoint_ns
+                    AND c.checkpoint_id = w.checkpoint_id
+                )
+                """
+            )
+        ).rowcount
+        # Channel values no remaining checkpoint refers to
+        result["blobs"] = db_session.exec(
+            text(
+                """
+                DELETE FROM agent_checkpoint_blob b WHERE NOT EXISTS (
+                    SELECT 1 FROM agent_checkpoint c
+                    WHERE c.thread_id = b.thread_id
+                    AND c.checkpoint_ns = b.checkpoint_ns
+                    AND c.channel_versions ->> b.channel = b.version
+                )
+                """
+            )
+        ).rowcount
+        db_session.commit()
+
+    result["finished_at"] = datetime.now().isoformat()
+    return result
+
+
+def install_checkpointer() -> PostgresCheckpointer:
+    """Make the LangGraph server's in-memory runtime use the Postgres checkpointer."""
+    # The runtime resolves its checkpointer through this module global
+    if not isinstance(runtime_checkpoint.MEMORY, PostgresCheckpointer):
+        runtime_checkpoint.MEMORY = PostgresCheckpointer(
+            idle_seconds=settings.CHECKPOINT_MEMORY_IDLE_SECONDS,
+            keep_last=settings.CHECKPOINT_KEEP_LAST,
+            ttl_days=settings.CHECKPOINT_THREAD_TTL_DAYS,
+        )
+    return runtime_checkpoint.MEMORY
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the stored agent checkpoints.")
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument("--keep-last", type=int, default=settings.CHECKPOINT_KEEP_LAST)
+    parser.add_argument("--ttl-days", type=int, default=settings.CHECKPOINT_THREAD_TTL_DAYS)
+    args = parser.parse_args()
+
+    result = compact_checkpoints(args.keep_last, args.ttl_days)
+    print(f"expired threads: {result['expired_threads']}")
+    print(f"checkpoints deleted: {result['checkpoints']}")
+    print(f"writes deleted: {result['writes']}")
+    print(f"channel values deleted: {result['blobs']}")
+
+
+if __name__ == "__main__":
+    main()
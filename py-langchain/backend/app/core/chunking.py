@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
+from langchain_core.documents import Document as LCDocument
+from langchain_text_splitters import (
+    MarkdownHeaderTextSplitter,
+    RecursiveCharacterTextSplitter,
+)
+
+from app.core.config import settings
+
+# Encoding used by text-embedding-3-small, chunk sizes are measured in its tokens
+EMBEDDING_ENCODING = "cl100k_base"
+
+MARKDOWN_HEADERS = [("#", "h1"), ("##", "h2"), ("###", "h3")]
+
+
+@dataclass(frozen=True)
+class ChunkingConfig:
+    chunk_size: int
+    chunk_overlap: int
+    split_markdown_headers: bool = False
+
+
+def get_chunking_config(file_type: str) -> ChunkingConfig:
+    """Return the chunking settings for a document type."""
+    if file_type == "application/pdf":
+        return ChunkingConfig(
+            chunk_size=settings.CHUNK_SIZE_PDF,
+            chunk_overlap=settings.CHUNK_OVERLAP_PDF,
+        )
+
+    if file_type == "text/markdown":
+        return ChunkingConfig(
+            chunk_size=settings.CHUNK_SIZE_MARKDOWN,
+            chunk_overlap=settings.CHUNK_OVERLAP_MARKDOWN,
+            split_markdown_headers=True,
+        )
+
+    return ChunkingConfig(
+        chunk_size=settings.CHUNK_SIZE_TEXT,
+        chunk_overlap=settings.CHUNK_OVERLAP_TEXT,
+    )
+
+
+@lru_cache
+def _token_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=EMBEDDING_ENCODING,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        # User documents may legitimately contain strings like "<|endoftext|>"
+        disallowed_special=(),
+    )
+
+
+def chunk_text(
+    text: str, config: ChunkingConfig, metadata: dict | None = None
+) -> list[LCDocument]:
+    """Split a piece of text into token-sized chunks, keeping markdown sections together."""
+    splitter = _token_splitter(config.chunk_size, config.chunk_overlap)
+    metadata = metadata or {}
+
+    if not config.split_markdown_headers:
+        return splitter.create_documents([text], metadatas=[metadata])
+
+    sections = MarkdownHeaderTextSplitter(
+        headers_to_split_on=MARKDOWN_HEADERS, strip_headers=False
+    ).split_text(text)
+
+    chunks = []
+    for section in sections:
+        headings = [
+            section.metadata[name]
+            for _, name in MARKDOWN_HEADERS
+            if name in section.metadata
+        ]
+        section_metadata = {**metadata}
+        if headings:
+            section_metadata["section"] = " > ".join(headings)
+        chunks.extend(
+            splitter.create_documents(
+                [section.page_content], metadatas=[section_metadata]
+            )
+        )
+
+    return chunks
+
+
+def chunk_pages(
+    pages: list[tuple[int | None, str]], config: ChunkingConfig
+) -> list[LCDocument]:
+    """Chunk a document page by page so every chunk knows the page it came from."""
+    chunks = []
+    for page_number, text in pages:
+        if not text.strip():
+            continue
+        metadata = {"page": page_number} if page_number is not None else {}
+        chunks.extend(chunk_text(text, config, metadata))
+
+    return chunks
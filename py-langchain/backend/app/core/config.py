@@ -35,12 +35,145 @@ class Settings(BaseSettings):
     SHOP_API_URL: str = ""
     SHOP_API_AUDIENCE: str = ""
 
+    # Purchase approvals (CIBA): "block" keeps the run waiting for the user's approval,
+    # "interrupt" suspends the thread and the API resumes it in the background
+    ASYNC_AUTHORIZATION_MODE: str = "block"
+    # Sends the CIBA requests somewhere else than AUTH0_DOMAIN, e.g. a fake server
+    ASYNC_AUTHORIZATION_AUTH0_URL: str = ""
+    ASYNC_AUTHORIZATION_SCAN_INTERVAL_SECONDS: float = 2.0
+    ASYNC_AUTHORIZATION_MAX_POLL_INTERVAL_SECONDS: float = 30.0
+    ASYNC_AUTHORIZATION_MAX_CONCURRENT_RESUMES: int = 8
+
+    # Google Calendar tool, the API URL can point at a fake server
+    GOOGLE_CALENDAR_API_URL: str = ""
+    GOOGLE_API_MAX_WORKERS: int = 8
+    # Events are synced for this many days ahead and kept per user
+    GOOGLE_CALENDAR_SYNC_WINDOW_DAYS: int = 30
+    GOOGLE_CALENDAR_CACHE_SIZE: int = 1000
+
     # OpenAI
     OPENAI_API_KEY: str
 
+    # Conversation history sent to the model, in tokens. Past the max, older turns are
+    # folded into a running summary until the recent ones fit into the keep budget
+    HISTORY_MAX_TOKENS: int = 8000
+    HISTORY_KEEP_TOKENS: int = 4000
+    # Tool outputs of earlier turns are cut down to this many tokens
+    HISTORY_TOOL_OUTPUT_MAX_TOKENS: int = 300
+    HISTORY_SUMMARY_MODEL: str = "gpt-4.1-mini"
+    HISTORY_SUMMARY_MAX_TOKENS: int = 500
+
+    # Agent tool calls: results are reused within a thread for the TTL, and each tool
+    # runs at most this many calls at once in the LangGraph server
+    TOOL_RESULT_CACHE_TTL_SECONDS: int = 120
+    TOOL_RESULT_CACHE_SIZE: int = 1000
+    TOOL_MAX_CONCURRENCY: int = 16
+
     # Database
     DATABASE_URL: str
 
+    # Agent graph checkpoints: "memory" leaves them to the LangGraph server's in-memory
+    # runtime, "postgres" stores them in DATABASE_URL and keeps only threads in use in memory
+    CHECKPOINTER_BACKEND: str = "memory"
+    CHECKPOINT_MEMORY_IDLE_SECONDS: int = 600
+    # Compaction keeps the last checkpoints of each thread and deletes unused threads,
+    # a TTL of 0 keeps them forever
+    CHECKPOINT_KEEP_LAST: int = 20
+    CHECKPOINT_THREAD_TTL_DAYS: int = 30
+    CHECKPOINT_COMPACTION_INTERVAL_SECONDS: int = 3600
+
+    # Number of embedding vectors kept in the in-process LRU cache
+    EMBEDDING_CACHE_SIZE: int = 2000
+
+    # Number of question embeddings kept in memory by the retrieval tool
+    QUERY_EMBEDDING_CACHE_SIZE: int = 1000
+
+    # Embedding requests from concurrent uploads are coalesced into shared batches
+    EMBEDDING_BATCH_MAX_TOKENS: int = 50000
+    EMBEDDING_BATCH_MAX_SIZE: int = 2048
+    EMBEDDING_BATCH_MAX_WAIT_MS: int = 50
+    EMBEDDING_MAX_CONCURRENT_REQUESTS: int = 4
+
+    # Chunking, sizes are measured in tokens of the embedding model
+    CHUNK_SIZE_TEXT: int = 400
+    CHUNK_OVERLAP_TEXT: int = 40
+    CHUNK_SIZE_MARKDOWN: int = 400
+    CHUNK_OVERLAP_MARKDOWN: int = 40
+    CHUNK_SIZE_PDF: int = 300
+    CHUNK_OVERLAP_PDF: int = 30
+
+    # Document content storage
+    BLOB_STORE_BACKEND: str = "local"
+    BLOB_STORE_PATH: str = ".blobs"
+
+    # PDF text extraction
+    PDF_EXTRACTION_WORKERS: int = 2
+    PDF_PAGES_PER_TASK: int = 10
+    PDF_MAX_PAGES: int = 1000
+    PDF_EXTRACTION_TIMEOUT_SECONDS: int = 120
+
+    # Ingestion pipeline (max concurrent documents per stage)
+    INGESTION_EXTRACT_CONCURRENCY: int = 2
+    INGESTION_CHUNK_CONCURRENCY: int = 2
+    INGESTION_EMBED_CONCURRENCY: int = 4
+    INGESTION_PERSIST_CONCURRENCY: int = 4
+    # Documents still processing after this long lost their worker and are queued again
+    INGESTION_STALE_AFTER_SECONDS: int = 600
+
+    # Approximate nearest neighbour index on the embedding vectors: "hnsw", "ivfflat" or "none"
+    VECTOR_INDEX_TYPE: str = "hnsw"
+    VECTOR_INDEX_AUTO_CREATE: bool = True
+    VECTOR_INDEX_HNSW_M: int = 16
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION: int = 64
+    VECTOR_INDEX_HNSW_EF_SEARCH: int = 40
+    # 0 derives the number of lists from the table size when the index is built
+    VECTOR_INDEX_IVFFLAT_LISTS: int = 0
+    VECTOR_INDEX_IVFFLAT_PROBES: int = 10
+    # Keeps scanning the index until enough rows pass the query's filter (pgvector >= 0.8),
+    # "off" for older versions
+    VECTOR_INDEX_ITERATIVE_SCAN: str = "relaxed_order"
+
+    # Retrieval: "prefilter" searches only the documents FGA lists as viewable by the user,
+    # "postfilter" checks the global top-k chunks with FGA after the search
+    RETRIEVAL_MODE: str = "prefilter"
+    RETRIEVAL_TOP_K: int = 4
+    FGA_LIST_OBJECTS_CACHE_TTL_SECONDS: int = 30
+    FGA_DECISION_CACHE_TTL_SECONDS: int = 30
+    FGA_DECISION_CACHE_SIZE: int = 10000
+    # Concurrent write requests used by bulk tuple writes
+    FGA_WRITE_MAX_PARALLEL_REQUESTS: int = 10
+
+    # Answers to knowledge base questions are reused for the same user when a new
+    # question is this similar and none of the documents they can view changed since
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_MIN_SIMILARITY: float = 0.95
+    ANSWER_CACHE_TTL_SECONDS: int = 86400
+
+    # Tuple changes queued in the FGA outbox and sent in the background
+    FGA_OUTBOX_BATCH_SIZE: int = 500
+    FGA_OUTBOX_POLL_INTERVAL_SECONDS: float = 1.0
+    # How long a claimed batch stays reserved, in case its process dies mid-batch
+    FGA_OUTBOX_LEASE_SECONDS: int = 60
+    FGA_OUTBOX_MAX_BACKOFF_SECONDS: int = 300
+
+    # get_user_info tool: session claims issued within the max age are served as is,
+    # otherwise the Auth0 /userinfo response is cached per access token
+    USER_INFO_SESSION_MAX_AGE_SECONDS: int = 3600
+    USER_INFO_CACHE_TTL_SECONDS: int = 300
+    USER_INFO_CACHE_SIZE: int = 1000
+
+    # Outgoing HTTP connections, pooled per upstream service
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5
+    HTTP_TIMEOUT_SECONDS: float = 30
+    # Negotiated per upstream, servers without HTTP/2 get HTTP/1.1
+    HTTP2_ENABLED: bool = True
+
+    # Prometheus metrics at /metrics of the API and /assistant0/metrics of the LangGraph server
+    METRICS_ENABLED: bool = True
+
     # LangGraph server
     LANGGRAPH_API_URL: str = "http://localhost:54367"
     LANGGRAPH_API_KEY: str = ""
@@ -5,6 +5,41 @@ from app.core.config import settings
 
 engine = create_engine(settings.DATABASE_URL)
 
+# Columns added after the first release, `create_all` only creates missing tables
+SCHEMA_UPGRADES = [
+    "ALTER TABLE document ADD COLUMN IF NOT EXISTS status VARCHAR NOT NULL DEFAULT 'ready'",
+    "ALTER TABLE document ADD COLUMN IF NOT EXISTS error VARCHAR",
+    "ALTER TABLE document ADD COLUMN IF NOT EXISTS content_ref VARCHAR",
+    "ALTER TABLE document ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+    "ALTER TABLE document ADD COLUMN IF NOT EXISTS content_size INTEGER",
+    "ALTER TABLE document ALTER COLUMN content DROP NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_document_user_id_created_at_id "
+    "ON document (user_id, created_at, id)",
+    # Pages used to be keyed on updated_at, which changes with the status
+    "DROP INDEX IF EXISTS ix_document_user_id_updated_at_id",
+    # Permission filtered retrieval matches chunks on the document id in their metadata
+    "CREATE INDEX IF NOT EXISTS ix_embedding_meta_document_id "
+    "ON embedding ((meta->>'document_id'))",
+    # Cached answers are invalidated by the documents they were built from
+    "CREATE INDEX IF NOT EXISTS ix_answer_cache_document_ids "
+    "ON answer_cache USING gin (document_ids)",
+    # Shares used to live in an array column on the document
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'document' AND column_name = 'shared_with'
+        ) THEN
+            INSERT INTO document_share (document_id, user_email, created_at)
+            SELECT id, unnest(shared_with), now() FROM document
+            ON CONFLICT DO NOTHING;
+            ALTER TABLE document DROP COLUMN shared_with;
+        END IF;
+    END $$
+    """,
+]
+
 
 def init_db():
     # Enable vector extension
@@ -13,3 +48,8 @@ def init_db():
         db_session.commit()
 
     SQLModel.metadata.create_all(engine)
+
+    with Session(engine) as db_session:
+        for statement in SCHEMA_UPGRADES:
+            db_session.exec(text(statement))
+        db_session.commit()
@@ -0,0 +1,92 @@
+import re
+import uuid
+from typing import BinaryIO, Iterator
+
+from sqlmodel import Session, col, func, select
+
+from app.core.db import engine
+from app.models.documents import Document
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiableError(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parse a Range header into an inclusive (start, end) byte range.
+
+    Returns None when the whole content should be sent. Only single ranges are
+    supported, requests for several ranges get the full content, which the
+    HTTP spec allows.
+    """
+    if not header:
+        return None
+
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Suffix range, the last `end` bytes
+        suffix = int(end)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiableError()
+        return max(size - suffix, 0), size - 1
+
+    first = int(start)
+    last = min(int(end), size - 1) if end else size - 1
+    if first >= size or (end and int(end) < first):
+        raise RangeNotSatisfiableError()
+
+    return first, last
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Check an If-None-Match or If-Range header against an ETag, weakly."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def iter_blob(blob: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+    """Read the inclusive byte range [start, end] of a blob chunk by chunk."""
+    with blob:
+        blob.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = blob.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def iter_legacy_content(document_id: uuid.UUID, start: int, end: int) -> Iterator[bytes]:
+    """Read a byte range of content stored in the document row, without loading all of it."""
+    with Session(engine) as db_session:
+        offset = start
+        while offset <= end:
+            length = min(DOWNLOAD_CHUNK_SIZE, end - offset + 1)
+            data = db_session.exec(
+                # substring() on bytea is 1-based
+                select(func.substring(Document.content, offset + 1, length)).where(
+                    col(Document.id) == document_id
+                )
+            ).first()
+            if not data:
+                break
+            offset += len(data)
+            yield bytes(data)
@@ -0,0 +1,202 @@
+import asyncio
+import random
+from collections import deque
+from dataclasses import dataclass
+
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from openai import RateLimitError
+
+from app.core.metrics import EMBEDDING_API_TOKENS
+
+
+@dataclass
+class _PendingText:
+    text: str
+    tokens: int
+    future: asyncio.Future
+
+
+class EmbeddingBatcher:
+    """
+    Process-wide scheduler that coalesces embedding requests.
+
+    Texts from concurrent callers are queued and sent to the embedding API in
+    batches bounded by token count and number of inputs. A batch is flushed as
+    soon as it is full or when the oldest queued text has waited `max_wait`
+    seconds. Requests run with bounded parallelism; when the API answers with
+    429 the parallelism is halved and the batch retried with exponential
+    backoff, and it grows back by one slot after every successful request.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        encoding_name: str = "cl100k_base",
+        max_batch_tokens: int = 50_000,
+        max_batch_size: int = 2048,
+        max_wait: float = 0.05,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+    ):
+        self.embeddings = embeddings
+        self.encoding_name = encoding_name
+        self._encoding: tiktoken.Encoding | None = None
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+        self._queue: deque[_PendingText] = deque()
+        self._queued_tokens = 0
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._in_flight = 0
+        self._concurrency = max_concurrency
+        self._slots: asyncio.Condition | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+        self.batches_sent = 0
+        self.texts_sent = 0
+        self.tokens_sent = 0
+        self.rate_limited = 0
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        # Loaded lazily, tiktoken may need to download the encoding first
+        if self._encoding is None:
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        return self._encoding
+
+    def _count_tokens(self, texts: list[str]) -> list[int]:
+        return [max(1, len(self.encoding.encode_ordinary(text))) for text in texts]
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed `texts`, sharing API requests with any other concurrent callers."""
+        if not texts:
+            return []
+
+        # Tokenizing a large document takes a while, keep it off the event loop
+        token_counts = await asyncio.to_thread(self._count_tokens, texts)
+
+        loop = asyncio.get_running_loop()
+        pending = [
+            _PendingText(text=text, tokens=tokens, future=loop.create_future())
+            for text, tokens in zip(texts, token_counts)
+        ]
+
+        for item in pending:
+            self._queue.append(item)
+            self._queued_tokens += item.tokens
+
+        # Full batches go out right away, the remainder waits for more texts
+        while self._batch_is_full():
+            self._dispatch(self._take_batch())
+
+        if self._queue and self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.max_wait, self._flush)
+
+        return list(await asyncio.gather(*(item.future for item in pending)))
+
+    def _batch_is_full(self) -> bool:
+        return (
+            self._queued_tokens >= self.max_batch_tokens
+            or len(self._queue) >= self.max_batch_size
+        )
+
+    def _take_batch(self) -> list[_PendingText]:
+        batch: list[_PendingText] = []
+        tokens = 0
+        while self._queue and len(batch) < self.max_batch_size:
+            item = self._queue[0]
+            if batch and tokens + item.tokens > self.max_batch_tokens:
+                break
+            batch.append(self._queue.popleft())
+            tokens += item.tokens
+
+        self._queued_tokens -= tokens
+        return batch
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        while self._queue:
+            self._dispatch(self._take_batch())
+
+    def _dispatch(self, batch: list[_PendingText]):
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _acquire_slot(self):
+        if self._slots is None:
+            self._slots = asyncio.Condition()
+
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight < self._concurrency)
+            self._in_flight += 1
+
+    async def _release_slot(self, rate_limited: bool):
+        assert self._slots is not None
+
+        async with self._slots:
+            self._in_flight -= 1
+            if rate_limited:
+                self._concurrency = max(1, self._concurrency // 2)
+            elif self._concurrency < self.max_concurrency:
+                self._concurrency += 1
+            self._slots.notify_all()
+
+    async def _send(self, batch: list[_PendingText]):
+        texts = [item.text for item in batch]
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self._acquire_slot()
+                rate_limited = False
+                try:
+                    vectors = await self.embeddings.aembed_documents(
+                        texts, chunk_size=len(texts)
+                    )
+                except RateLimitError:
+                    rate_limited = True
+                    self.rate_limited += 1
+                    if attempt == self.max_retries:
+                        raise
+                finally:
+                    await self._release_slot(rate_limited)
+
+                if not rate_limited:
+                    break
+
+                await asyncio.sleep(min(30.0, 0.5 * 2**attempt) * random.uniform(1, 1.5))
+
+            self.batches_sent += 1
+            self.texts_sent += len(batch)
+            tokens = sum(item.tokens for item in batch)
+            self.tokens_sent += tokens
+            EMBEDDING_API_TOKENS.inc(tokens)
+
+            for item, vector in zip(batch, vectors):
+                if not item.future.done():
+                    item.future.set_result(vector)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            "batches_sent": self.batches_sent,
+            "texts_sent": self.texts_sent,
+            "tokens_sent": self.tokens_sent,
+            "average_batch_size": (
+                self.texts_sent / self.batches_sent if self.batches_sent else 0.0
+            ),
+            "rate_limited": self.rate_limited,
+            "queued": len(self._queue),
+            "in_flight": self._in_flight,
+            "concurrency": self._concurrency,
+        }
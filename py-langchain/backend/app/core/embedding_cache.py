@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models.embeddings import CachedEmbedding
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embedding vectors.
+
+    Vectors are keyed by (model name, sha256 of the chunk text) and stored in
+    the `embedding_cache` table, with an in-process LRU in front of it. Only
+    texts missing from both are sent to the embedding API.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # Vectors are kept as float32 arrays, the same precision pgvector stores
+        self._lru: OrderedDict[tuple[str, str], array] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _lru_get(self, key: tuple[str, str]) -> list[float] | None:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is None:
+                return None
+            self._lru.move_to_end(key)
+            return vector.tolist()
+
+    def _lru_put(self, key: tuple[str, str], vector: list[float]):
+        with self._lock:
+            self._lru[key] = array("f", vector)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def _db_get(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        with Session(engine) as db_session:
+            rows = db_session.exec(
+                select(CachedEmbedding.content_hash, CachedEmbedding.embedding).where(
+                    CachedEmbedding.model == model,
+                    col(CachedEmbedding.content_hash).in_(hashes),
+                )
+            ).all()
+
+        return {row.content_hash: [float(x) for x in row.embedding] for row in rows}
+
+    def _db_put(self, model: str, vectors: dict[str, list[float]]):
+        with Session(engine) as db_session:
+            db_session.exec(
+                insert(CachedEmbedding)
+                .values(
+                    [
+                        {"model": model, "content_hash": key, "embedding": vector}
+                        for key, vector in vectors.items()
+                    ]
+                )
+                .on_conflict_do_nothing()
+            )
+            db_session.commit()
+
+    def _lookup(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        vectors: dict[str, list[float]] = {}
+
+        for key in set(hashes):
+            vector = self._lru_get((model, key))
+            if vector is not None:
+                vectors[key] = vector
+
+        memory_hits = len(vectors)
+
+        missing = [key for key in set(hashes) if key not in vectors]
+        if missing:
+            stored = self._db_get(model, missing)
+            for key, vector in stored.items():
+                vectors[key] = vector
+                self._lru_put((model, key), vector)
+
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.db_hits += len(vectors) - memory_hits
+
+        return vectors
+
+    def _store(self, model: str, embedded: dict[str, list[float]]):
+        self._db_put(model, embedded)
+        for key, vector in embedded.items():
+            self._lru_put((model, key), vector)
+
+        with self._lock:
+            self.misses += len(embedded)
+
+    @staticmethod
+    def _missing_texts(
+        hashes: list[str], texts: list[str], vectors: dict[str, list[float]]
+    ) -> dict[str, str]:
+        # Texts that repeat within the batch are only embedded once
+        to_embed: dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors:
+                to_embed.setdefault(key, text)
+        return to_embed
+
+    def embed_documents(
+        self,
+        model: str,
+        texts: list[str],
+        embed: Callable[[list[str]], list[list[float]]],
+    ) -> list[list[float]]:
+        """Embed `texts`, calling `embed` only for texts that are not cached yet."""
+        hashes = [content_hash(text) for text in texts]
+        vectors = self._lookup(model, hashes)
+
+        to_embed = self._missing_texts(hashes, texts, vectors)
+        if to_embed:
+            embedded = dict(zip(to_embed.keys(), embed(list(to_embed.values()))))
+            self._store(model, embedded)
+            vectors.update(embedded)
+
+        return [vectors[key] for key in hashes]
+
+    async def aembed_documents(
+        self,
+        model: str,
+        texts: list[str],
+        aembed: Callable[[list[str]], Awaitable[list[list[float]]]],
+    ) -> list[list[float]]:
+        """Async version of `embed_documents`, database access runs in a thread."""
+        hashes = [content_hash(text) for text in texts]
+        vectors = await asyncio.to_thread(self._lookup, model, hashes)
+
+        to_embed = self._missing_texts(hashes, texts, vectors)
+        if to_embed:
+            embedded = dict(
+                zip(to_embed.keys(), await aembed(list(to_embed.values())))
+            )
+            await asyncio.to_thread(self._store, model, embedded)
+            vectors.update(embedded)
+
+        return [vectors[key] for key in hashes]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": (
+                    (self.memory_hits + self.db_hits) / lookups if lookups else 0.0
+                ),
+                "size": len(self._lru),
+                "max_size": self.max_size,
+            }
+
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU of question -> query vector.
+
+    Questions are normalized for case and whitespace before lookup, and
+    concurrent lookups of the same question share a single embedding request.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self._lru: OrderedDict[str, array] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    async def aembed_query(self, question: str) -> list[float]:
+        key = self.normalize(question)
+
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return vector.tolist()
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            embedding = await asyncio.shield(in_flight)
+            if embedding is not None:
+                self.hits += 1
+                return embedding
+            # The request was cancelled along with its caller, ask again
+            return await self.aembed_query(question)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            embedding = await self.embeddings.aembed_query(question)
+        except asyncio.CancelledError:
+            # Waiters get None instead of the cancellation, which is not theirs
+            future.set_result(None)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting, keep the loop from warning about it
+            future.exception()
+            raise
+        else:
+            future.set_result(embedding)
+            self._lru[key] = array("f", embedding)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+            return embedding
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._lru),
+            "max_size": self.max_size,
+        }
+
+
+embedding_cache = EmbeddingCache(max_size=settings.EMBEDDING_CACHE_SIZE)
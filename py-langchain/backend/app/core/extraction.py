@@ -0,0 +1,145 @@
+import asyncio
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from typing import AsyncIterator
+
+import PyPDF2
+
+from app.core.config import settings
+
+
+class ExtractionError(Exception):
+    pass
+
+
+@contextmanager
+def _time_limit(seconds: float):
+    """Interrupt the current worker process once `seconds` have elapsed."""
+    if not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def on_timeout(signum, frame):
+        raise ExtractionError("PDF text extraction timed out")
+
+    previous = signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _open_pdf(source: bytes | str) -> PyPDF2.PdfReader:
+    # A path lets workers read the file themselves instead of receiving a pickled copy
+    return PyPDF2.PdfReader(source if isinstance(source, str) else BytesIO(source))
+
+
+def _count_pages(source: bytes | str, deadline: float) -> int:
+    with _time_limit(max(deadline - time.time(), 0.001)):
+        return len(_open_pdf(source).pages)
+
+
+def _extract_page_range(
+    source: bytes | str, start: int, end: int, deadline: float
+) -> list[tuple[int, str]]:
+    """Extract pages [start, end) in a worker process, page numbers start at 1."""
+    with _time_limit(max(deadline - time.time(), 0.001)):
+        reader = _open_pdf(source)
+        return [
+            (page_index + 1, reader.pages[page_index].extract_text() or "")
+            for page_index in range(start, end)
+        ]
+
+
+class PdfExtractionService:
+    """
+    Extracts PDF text on a pool of worker processes.
+
+    The pages of a document are split into ranges that are extracted in
+    parallel, and pages are handed back as soon as their range is done. Every
+    document is subject to a page limit and a time limit; workers enforce the
+    time limit themselves so a pathological PDF cannot keep one busy.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        pages_per_task: int,
+        max_pages: int,
+        timeout: float,
+    ):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def stream_pages(
+        self, source: bytes | str
+    ) -> AsyncIterator[list[tuple[int, str]]]:
+        """
+        Yield lists of (page number, text) in the order their ranges finish.
+
+        `source` is either the PDF content or the path of a local PDF file.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + self.timeout
+
+        page_count = await loop.run_in_executor(
+            self.executor, _count_pages, source, deadline
+        )
+        if page_count > self.max_pages:
+            raise ExtractionError(
+                f"PDF has {page_count} pages, the maximum allowed is {self.max_pages}"
+            )
+
+        futures = [
+            loop.run_in_executor(
+                self.executor,
+                _extract_page_range,
+                source,
+                start,
+                min(start + self.pages_per_task, page_count),
+                deadline,
+            )
+            for start in range(0, page_count, self.pages_per_task)
+        ]
+
+        try:
+            for next_done in asyncio.as_completed(
+                futures, timeout=max(deadline - time.time(), 0)
+            ):
+                yield await next_done
+        except TimeoutError:
+            raise ExtractionError("PDF text extraction timed out")
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pdf_extraction_service = PdfExtractionService(
+    max_workers=settings.PDF_EXTRACTION_WORKERS,
+    pages_per_task=settings.PDF_PAGES_PER_TASK,
+    max_pages=settings.PDF_MAX_PAGES,
+    timeout=settings.PDF_EXTRACTION_TIMEOUT_SECONDS,
+)
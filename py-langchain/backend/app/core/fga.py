@@ -1,13 +1,78 @@
+import asyncio
+import statistics
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable
+
 from openfga_sdk import ClientConfiguration, OpenFgaClient
 from openfga_sdk.credentials import Credentials, CredentialConfiguration
-from openfga_sdk.client.models import ClientTuple, ClientWriteRequest
+from openfga_sdk.client.models import (
+    ClientBatchCheckItem,
+    ClientBatchCheckRequest,
+    ClientListObjectsRequest,
+    ClientTuple,
+    ClientWriteRequest,
+    ClientWriteRequestOnDuplicateWrites,
+    ClientWriteRequestOnMissingDeletes,
+    ConflictOptions,
+    WriteTransactionOpts,
+)
 
 from app.core.config import settings
+from app.core.metrics import FGA_REQUEST_SECONDS
+
+# Users whose viewable documents are kept in memory
+VIEWABLE_DOCUMENTS_CACHE_SIZE = 1000
+
+# Latencies of the most recent FGA check requests kept for stats
+LATENCY_SAMPLES = 1000
+
+# Most tuples FGA accepts in a single write request
+MAX_TUPLES_PER_WRITE = 100
+
+
+@dataclass(frozen=True)
+class Relation:
+    user_email: str
+    document_id: str
+    relation: str = "viewer"
+
+    def to_tuple(self) -> ClientTuple:
+        return ClientTuple(
+            user=f"user:{self.user_email}",
+            relation=self.relation,
+            object=f"doc:{self.document_id}",
+        )
+
+
+@dataclass
+class RelationWriteFailure:
+    relation: Relation
+    operation: str
+    error: str
 
 
 class AuthorizationManager:
     openfga_client: OpenFgaClient | None = None
 
+    def __init__(self):
+        # user email -> (expiry, ids of the documents the user can view)
+        self._viewable_documents: OrderedDict[str, tuple[float, list[str]]] = (
+            OrderedDict()
+        )
+        # (user email, relation, document id) -> (expiry, allowed)
+        self._decisions: OrderedDict[tuple[str, str, str], tuple[float, bool]] = (
+            OrderedDict()
+        )
+        self.decision_hits = 0
+        self.decision_misses = 0
+        self.checks_sent = 0
+        self.check_requests = 0
+        self._check_latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        # Called with (user email, document id) whenever tuples change
+        self._invalidation_callbacks: list[Callable[[str, str], None]] = []
+
     def connect(self):
         openfga_client_config = ClientConfiguration(
             api_url=settings.FGA_API_URL,
@@ -22,42 +87,239 @@ class AuthorizationManager:
                     client_secret=settings.FGA_CLIENT_SECRET,
                 ),
             ),
+            timeout_millisec=int(settings.HTTP_TIMEOUT_SECONDS * 1000),
+        )
+        # Size of the client's keep-alive connection pool
+        openfga_client_config.connection_pool_maxsize = (
+            settings.HTTP_MAX_CONNECTIONS_PER_HOST
         )
 
         print("Connecting to FGA...")
         self.openfga_client = OpenFgaClient(openfga_client_config)
 
-    async def add_relation(
-        self, user_email: str, document_id: str, relation: str = "owner"
-    ):
+    async def close(self):
+        if self.openfga_client is not None:
+            await self.openfga_client.close()
+            self.openfga_client = None
+
+    def on_invalidate(self, callback: Callable[[str, str], None]):
+        """Also drop what a caller derived from the tuples, when they change."""
+        self._invalidation_callbacks.append(callback)
+
+    def clear(self):
+        """Forget every cached decision and list."""
+        self._viewable_documents.clear()
+        self._decisions.clear()
+        for callback in self._invalidation_callbacks:
+            callback("*", "*")
+
+    def invalidate(self, user_email: str, document_id: str):
+        """Forget everything derived from the tuples of a user on a document."""
+        for callback in self._invalidation_callbacks:
+            callback(user_email, document_id)
+
+        if user_email == "*":
+            self._viewable_documents.clear()
+        else:
+            self._viewable_documents.pop(user_email, None)
+
+        # Relations like can_view are computed from others, drop all of them
+        for key in [
+            key
+            for key in self._decisions
+            if key[2] == document_id and user_email in ("*", key[0])
+        ]:
+            del self._decisions[key]
+
+    async def check_documents(
+        self, user_email: str, document_ids: list[str], relation: str = "can_view"
+    ) -> set[str]:
+        """
+        Return the ids of the documents on which the user has `relation`.
+
+        Every document is checked once no matter how many times it is listed,
+        and decisions are cached for FGA_DECISION_CACHE_TTL_SECONDS.
+        """
+        now = time.monotonic()
+        allowed: set[str] = set()
+        missing: list[str] = []
+
+        for document_id in dict.fromkeys(document_ids):
+            key = (user_email, relation, document_id)
+            cached = self._decisions.get(key)
+            if cached and cached[0] > now:
+                self._decisions.move_to_end(key)
+                self.decision_hits += 1
+                if cached[1]:
+                    allowed.add(document_id)
+            else:
+                self.decision_misses += 1
+                missing.append(document_id)
+
+        if not missing:
+            return allowed
+
+        if self.openfga_client is None:
+            self.connect()
         assert self.openfga_client is not None
-        await self.openfga_client.write(
-            ClientWriteRequest(
-                writes=[
-                    ClientTuple(
+
+        started = time.perf_counter()
+        response = await self.openfga_client.batch_check(
+            ClientBatchCheckRequest(
+                checks=[
+                    ClientBatchCheckItem(
                         user=f"user:{user_email}",
                         relation=relation,
                         object=f"doc:{document_id}",
                     )
+                    for document_id in missing
                 ]
             )
         )
+        elapsed = time.perf_counter() - started
+        self._check_latencies.append(elapsed)
+        FGA_REQUEST_SECONDS.labels("check").observe(elapsed)
+        self.check_requests += 1
+        self.checks_sent += len(missing)
+
+        expires = time.monotonic() + settings.FGA_DECISION_CACHE_TTL_SECONDS
+        for result in response.result:
+            document_id = result.request.object.removeprefix("doc:")
+            if result.error:
+                # Denied for now, but not remembered
+                continue
+            self._decisions[(user_email, relation, document_id)] = (
+                expires,
+                result.allowed,
+            )
+            if result.allowed:
+                allowed.add(document_id)
 
-    async def delete_relation(
-        self, user_email: str, document_id: str, relation: str = "owner"
-    ):
+        while len(self._decisions) > settings.FGA_DECISION_CACHE_SIZE:
+            self._decisions.popitem(last=False)
+
+        return allowed
+
+    async def list_viewable_documents(self, user_email: str) -> list[str]:
+        """
+        Ids of the documents the user can view, cached for a short while.
+
+        Writes through this manager invalidate the user's entry right away, and
+        writes made by other processes once they are announced (see
+        app.core.fga_outbox). The TTL bounds staleness if an announcement is lost.
+        """
+        cached = self._viewable_documents.get(user_email)
+        if cached and cached[0] > time.monotonic():
+            self._viewable_documents.move_to_end(user_email)
+            return cached[1]
+
+        # The graph server never runs the API lifespan that connects the client
+        if self.openfga_client is None:
+            self.connect()
         assert self.openfga_client is not None
-        await self.openfga_client.write(
-            ClientWriteRequest(
-                deletes=[
-                    ClientTuple(
-                        user=f"user:{user_email}",
-                        relation=relation,
-                        object=f"doc:{document_id}",
-                    )
-                ]
+
+        started = time.perf_counter()
+        document_ids = [
+            response.object.removeprefix("doc:")
+            async for response in self.openfga_client.streamed_list_objects(
+                ClientListObjectsRequest(
+                    user=f"user:{user_email}", relation="can_view", type="doc"
+                )
             )
+        ]
+        FGA_REQUEST_SECONDS.labels("list_objects").observe(time.perf_counter() - started)
+
+        self._viewable_documents[user_email] = (
+            time.monotonic() + settings.FGA_LIST_OBJECTS_CACHE_TTL_SECONDS,
+            document_ids,
         )
+        self._viewable_documents.move_to_end(user_email)
+        while len(self._viewable_documents) > VIEWABLE_DOCUMENTS_CACHE_SIZE:
+            self._viewable_documents.popitem(last=False)
+
+        return document_ids
+
+    async def write_relations(
+        self,
+        writes: list[Relation] | None = None,
+        deletes: list[Relation] | None = None,
+    ) -> list[RelationWriteFailure]:
+        """
+        Write and delete many tuples at once.
+
+        Tuples are packed into requests of up to MAX_TUPLES_PER_WRITE that are
+        sent concurrently. Writing an existing tuple or deleting a missing one
+        is not an error, so calls can be retried. Returns the tuples that could
+        not be written; a failed request fails all the tuples it carried.
+        """
+        assert self.openfga_client is not None
+        writes = list(dict.fromkeys(writes or []))
+        deletes = list(dict.fromkeys(deletes or []))
+
+        options = {
+            "transaction": WriteTransactionOpts(
+                disabled=True,
+                max_per_chunk=MAX_TUPLES_PER_WRITE,
+                max_parallel_requests=settings.FGA_WRITE_MAX_PARALLEL_REQUESTS,
+            ),
+            "conflict": ConflictOptions(
+                on_duplicate_writes=ClientWriteRequestOnDuplicateWrites.IGNORE,
+                on_missing_deletes=ClientWriteRequestOnMissingDeletes.IGNORE,
+            ),
+        }
+
+        requests = []
+        if writes:
+            requests.append(
+                self.openfga_client.write(
+                    ClientWriteRequest(writes=[r.to_tuple() for r in writes]), options
+                )
+            )
+        if deletes:
+            requests.append(
+                self.openfga_client.write(
+                    ClientWriteRequest(deletes=[r.to_tuple() for r in deletes]),
+                    options,
+                )
+            )
+        with FGA_REQUEST_SECONDS.labels("write").time():
+            responses = await asyncio.gather(*requests)
+
+        failures = []
+        for response in responses:
+            for operation, results, relations in (
+                ("write", response.writes, writes),
+                ("delete", response.deletes, deletes),
+            ):
+                for relation, result in zip(relations, results or []):
+                    if not result.success:
+                        failures.append(
+                            RelationWriteFailure(relation, operation, str(result.error))
+                        )
+
+        for relation in writes + deletes:
+            self.invalidate(relation.user_email, relation.document_id)
+
+        return failures
+
+    def stats(self) -> dict:
+        lookups = self.decision_hits + self.decision_misses
+        latencies = sorted(self._check_latencies)
+        return {
+            "decision_hits": self.decision_hits,
+            "decision_misses": self.decision_misses,
+            "decision_hit_rate": self.decision_hits / lookups if lookups else 0.0,
+            "decisions_cached": len(self._decisions),
+            "checks_sent": self.checks_sent,
+            "check_requests": self.check_requests,
+            "check_latency_p50_ms": (
+                statistics.median(latencies) * 1000 if latencies else 0.0
+            ),
+            "check_latency_p95_ms": (
+                latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+            ),
+            "viewable_documents_cached": len(self._viewable_documents),
+        }
 
 
 authorization_manager = AuthorizationManager()
@@ -0,0 +1,333 @@
+"""
+Transactional outbox for FGA tuple changes.
+
+Routes record the tuples to write or delete in the fga_outbox table, in the same
+transaction as the document change itself, instead of calling FGA inline. The
+dispatcher drains the table to FGA in batches in the background and retries
+failed tuples with exponential backoff. Writes ignore existing tuples and
+deletes ignore missing ones, so sending an entry twice is harmless.
+
+Once tuples reached FGA the dispatcher announces them on a Postgres channel.
+The LangGraph server, which caches decisions and viewable documents of its
+own, listens to it and drops the affected entries right away.
+"""
+
+import asyncio
+import json
+from contextlib import suppress
+from datetime import datetime, timedelta
+
+import psycopg
+from sqlalchemy import Text, literal, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import Session, col, delete, func, select, update
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.fga import Relation, authorization_manager
+from app.models.fga_outbox import FgaOutboxEntry
+
+# Postgres advisory lock taken while claiming a batch
+OUTBOX_LOCK_ID = 7_146_601
+
+# Longest error message kept on an entry
+MAX_ERROR_LENGTH = 1000
+
+# Postgres channel announcing the (user email, document id) of changed tuples
+INVALIDATION_CHANNEL = "fga_invalidation"
+# Wait before listening again after the connection was lost
+LISTEN_RETRY_SECONDS = 5
+
+TupleKey = tuple[str, str, str]
+
+
+def _key(user_email: str, relation: str, document_id: str) -> TupleKey:
+    return (user_email, relation, str(document_id))
+
+
+def _entry_key(entry: FgaOutboxEntry) -> TupleKey:
+    return _key(entry.user_email, entry.relation, entry.document_id)
+
+
+def enqueue_relations(
+    db_session: Session,
+    writes: list[Relation] | None = None,
+    deletes: list[Relation] | None = None,
+) -> None:
+    """Add tuple changes to the outbox, they are sent once the session commits."""
+    db_session.add_all(
+        FgaOutboxEntry(
+            operation=operation,
+            user_email=relation.user_email,
+            relation=relation.relation,
+            document_id=str(relation.document_id),
+        )
+        for operation, relations in (("write", writes or []), ("delete", deletes or []))
+        for relation in relations
+    )
+
+
+def _claim_batch(batch_size: int, lease_seconds: int) -> list[FgaOutboxEntry]:
+    now = datetime.now()
+    with Session(engine, expire_on_commit=False) as db_session:
+        # Only one batch is in flight across all processes, so the changes of a
+        # tuple reach FGA in the order they were made
+        db_session.exec(select(func.pg_advisory_xact_lock(OUTBOX_LOCK_ID)))
+        in_flight = db_session.exec(
+            select(FgaOutboxEntry.id)
+            .where(col(FgaOutboxEntry.leased_until) > now)
+            .limit(1)
+        ).first()
+        if in_flight is not None:
+            return []
+
+        entries = db_session.exec(
+            select(FgaOutboxEntry)
+            .where(col(FgaOutboxEntry.next_attempt_at) <= now)
+            .order_by(col(FgaOutboxEntry.id))
+            .limit(batch_size)
+        ).all()
+        if entries:
+            db_session.exec(
+                update(FgaOutboxEntry)
+                .where(col(FgaOutboxEntry.id).in_([entry.id for entry in entries]))
+                .values(leased_until=now + timedelta(seconds=lease_seconds))
+            )
+        db_session.commit()
+        return list(entries)
+
+
+def _settle_batch(
+    entries: list[FgaOutboxEntry],
+    latest: dict[TupleKey, FgaOutboxEntry],
+    errors: dict[TupleKey, str],
+) -> None:
+    now = datetime.now()
+    with Session(engine) as db_session:
+        done = [key for key in latest if key not in errors]
+        if done:
+            # Older changes of the same tuples are superseded as well, including
+            # ones still waiting for a retry
+            db_session.exec(
+                delete(FgaOutboxEntry).where(
+                    tuple_(
+                        col(FgaOutboxEntry.user_email),
+                        col(FgaOutboxEntry.relation),
+                        col(FgaOutboxEntry.document_id),
+                    ).in_(done),
+                    col(FgaOutboxEntry.id) <= max(entry.id for entry in entries),
+                )
+            )
+            # Delivered to the listeners when the transaction commits
+            announced = [json.dumps([email, document]) for email, _, document in done]
+            payloads = func.unnest(literal(announced, ARRAY(Text))).table_valued(
+                "payload"
+            )
+            db_session.exec(
+                select(func.pg_notify(INVALIDATION_CHANNEL, payloads.c.payload))
+                .select_from(payloads)
+            )
+
+        for key, error in errors.items():
+            attempts = latest[key].attempts + 1
+            backoff = min(2**attempts, settings.FGA_OUTBOX_MAX_BACKOFF_SECONDS)
+            db_session.exec(
+                update(FgaOutboxEntry)
+                .where(
+                    col(FgaOutboxEntry.id).in_(
+                        [entry.id for entry in entries if _entry_key(entry) == key]
+                    )
+                )
+                .values(
+                    attempts=attempts,
+                    next_attempt_at=now + timedelta(seconds=backoff),
+                    leased_until=None,
+                    last_error=error[:MAX_ERROR_LENGTH],
+                )
+            )
+
+        db_session.commit()
+
+
+class FgaOutboxDispatcher:
+    """Drains the outbox to FGA in the background of the API process."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self.batches = 0
+        self.tuples_sent = 0
+        self.tuples_failed = 0
+        self.last_error: str | None = None
+        self.last_batch_lag_seconds = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    def notify(self):
+        """Dispatch right away instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                claimed = await self.dispatch_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Could not dispatch the FGA outbox: {e}")
+                claimed = 0
+
+            # A full batch means more entries are probably waiting
+            if claimed >= settings.FGA_OUTBOX_BATCH_SIZE:
+                continue
+
+            with suppress(TimeoutError):
+                await asyncio.wait_for(
+                    self._wakeup.wait(), settings.FGA_OUTBOX_POLL_INTERVAL_SECONDS
+                )
+
+    async def dispatch_batch(self) -> int:
+        """Send one batch of outbox entries to FGA, returns how many were claimed."""
+        entries = await asyncio.to_thread(
+            _claim_batch,
+            settings.FGA_OUTBOX_BATCH_SIZE,
+            settings.FGA_OUTBOX_LEASE_SECONDS,
+        )
+        if not entries:
+            return 0
+
+        # Only the latest change of each tuple matters
+        latest: dict[TupleKey, FgaOutboxEntry] = {}
+        for entry in entries:
+            latest[_entry_key(entry)] = entry
+
+        relations = {
+            key: Relation(entry.user_email, entry.document_id, entry.relation)
+            for key, entry in latest.items()
+        }
+        try:
+            failures = await authorization_manager.write_relations(
+                writes=[
+                    relations[key]
+                    for key, entry in latest.items()
+                    if entry.operation == "write"
+                ],
+                deletes=[
+                    relations[key]
+                    for key, entry in latest.items()
+                    if entry.operation == "delete"
+                ],
+            )
+            errors = {
+                _key(
+                    failure.relation.user_email,
+                    failure.relation.relation,
+                    failure.relation.document_id,
+                ): failure.error
+                for failure in failures
+            }
+        except Exception as e:
+            errors = {key: str(e) for key in latest}
+
+        await asyncio.to_thread(_settle_batch, entries, latest, errors)
+
+        self.batches += 1
+        self.tuples_sent += len(latest) - len(errors)
+        self.tuples_failed += len(errors)
+        if errors:
+            self.last_error = next(iter(errors.values()))
+            print(f"Could not send {len(errors)} tuples to FGA: {self.last_error}")
+        self.last_batch_lag_seconds = (
+            datetime.now() - min(entry.created_at for entry in entries)
+        ).total_seconds()
+
+        return len(entries)
+
+    def stats(self) -> dict:
+        with Session(engine) as db_session:
+            depth, oldest, retrying = db_session.exec(
+                select(
+                    func.count(),
+                    func.min(FgaOutboxEntry.created_at),
+                    func.count().filter(col(FgaOutboxEntry.attempts) > 0),
+                )
+            ).one()
+
+        return {
+            "queue_depth": depth,
+            "retrying": retrying,
+            "lag_seconds": (datetime.now() - oldest).total_seconds() if oldest else 0.0,
+            "last_batch_lag_seconds": self.last_batch_lag_seconds,
+            "batches": self.batches,
+            "tuples_sent": self.tuples_sent,
+            "tuples_failed": self.tuples_failed,
+            "last_error": self.last_error,
+        }
+
+
+class FgaInvalidationListener:
+    """Drops the authorization caches of this process as tuples change anywhere."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.invalidations = 0
+        self.connections = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        conninfo = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    conninfo, autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                    # Changes made while nobody was listening went unannounced
+                    authorization_manager.clear()
+                    self.connections += 1
+
+                    async for notification in connection.notifies():
+                        user_email, document_id = json.loads(notification.payload)
+                        authorization_manager.invalidate(user_email, document_id)
+                        self.invalidations += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Could not listen for FGA tuple changes: {e}")
+
+            await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "listening": self._task is not None and not self._task.done(),
+            "connections": self.connections,
+            "invalidations": self.invalidations,
+        }
+
+
+fga_outbox_dispatcher = FgaOutboxDispatcher()
+fga_invalidation_listener = FgaInvalidationListener()
@@ -0,0 +1,223 @@
+"""
+Google Calendar access for the calendar tool.
+
+The Calendar discovery document is parsed once per process and every service
+is built from it, and the blocking client calls run on a bounded thread pool
+instead of the event loop. Events are kept per user: the first lookup lists a
+window of upcoming events and keeps the sync token Google returns, later
+lookups only fetch what changed since then, and events that ended or fall
+past the window are dropped so the kept events don't grow over time. When
+Google expires the token (410 Gone) the window is listed again.
+"""
+
+import asyncio
+import functools
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from google.oauth2.credentials import Credentials
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import Resource, build_from_document
+from googleapiclient.errors import HttpError
+
+from app.core.config import settings
+
+# Largest page events.list returns
+MAX_PAGE_SIZE = 2500
+
+_google_api_executor = ThreadPoolExecutor(
+    max_workers=settings.GOOGLE_API_MAX_WORKERS, thread_name_prefix="google-api"
+)
+
+
+async def run_google_api(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking Google API client call on the shared thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_google_api_executor, functools.partial(fn, *args))
+
+
+@functools.cache
+def calendar_discovery_document() -> dict:
+    # Bundled with the client library, building a service from the parsed
+    # document skips reading and decoding it again
+    return json.loads(discovery_cache.get_static_doc("calendar", "v3"))
+
+
+def build_calendar_service(access_token: str) -> Resource:
+    return build_from_document(
+        calendar_discovery_document(),
+        credentials=Credentials(access_token),
+        client_options=(
+            {"api_endpoint": settings.GOOGLE_CALENDAR_API_URL}
+            if settings.GOOGLE_CALENDAR_API_URL
+            else None
+        ),
+    )
+
+
+def parse_event_time(value: dict) -> datetime:
+    if "dateTime" in value:
+        return datetime.fromisoformat(value["dateTime"])
+    # All day events only have a date
+    return datetime.fromisoformat(value["date"]).replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class CalendarSyncState:
+    events: dict[str, dict]
+    sync_token: str | None
+    window_end: datetime
+
+
+def _list_events(service: Resource, **params) -> tuple[list[dict], str | None]:
+    """Follow all pages of an events.list call, returns the items and the next sync token."""
+    items: list[dict] = []
+    page_token = None
+    while True:
+        response = (
+            service.events()
+            .list(
+                calendarId="primary",
+                pageToken=page_token,
+                maxResults=MAX_PAGE_SIZE,
+                singleEvents=True,
+                **params,
+            )
+            .execute()
+        )
+        items.extend(response.get("items", []))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return items, response.get("nextSyncToken")
+
+
+def full_sync(access_token: str, window_days: int) -> CalendarSyncState:
+    now = datetime.now(timezone.utc)
+    window_end = now + timedelta(days=window_days)
+    items, sync_token = _list_events(
+        build_calendar_service(access_token),
+        timeMin=now.isoformat(),
+        timeMax=window_end.isoformat(),
+    )
+    return CalendarSyncState(
+        events={
+            event["id"]: event for event in items if event.get("status") != "cancelled"
+        },
+        sync_token=sync_token,
+        window_end=window_end,
+    )
+
+
+def prune_events(state: CalendarSyncState, now: datetime) -> None:
+    """Drop the events that ended or start after the window, they are never read."""
+    state.events = {
+        event_id: event
+        for event_id, event in state.events.items()
+        if "start" in event
+        and parse_event_time(event.get("end", event["start"])) > now
+        and parse_event_time(event["start"]) < state.window_end
+    }
+
+
+def incremental_sync(access_token: str, state: CalendarSyncState) -> int:
+    """Apply the changes made since the last sync, returns how many there were."""
+    # Time bounds cannot be combined with a sync token, the window is applied
+    # when the events are read
+    items, sync_token = _list_events(
+        build_calendar_service(access_token), syncToken=state.sync_token
+    )
+    for event in items:
+        if event.get("status") == "cancelled":
+            state.events.pop(event["id"], None)
+        else:
+            state.events[event["id"]] = event
+    state.sync_token = sync_token
+    prune_events(state, datetime.now(timezone.utc))
+    return len(items)
+
+
+class CalendarEventCache:
+    """Upcoming events of each user, kept up to date with incremental syncs."""
+
+    def __init__(self, max_size: int, window_days: int):
+        self.max_size = max_size
+        self.window_days = window_days
+        self._states: OrderedDict[str, CalendarSyncState] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.expired_sync_tokens = 0
+        self.changes_received = 0
+
+    async def _sync(
+        self, user_key: str, access_token: str, days: int
+    ) -> CalendarSyncState:
+        state = self._states.get(user_key)
+        now = datetime.now(timezone.utc)
+
+        if (
+            state is not None
+            and state.sync_token
+            and now + timedelta(days=days) <= state.window_end
+        ):
+            try:
+                self.changes_received += await run_google_api(
+                    incremental_sync, access_token, state
+                )
+                self.incremental_syncs += 1
+                return state
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                self.expired_sync_tokens += 1
+
+        state = await run_google_api(
+            full_sync, access_token, max(self.window_days, days)
+        )
+        self.full_syncs += 1
+        return state
+
+    async def upcoming_events(
+        self, user_key: str, access_token: str, days: int = 7, limit: int = 5
+    ) -> list[dict]:
+        """The user's next events that have not ended yet, soonest first."""
+        lock = self._locks.setdefault(user_key, asyncio.Lock())
+        async with lock:
+            state = await self._sync(user_key, access_token, days)
+            self._states[user_key] = state
+            self._states.move_to_end(user_key)
+            while len(self._states) > self.max_size:
+                evicted, _ = self._states.popitem(last=False)
+                self._locks.pop(evicted, None)
+
+            now = datetime.now(timezone.utc)
+            until = now + timedelta(days=days)
+            upcoming = [
+                event
+                for event in state.events.values()
+                if "start" in event
+                and parse_event_time(event.get("end", event["start"])) > now
+                and parse_event_time(event["start"]) < until
+            ]
+
+        upcoming.sort(key=lambda event: parse_event_time(event["start"]))
+        return upcoming[:limit]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._states),
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "expired_sync_tokens": self.expired_sync_tokens,
+            "changes_received": self.changes_received,
+        }
+
+
+calendar_event_cache = CalendarEventCache(
+    max_size=settings.GOOGLE_CALENDAR_CACHE_SIZE,
+    window_days=settings.GOOGLE_CALENDAR_SYNC_WINDOW_DAYS,
+)
@@ -0,0 +1,158 @@
+"""
+Shared HTTP clients for the upstream services the app talks to.
+
+Every upstream gets one pooled httpx client that is reused by all requests and
+tool calls, so connections are kept alive instead of paying a TCP and TLS
+handshake per call. The API creates the clients up front, the LangGraph server
+lazily on first use, and both close them in their lifespan. A client is bound
+to the event loop it was created on: when another loop asks for it, e.g. in
+the benchmarks and tests, a new client is created, and every client is closed
+on its own loop when that loop shuts down.
+"""
+
+import asyncio
+from contextlib import suppress
+from dataclasses import dataclass
+
+import httpx
+
+from app.core.config import settings
+
+
+def _h2_importable() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError as e:
+        print(f"Warning: HTTP2_ENABLED is set but h2 is missing, using HTTP/1.1: {e}")
+        return False
+    return True
+
+
+HTTP2_ENABLED = settings.HTTP2_ENABLED and _h2_importable()
+
+
+async def _close_with_loop(client: httpx.AsyncClient):
+    """Close a client once its loop shuts down, asyncio.run cancels the tasks left."""
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await client.aclose()
+
+
+async def _aclose_quietly(client: httpx.AsyncClient):
+    # A client whose loop is closed can't shut its connections down anymore
+    with suppress(RuntimeError):
+        await client.aclose()
+
+
+@dataclass
+class UpstreamOptions:
+    max_connections: int
+    max_keepalive_connections: int
+    connect_timeout: float
+    # None disables the read timeout, for streamed responses
+    read_timeout: float | None
+    http2: bool = True
+
+
+def default_options(**overrides) -> UpstreamOptions:
+    options = UpstreamOptions(
+        max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        connect_timeout=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=settings.HTTP_TIMEOUT_SECONDS,
+    )
+    for name, value in overrides.items():
+        setattr(options, name, value)
+    return options
+
+
+class HttpClientRegistry:
+    def __init__(self):
+        self._options: dict[str, UpstreamOptions] = {}
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._loops: dict[str, asyncio.AbstractEventLoop] = {}
+        self._guards: dict[str, asyncio.Task] = {}
+        # Clients of idle loops that are no longer used, closed on shutdown
+        self._stale: list[httpx.AsyncClient] = []
+
+    def register(self, name: str, options: UpstreamOptions):
+        self._options[name] = options
+
+    def _create(self, options: UpstreamOptions) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=options.http2 and HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=options.max_connections,
+                max_keepalive_connections=options.max_keepalive_connections,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(
+                options.read_timeout,
+                connect=options.connect_timeout,
+                pool=options.connect_timeout,
+            ),
+        )
+
+    def _retire(self, name: str):
+        """Close the client of another loop, on that loop when it still runs."""
+        client = self._clients.pop(name)
+        loop = self._loops.pop(name)
+        guard = self._guards.pop(name)
+        if client.is_closed:
+            return
+        if loop.is_running():
+            # The loop of another thread
+            loop.call_soon_threadsafe(guard.cancel)
+        elif not loop.is_closed():
+            self._stale.append(client)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """The pooled client of an upstream, created on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(name)
+        # Connections belong to the event loop that opened them
+        if client is None or client.is_closed or self._loops[name] is not loop:
+            if client is not None:
+                self._retire(name)
+            client = self._create(self._options.get(name) or default_options())
+            self._clients[name] = client
+            self._loops[name] = loop
+            self._guards[name] = loop.create_task(_close_with_loop(client))
+        return client
+
+    def start(self):
+        """Create the clients of all registered upstreams up front."""
+        for name in self._options:
+            self.get(name)
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        guards = [
+            guard for name, guard in self._guards.items() if self._loops[name] is loop
+        ]
+        others = [
+            client
+            for name, client in self._clients.items()
+            if self._loops[name] is not loop
+        ]
+        others.extend(self._stale)
+        self._clients.clear()
+        self._loops.clear()
+        self._guards.clear()
+        self._stale.clear()
+        for guard in guards:
+            guard.cancel()
+        await asyncio.gather(
+            *guards,
+            *(_aclose_quietly(client) for client in others),
+            return_exceptions=True,
+        )
+
+
+http_clients = HttpClientRegistry()
+
+http_clients.register("auth0", default_options())
+http_clients.register("shop", default_options())
+# Agent runs stream for as long as the model keeps talking
+http_clients.register("langgraph", default_options(read_timeout=None, http2=False))
@@ -0,0 +1,397 @@
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from enum import Enum
+from functools import partial
+from io import BytesIO
+from typing import Any, Callable
+
+import PyPDF2
+from langchain_core.documents import Document as LCDocument
+from sqlmodel import Session, col, delete, select, update
+
+from app.core.answer_cache import invalidate_answers
+from app.core.config import settings
+from app.core.extraction import pdf_extraction_service
+from app.core.db import engine
+from app.core.chunking import chunk_pages, get_chunking_config
+from app.core.rag import embed_chunks
+from app.core.storage import blob_store
+from app.models.documents import Document, DocumentShare
+from app.models.embeddings import Embedding
+
+# Finished jobs are kept around for a while so clients can poll their outcome,
+# after that the status is served from the document row.
+FINISHED_JOB_RETENTION = timedelta(hours=1)
+
+# How often documents left processing by a stopped worker are looked for
+RECOVERY_INTERVAL_SECONDS = 60
+
+# Documents being processed are touched this many times per stale period, so
+# that long extractions or embeddings are not claimed by another worker
+HEARTBEATS_PER_STALE_PERIOD = 4
+
+
+class IngestionStage(str, Enum):
+    QUEUED = "queued"
+    EXTRACTING = "extracting"
+    CHUNKING = "chunking"
+    EMBEDDING = "embedding"
+    PERSISTING = "persisting"
+    READY = "ready"
+    FAILED = "failed"
+
+
+@dataclass
+class IngestionJob:
+    document_id: uuid.UUID
+    file_name: str
+    file_type: str
+    user_email: str
+    stage: IngestionStage = IngestionStage.QUEUED
+    pages_extracted: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    error: str | None = None
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
+
+    @property
+    def status(self) -> str:
+        if self.stage in (IngestionStage.READY, IngestionStage.FAILED):
+            return self.stage.value
+        return "processing"
+
+    def advance(self, stage: IngestionStage):
+        self.stage = stage
+        self.updated_at = datetime.now()
+
+
+class _WorkerPool:
+    """Runs blocking work for one pipeline stage on its own bounded thread pool."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f"ingestion-{name}"
+        )
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(fn, *args))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pages(
+    file_type: str, binary_content: bytes
+) -> list[tuple[int | None, str]]:
+    """Extract the text of an uploaded document as (page number, text) pairs."""
+    if file_type == "application/pdf":
+        pdf_reader = PyPDF2.PdfReader(BytesIO(binary_content))
+        return [
+            (page_number, page.extract_text())
+            for page_number, page in enumerate(pdf_reader.pages, start=1)
+        ]
+
+    return [(None, binary_content.decode("utf-8"))]
+
+
+def read_blob(content_ref: str) -> bytes:
+    with blob_store.open(content_ref) as blob:
+        return blob.read()
+
+
+def extract_blob_pages(
+    file_type: str, content_ref: str
+) -> list[tuple[int | None, str]]:
+    return extract_pages(file_type, read_blob(content_ref))
+
+
+def persist_embeddings(document_id: uuid.UUID, embeddings: list) -> None:
+    """Replace the embeddings of a document, a second run never duplicates them."""
+    with Session(engine) as db_session:
+        db_session.exec(
+            delete(Embedding).where(col(Embedding.document_id) == document_id)
+        )
+        if len(embeddings) > 0:
+            db_session.add_all(embeddings)
+        db_session.commit()
+
+
+def touch_document(document_id: uuid.UUID) -> None:
+    """Keep a document that is still processing from looking stale."""
+    with Session(engine) as db_session:
+        db_session.exec(
+            update(Document)
+            .where(
+                col(Document.id) == document_id,
+                col(Document.status) == "processing",
+            )
+            .values(updated_at=datetime.now())
+        )
+        db_session.commit()
+
+
+def set_document_status(
+    document_id: uuid.UUID, status: str, error: str | None = None
+) -> None:
+    with Session(engine) as db_session:
+        db_session.exec(
+            update(Document)
+            .where(col(Document.id) == document_id)
+            .values(status=status, error=error, updated_at=datetime.now())
+        )
+        if status == IngestionStage.READY.value:
+            # The document is searchable from now on, earlier answers may miss it
+            owner = db_session.exec(
+                select(Document.user_email).where(col(Document.id) == document_id)
+            ).first()
+            shared_with = db_session.exec(
+                select(DocumentShare.user_email).where(
+                    col(DocumentShare.document_id) == document_id
+                )
+            ).all()
+            invalidate_answers(
+                db_session, user_emails=[email for email in (owner, *shared_with) if email]
+            )
+        db_session.commit()
+
+
+def claim_stale_documents(
+    stale_after: timedelta, running: list[uuid.UUID]
+) -> tuple[list, int]:
+    """
+    Take over the documents that stayed processing for `stale_after`.
+
+    Their updated_at is bumped in the same statement, so other workers do
+    not claim them too, and any embeddings of the interrupted run are
+    dropped. Workers touch the documents they process while they run, see
+    IngestionPipeline._heartbeat, so only abandoned documents turn stale. Documents from before the blob store cannot be processed again
+    and are marked failed. Returns the claimed rows and the number failed.
+    """
+    now = datetime.now()
+    stale = (col(Document.status) == "processing") & (
+        col(Document.updated_at) < now - stale_after
+    )
+    if running:
+        stale &= col(Document.id).not_in(running)
+
+    with Session(engine) as db_session:
+        failed = db_session.exec(
+            update(Document)
+            .where(stale, col(Document.content_ref).is_(None))
+            .values(
+                status=IngestionStage.FAILED.value,
+                error="Processing was interrupted",
+                updated_at=now,
+            )
+        ).rowcount
+        claimed = db_session.exec(
+            update(Document)
+            .where(stale)
+            .values(updated_at=now)
+            .returning(
+                Document.id,
+                Document.file_name,
+                Document.file_type,
+                Document.user_email,
+                Document.content_ref,
+            )
+        ).all()
+        if claimed:
+            db_session.exec(
+                delete(Embedding).where(
+                    col(Embedding.document_id).in_([row.id for row in claimed])
+                )
+            )
+        db_session.commit()
+    return claimed, failed
+
+
+class IngestionPipeline:
+    """
+    Processes uploaded documents in the background.
+
+    Every document goes through extract -> chunk -> embed -> persist, the owner
+    tuple is queued in the FGA outbox by the upload itself.
+    Each stage has its own concurrency limit so a burst of large PDFs cannot
+    starve embedding or persistence of other documents, and none of the
+    blocking work runs on the event loop.
+    """
+
+    def __init__(self):
+        self.jobs: dict[uuid.UUID, IngestionJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._extract = _WorkerPool("extract", settings.INGESTION_EXTRACT_CONCURRENCY)
+        self._chunk = _WorkerPool("chunk", settings.INGESTION_CHUNK_CONCURRENCY)
+        self._embed = asyncio.Semaphore(settings.INGESTION_EMBED_CONCURRENCY)
+        self._persist = _WorkerPool("persist", settings.INGESTION_PERSIST_CONCURRENCY)
+        self._recovery_task: asyncio.Task | None = None
+
+    def _prune_finished_jobs(self):
+        cutoff = datetime.now() - FINISHED_JOB_RETENTION
+        for document_id, job in list(self.jobs.items()):
+            if job.status != "processing" and job.updated_at < cutoff:
+                del self.jobs[document_id]
+
+    def submit(
+        self,
+        document_id: uuid.UUID,
+        file_name: str,
+        file_type: str,
+        user_email: str,
+        content_ref: str,
+    ) -> IngestionJob:
+        self._prune_finished_jobs()
+
+        job = IngestionJob(
+            document_id=document_id,
+            file_name=file_name,
+            file_type=file_type,
+            user_email=user_email,
+        )
+        self.jobs[document_id] = job
+
+        task = asyncio.create_task(self._run(job, content_ref))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return job
+
+    def get_job(self, document_id: uuid.UUID) -> IngestionJob | None:
+        return self.jobs.get(document_id)
+
+    async def recover(self) -> int:
+        """Queue again the documents whose processing was interrupted."""
+        running = [
+            document_id
+            for document_id, job in self.jobs.items()
+            if job.status == "processing"
+        ]
+        claimed, failed = await self._persist.run(
+            claim_stale_documents,
+            timedelta(seconds=settings.INGESTION_STALE_AFTER_SECONDS),
+            running,
+        )
+        for row in claimed:
+            self.submit(
+                document_id=row.id,
+                file_name=row.file_name,
+                file_type=row.file_type,
+                user_email=row.user_email,
+                content_ref=row.content_ref,
+            )
+        if claimed or failed:
+            print(f"Requeued {len(claimed)} interrupted documents, {failed} failed")
+        return len(claimed)
+
+    async def _recover_periodically(self):
+        while True:
+            try:
+                await self.recover()
+            except Exception as e:
+                print(f"Could not requeue interrupted documents: {e}")
+            await asyncio.sleep(RECOVERY_INTERVAL_SECONDS)
+
+    def start(self):
+        """Look for documents left processing by stopped workers, now and periodically."""
+        if self._recovery_task is None:
+            self._recovery_task = asyncio.create_task(self._recover_periodically())
+
+    async def _extract_and_chunk(
+        self, job: IngestionJob, content_ref: str
+    ) -> list[LCDocument]:
+        config = get_chunking_config(job.file_type)
+
+        if job.file_type != "application/pdf":
+            pages = await self._extract.run(extract_blob_pages, job.file_type, content_ref)
+            job.pages_extracted = len(pages)
+            job.advance(IngestionStage.CHUNKING)
+            return await self._chunk.run(chunk_pages, pages, config)
+
+        # Extraction workers read local blobs from disk themselves
+        source = blob_store.local_path(content_ref) or await self._extract.run(
+            read_blob, content_ref
+        )
+
+        # PDF pages are chunked as soon as their range has been extracted
+        chunking: list[tuple[int, asyncio.Task]] = []
+        async for pages in pdf_extraction_service.stream_pages(source):
+            job.pages_extracted += len(pages)
+            chunking.append(
+                (
+                    pages[0][0] if pages else 0,
+                    asyncio.ensure_future(self._chunk.run(chunk_pages, pages, config)),
+                )
+            )
+
+        job.advance(IngestionStage.CHUNKING)
+        chunking.sort(key=lambda item: item[0])
+        chunk_lists = await asyncio.gather(*(task for _, task in chunking))
+        return [chunk for chunk_list in chunk_lists for chunk in chunk_list]
+
+    async def _heartbeat(self, document_id: uuid.UUID):
+        interval = settings.INGESTION_STALE_AFTER_SECONDS / HEARTBEATS_PER_STALE_PERIOD
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Not on the persist pool, a backlog there must not delay it
+                await asyncio.to_thread(touch_document, document_id)
+            except Exception as e:
+                print(f"Could not touch document {document_id}: {e}")
+
+    async def _run(self, job: IngestionJob, content_ref: str):
+        heartbeat = asyncio.create_task(self._heartbeat(job.document_id))
+        try:
+            job.advance(IngestionStage.EXTRACTING)
+            chunks = await self._extract_and_chunk(job, content_ref)
+            job.chunks_total = len(chunks)
+
+            job.advance(IngestionStage.EMBEDDING)
+            async with self._embed:
+                embeddings = await embed_chunks(
+                    job.document_id, job.file_name, chunks
+                )
+            job.chunks_embedded = len(embeddings)
+
+            job.advance(IngestionStage.PERSISTING)
+            await self._persist.run(persist_embeddings, job.document_id, embeddings)
+
+            await self._persist.run(
+                set_document_status, job.document_id, IngestionStage.READY.value
+            )
+            job.advance(IngestionStage.READY)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.error = str(e)
+            job.advance(IngestionStage.FAILED)
+            print(f"Ingestion of document {job.document_id} failed: {e}")
+            try:
+                await self._persist.run(
+                    set_document_status,
+                    job.document_id,
+                    IngestionStage.FAILED.value,
+                    job.error,
+                )
+            except Exception as status_error:
+                print(f"Could not record failure of {job.document_id}: {status_error}")
+        finally:
+            heartbeat.cancel()
+
+    async def shutdown(self):
+        if self._recovery_task is not None:
+            self._recovery_task.cancel()
+            self._recovery_task = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        for pool in (self._extract, self._chunk, self._persist):
+            pool.shutdown()
+
+
+ingestion_pipeline = IngestionPipeline()
@@ -0,0 +1,202 @@
+"""
+Prometheus metrics of the backend's hot paths.
+
+The API (at /metrics) and the LangGraph server (at /assistant0/metrics, its own
+/metrics are LangGraph's) each serve the metrics of the code running in them:
+request durations, proxy time to first byte and bytes streamed, embedding and
+FGA timings in the API; tool durations, vector search and FGA timings in the
+LangGraph server. The stats() of the caches and
+background workers of each process are exported as gauges next to them.
+
+With METRICS_ENABLED off every metric below is a no-op and instrumented code
+only pays for a method call.
+"""
+
+import time
+from contextlib import nullcontext
+from typing import Callable
+
+from app.core.config import settings
+
+
+def _prometheus_importable() -> bool:
+    try:
+        import prometheus_client  # noqa: F401
+    except ImportError as e:
+        print(f"Warning: METRICS_ENABLED is set but prometheus_client is missing: {e}")
+        return False
+    return True
+
+
+METRICS_ENABLED = settings.METRICS_ENABLED and _prometheus_importable()
+
+NAMESPACE = "assistant0"
+
+# Seconds, from cache hits to long model and upstream calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def observe(self, amount: float):
+        pass
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def time(self):
+        return nullcontext()
+
+
+_NOOP = _NoopMetric()
+
+
+def _histogram(name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+    if not METRICS_ENABLED:
+        return _NOOP
+    from prometheus_client import Histogram
+
+    return Histogram(
+        name, documentation, labelnames, namespace=NAMESPACE, buckets=LATENCY_BUCKETS
+    )
+
+
+def _counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+    if not METRICS_ENABLED:
+        return _NOOP
+    from prometheus_client import Counter
+
+    return Counter(name, documentation, labelnames, namespace=NAMESPACE)
+
+
+HTTP_REQUEST_SECONDS = _histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, streamed bodies included",
+    ("method", "route", "status"),
+)
+AGENT_PROXY_FIRST_BYTE_SECONDS = _histogram(
+    "agent_proxy_first_byte_seconds",
+    "Time from receiving a LangGraph request to the first byte of its upstream response",
+    ("method",),
+)
+AGENT_PROXY_BYTES = _counter(
+    "agent_proxy_streamed_bytes",
+    "Bytes of LangGraph responses streamed to clients",
+    ("method",),
+)
+EMBEDDING_SECONDS = _histogram(
+    "embedding_duration_seconds", "Time to embed the chunks of a document"
+)
+EMBEDDING_CHUNKS = _counter("embedding_chunks", "Chunks embedded, from the cache or not")
+EMBEDDING_API_TOKENS = _counter(
+    "embedding_api_tokens", "Tokens sent to the embedding API"
+)
+VECTOR_SEARCH_SECONDS = _histogram(
+    "vector_search_duration_seconds",
+    "Time of the pgvector similarity searches of the retrieval tool",
+    ("mode",),
+)
+FGA_REQUEST_SECONDS = _histogram(
+    "fga_request_duration_seconds",
+    "Time of the requests sent to FGA",
+    ("operation",),
+)
+TOOL_CALL_SECONDS = _histogram(
+    "agent_tool_duration_seconds",
+    "Time of the agent's tool calls that ran",
+    ("tool", "outcome"),
+)
+TOOL_CACHE_HITS = _counter(
+    "agent_tool_cache_hits", "Tool calls answered from the result cache", ("tool",)
+)
+
+
+class _StatsCollector:
+    """Exports the stats() of the process's components as gauges."""
+
+    def __init__(self):
+        self.sources: dict[str, Callable[[], dict]] = {}
+
+    @staticmethod
+    def _flatten(prefix: str, value) -> list[tuple[str, float]]:
+        if isinstance(value, dict):
+            return [
+                item
+                for key, nested in value.items()
+                for item in _StatsCollector._flatten(
+                    f"{prefix}_{key}" if prefix else str(key), nested
+                )
+            ]
+        # bool is an int, strings and missing values have no number
+        if isinstance(value, (int, float)):
+            return [(prefix, float(value))]
+        return []
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        gauge = GaugeMetricFamily(
+            f"{NAMESPACE}_component_stat",
+            "Values reported by the stats() of caches and background workers",
+            labels=["component", "stat"],
+        )
+        for component, stats in self.sources.items():
+            try:
+                values = self._flatten("", stats())
+            except Exception as e:
+                print(f"Could not collect the stats of {component}: {e}")
+                continue
+            for stat, value in values:
+                gauge.add_metric([component, stat], value)
+        yield gauge
+
+
+_stats_collector = _StatsCollector()
+if METRICS_ENABLED:
+    from prometheus_client import REGISTRY
+
+    REGISTRY.register(_stats_collector)
+
+
+def register_stats(component: str, stats: Callable[[], dict]):
+    """Export the values of `stats()` under the component's name."""
+    _stats_collector.sources[component] = stats
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """The metrics in the Prometheus text format, and its content type."""
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class RequestMetricsMiddleware:
+    """Times every request by the route it matched, until its body is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The route template, so ids in paths do not make new series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(
+                time.perf_counter() - started
+            )
@@ -1,11 +1,18 @@
+import asyncio
+import time
 import uuid
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document as LCDocument
 from langchain_openai import OpenAIEmbeddings
 from langchain_postgres import PGVectorStore, PGEngine
 from pydantic import SecretStr
 
+from app.core.chunking import chunk_text, get_chunking_config
 from app.core.config import settings
 from app.core.db import engine
+from app.core.embedding_batcher import EmbeddingBatcher
+from app.core.embedding_cache import QueryEmbeddingCache, embedding_cache
+from app.core.metrics import EMBEDDING_CHUNKS, EMBEDDING_SECONDS
+from app.core.vector_index import get_index_query_options
 from app.models.embeddings import Embedding
 
 embedding_model = OpenAIEmbeddings(
@@ -13,28 +20,43 @@ embedding_model = OpenAIEmbeddings(
     api_key=SecretStr(settings.OPENAI_API_KEY),
 )
 
+embedding_batcher = EmbeddingBatcher(
+    embedding_model,
+    max_batch_tokens=settings.EMBEDDING_BATCH_MAX_TOKENS,
+    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+    max_wait=settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000,
+    max_concurrency=settings.EMBEDDING_MAX_CONCURRENT_REQUESTS,
+)
+
+query_embedding_cache = QueryEmbeddingCache(
+    embedding_model, max_size=settings.QUERY_EMBEDDING_CACHE_SIZE
+)
+
 vector_store: PGVectorStore | None = None
+_vector_store_lock = asyncio.Lock()
 
 
-def generate_embeddings(
-    document_id: uuid.UUID, file_name: str, text: str
+async def embed_chunks(
+    document_id: uuid.UUID, file_name: str, chunks: list[LCDocument]
 ) -> list[Embedding]:
-    """Generate embeddings for a document."""
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=100,
-        chunk_overlap=10,
-        length_function=len,
-    )
+    """Embed the chunks of a document."""
+    if not chunks:
+        return []
 
-    chunks = splitter.create_documents([text])
-    embeddings = embedding_model.embed_documents(
-        [chunk.page_content for chunk in chunks]
+    started = time.perf_counter()
+    embeddings = await embedding_cache.aembed_documents(
+        embedding_model.model,
+        [chunk.page_content for chunk in chunks],
+        embedding_batcher.embed,
     )
+    EMBEDDING_SECONDS.observe(time.perf_counter() - started)
+    EMBEDDING_CHUNKS.inc(len(chunks))
 
     return [
         Embedding(
             document_id=document_id,
             meta={
+                **chunk.metadata,
                 "file_name": file_name,
                 "document_id": str(document_id),
             },
@@ -45,14 +67,30 @@ def generate_embeddings(
     ]
 
 
+async def generate_embeddings(
+    document_id: uuid.UUID, file_name: str, text: str, file_type: str = "text/plain"
+) -> list[Embedding]:
+    """Generate embeddings for a document."""
+    chunks = chunk_text(text, get_chunking_config(file_type))
+    return await embed_chunks(document_id, file_name, chunks)
+
+
 async def get_vector_store():
     global vector_store
 
     if vector_store is not None:
         return vector_store
 
+    async with _vector_store_lock:
+        if vector_store is None:
+            vector_store = await _create_vector_store()
+
+    return vector_store
+
+
+async def _create_vector_store() -> PGVectorStore:
     pg_engine = PGEngine.from_connection_string(settings.DATABASE_URL)
-    vector_store = await PGVectorStore.create(
+    return await PGVectorStore.create(
         engine=pg_engine,
         table_name="embedding",
         embedding_service=embedding_model,
@@ -60,6 +98,5 @@ async def get_vector_store():
         embedding_column="embedding",
         content_column="content",
         metadata_json_column="meta",
+        index_query_options=get_index_query_options(),
     )
-
-    return vector_store
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from app.core.config import settings
+
+
+class BlobTooLargeError(Exception):
+    pass
+
+
+@dataclass
+class StoredBlob:
+    key: str
+    size: int
+    sha256: str
+
+
+class BlobWriter(ABC):
+    """Receives the content of one blob chunk by chunk, hashing it on the fly."""
+
+    def __init__(self, max_size: int | None = None):
+        self.max_size = max_size
+        self.size = 0
+        self.hash = hashlib.sha256()
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise BlobTooLargeError(
+                f"Blob exceeds the maximum allowed size of {self.max_size} bytes"
+            )
+        self.hash.update(data)
+        self._write(data)
+
+    @abstractmethod
+    def _write(self, data: bytes) -> None: ...
+
+    @abstractmethod
+    def commit(self) -> StoredBlob: ...
+
+    @abstractmethod
+    def abort(self) -> None: ...
+
+
+class BlobStore(ABC):
+    """Content-addressed storage for document content, blobs are keyed by their sha256."""
+
+    @abstractmethod
+    def writer(self, max_size: int | None = None) -> BlobWriter: ...
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO: ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+    def local_path(self, key: str) -> str | None:
+        """Path of the blob on the local filesystem, if the backend has one."""
+        return None
+
+
+class _LocalBlobWriter(BlobWriter):
+    def __init__(self, store: "LocalBlobStore", max_size: int | None):
+        super().__init__(max_size)
+        self.store = store
+        self.file = tempfile.NamedTemporaryFile(
+            dir=store.tmp_dir, prefix="upload-", delete=False
+        )
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+
+    def commit(self) -> StoredBlob:
+        self.file.close()
+        sha256 = self.hash.hexdigest()
+        path = self.store.path(sha256)
+
+        if path.exists():
+            # Same content was stored before
+            os.unlink(self.file.name)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.file.name, path)
+
+        return StoredBlob(key=sha256, size=self.size, sha256=sha256)
+
+    def abort(self) -> None:
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.unlink(self.file.name)
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+        self.tmp_dir = self.root / "tmp"
+
+    def path(self, key: str) -> Path:
+        if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+            raise ValueError(f"Invalid blob key: {key}")
+        return self.root / key[:2] / key[2:4] / key
+
+    def writer(self, max_size: int | None = None) -> BlobWriter:
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        return _LocalBlobWriter(self, max_size)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def local_path(self, key: str) -> str | None:
+        return str(self.path(key))
+
+
+def create_blob_store() -> BlobStore:
+    if settings.BLOB_STORE_BACKEND == "local":
+        return LocalBlobStore(settings.BLOB_STORE_PATH)
+
+    raise ValueError(f"Unknown blob store backend: {settings.BLOB_STORE_BACKEND}")
+
+
+blob_store = create_blob_store()
@@ -0,0 +1,181 @@
+import asyncio
+from dataclasses import dataclass
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.storage import BlobStore, BlobTooLargeError, BlobWriter, StoredBlob
+
+# Room for the multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadTooLargeError(UploadError):
+    pass
+
+
+@dataclass
+class StreamedUpload:
+    file_name: str
+    content_type: str
+    writer: BlobWriter
+
+    @property
+    def sha256(self) -> str:
+        return self.writer.hash.hexdigest()
+
+    async def commit(self) -> StoredBlob:
+        """Move the received file into the blob store."""
+        try:
+            return await asyncio.to_thread(self.writer.commit)
+        except BaseException:
+            self.writer.abort()
+            raise
+
+    def abort(self) -> None:
+        self.writer.abort()
+
+
+class _UploadReceiver:
+    """Callbacks for the multipart parser that forward the file part to a blob writer."""
+
+    def __init__(
+        self,
+        blob_store: BlobStore,
+        field_name: str,
+        max_size: int,
+        allowed_types: list[str] | None,
+    ):
+        self.blob_store = blob_store
+        self.field_name = field_name
+        self.max_size = max_size
+        self.allowed_types = allowed_types
+
+        self.header_name = b""
+        self.header_value = b""
+        self.part_headers: dict[bytes, bytes] = {}
+        self.in_file_part = False
+
+        self.file_name: str | None = None
+        self.content_type: str | None = None
+        self.writer: BlobWriter | None = None
+        self.pending: list[bytes] = []
+
+    def on_part_begin(self):
+        self.part_headers = {}
+        self.in_file_part = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.part_headers[self.header_name.lower()] = self.header_value
+        self.header_name = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(
+            self.part_headers.get(b"content-disposition")
+        )
+        if options.get(b"name", b"").decode() != self.field_name:
+            return
+        if b"filename" not in options or self.writer is not None:
+            raise UploadError(f"Expected a single file in the '{self.field_name}' field")
+
+        self.file_name = options[b"filename"].decode("utf-8", errors="replace")
+        self.content_type = (
+            self.part_headers.get(b"content-type", b"application/octet-stream")
+            .decode("latin-1")
+            .split(";")[0]
+            .strip()
+        )
+        if self.allowed_types is not None and self.content_type not in self.allowed_types:
+            raise UploadError(
+                f"Invalid file type. Allowed file types are: {','.join(self.allowed_types)}"
+            )
+
+        self.writer = self.blob_store.writer(max_size=self.max_size)
+        self.in_file_part = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.in_file_part:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self):
+        self.in_file_part = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+
+async def receive_upload(
+    request: Request,
+    blob_store: BlobStore,
+    max_size: int,
+    allowed_types: list[str] | None = None,
+    field_name: str = "file",
+) -> StreamedUpload:
+    """
+    Stream a multipart file upload into the blob store.
+
+    The request body is parsed as it arrives and the file part is written to
+    the blob store chunk by chunk, so memory use does not depend on the file
+    size. Uploads are rejected as soon as they exceed `max_size`. The file is
+    left uncommitted, the caller commits or aborts the returned upload.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and not content_length.isdigit():
+        raise UploadError("Invalid Content-Length header")
+    if content_length and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise UploadTooLargeError(
+            f"File size exceeds the maximum allowed size of {max_size} bytes"
+        )
+
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data request")
+
+    receiver = _UploadReceiver(blob_store, field_name, max_size, allowed_types)
+    parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if receiver.pending and receiver.writer is not None:
+                data = b"".join(receiver.pending)
+                receiver.pending.clear()
+                # File writes happen off the event loop
+                await asyncio.to_thread(receiver.writer.write, data)
+        parser.finalize()
+
+        if receiver.writer is None or receiver.file_name is None:
+            raise UploadError(f"No file was sent in the '{field_name}' field")
+    except BlobTooLargeError as e:
+        if receiver.writer is not None:
+            receiver.writer.abort()
+        raise UploadTooLargeError(str(e)) from e
+    except BaseException:
+        if receiver.writer is not None:
+            receiver.writer.abort()
+        raise
+
+    return StreamedUpload(
+        file_name=receiver.file_name,
+        content_type=receiver.content_type or "application/octet-stream",
+        writer=receiver.writer,
+    )
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.core.http import http_clients
+
+# ID token claims that are not part of the user profile /userinfo returns
+ID_TOKEN_CLAIMS = {"iss", "aud", "iat", "exp", "nbf", "sid", "nonce", "at_hash", "azp"}
+
+# Result of a shared lookup whose caller was cancelled, None is a valid profile
+_CANCELLED = object()
+
+
+class UserInfoCache:
+    """
+    User profiles for the get_user_info tool.
+
+    The ID token claims stored in the session are served as long as they were
+    issued less than USER_INFO_SESSION_MAX_AGE_SECONDS ago. Otherwise the
+    Auth0 /userinfo response is cached per access token, keyed by its hash,
+    and concurrent lookups for the same token share one request.
+    """
+
+    def __init__(self, ttl_seconds: int, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        # access token hash -> (expiry, profile)
+        self._lru: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.session_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _session_profile(user: dict | None) -> dict | None:
+        if not user or "sub" not in user:
+            return None
+        issued_at = user.get("iat")
+        if not isinstance(issued_at, (int, float)):
+            return None
+        if time.time() - issued_at > settings.USER_INFO_SESSION_MAX_AGE_SECONDS:
+            return None
+        return {k: v for k, v in user.items() if k not in ID_TOKEN_CLAIMS}
+
+    async def _fetch(self, access_token: str) -> dict | None:
+        response = await http_clients.get("auth0").get(
+            f"https://{settings.AUTH0_DOMAIN}/userinfo",
+            headers={
+                "Authorization": f"Bearer {access_token}",
+            },
+        )
+        if response.status_code != 200:
+            return None
+        return response.json()
+
+    async def get(self, access_token: str, user: dict | None = None) -> dict | None:
+        """The user's profile, or None when Auth0 does not accept the token."""
+        profile = self._session_profile(user)
+        if profile is not None:
+            self.session_hits += 1
+            return profile
+
+        key = hashlib.sha256(access_token.encode()).hexdigest()
+
+        cached = self._lru.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            profile = await asyncio.shield(in_flight)
+            if profile is not _CANCELLED:
+                self.hits += 1
+                return profile
+            # The request was cancelled along with its caller, ask again
+            return await self.get(access_token, user)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            profile = await self._fetch(access_token)
+        except asyncio.CancelledError:
+            # Waiters retry instead of getting the cancellation, which is not theirs
+            future.set_result(_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting, keep the loop from warning about it
+            future.exception()
+            raise
+        else:
+            future.set_result(profile)
+            # Rejected tokens are not remembered, the user may log in again
+            if profile is not None:
+                self._lru[key] = (time.monotonic() + self.ttl_seconds, profile)
+                self._lru.move_to_end(key)
+                while len(self._lru) > self.max_size:
+                    self._lru.popitem(last=False)
+            return profile
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        lookups = self.session_hits + self.hits + self.misses
+        return {
+            "session_hits": self.session_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.session_hits + self.hits) / lookups if lookups else 0.0,
+            "size": len(self._lru),
+            "max_size": self.max_size,
+        }
+
+
+user_info_cache = UserInfoCache(
+    ttl_seconds=settings.USER_INFO_CACHE_TTL_SECONDS,
+    max_size=settings.USER_INFO_CACHE_SIZE,
+)
@@ -0,0 +1,260 @@
+"""
+Approximate nearest neighbour index on the embedding vectors.
+
+The index type and its build and query parameters come from settings. Indexes
+are always built concurrently so uploads and retrieval keep working meanwhile.
+
+    python -m app.core.vector_index status
+    python -m app.core.vector_index create
+    python -m app.core.vector_index rebuild   # after changing the index settings
+    python -m app.core.vector_index reindex
+    python -m app.core.vector_index drop
+"""
+
+import argparse
+import asyncio
+import math
+from dataclasses import dataclass
+
+from langchain_postgres.v2.indexes import (
+    BaseIndex,
+    ExactNearestNeighbor,
+    HNSWIndex,
+    HNSWQueryOptions,
+    IVFFlatIndex,
+    IVFFlatQueryOptions,
+    QueryOptions,
+)
+from sqlmodel import text
+
+from app.core.config import settings
+from app.core.db import engine
+
+VECTOR_INDEX_NAME = "embedding_vector_idx"
+EMBEDDING_TABLE = "embedding"
+EMBEDDING_COLUMN = "embedding"
+
+# IVFFlat clusters the rows present at build time, on a nearly empty table the
+# lists would be meaningless
+IVFFLAT_MIN_ROWS = 1000
+
+
+@dataclass
+class VectorIndexStatus:
+    name: str
+    exists: bool
+    valid: bool
+    method: str | None
+    size_bytes: int
+    row_count: int
+
+
+@dataclass
+class FilteredQueryOptions(QueryOptions):
+    """Index query options plus iterative scans, so filtered searches still return k rows."""
+
+    options: QueryOptions
+    index_type: str
+    iterative_scan: str = "relaxed_order"
+
+    def to_parameter(self) -> list[str]:
+        return [
+            *self.options.to_parameter(),
+            f"{self.index_type}.iterative_scan = {self.iterative_scan}",
+        ]
+
+    def to_string(self) -> str:
+        return ", ".join(self.to_parameter())
+
+
+def default_ivfflat_lists(row_count: int) -> int:
+    """Number of IVFFlat lists recommended by pgvector for a table size."""
+    if row_count <= 1_000_000:
+        return max(row_count // 1000, 1)
+    return int(math.sqrt(row_count))
+
+
+def get_vector_index(row_count: int = 0) -> BaseIndex:
+    """Build the index definition configured in settings."""
+    index_type = settings.VECTOR_INDEX_TYPE
+
+    if index_type == "hnsw":
+        return HNSWIndex(
+            name=VECTOR_INDEX_NAME,
+            m=settings.VECTOR_INDEX_HNSW_M,
+            ef_construction=settings.VECTOR_INDEX_HNSW_EF_CONSTRUCTION,
+        )
+
+    if index_type == "ivfflat":
+        return IVFFlatIndex(
+            name=VECTOR_INDEX_NAME,
+            lists=settings.VECTOR_INDEX_IVFFLAT_LISTS
+            or default_ivfflat_lists(row_count),
+        )
+
+    if index_type == "none":
+        return ExactNearestNeighbor(name=VECTOR_INDEX_NAME)
+
+    raise ValueError(f"Unknown vector index type: {index_type}")
+
+
+def get_index_query_options() -> QueryOptions | None:
+    """Per query search settings for the configured index type."""
+    options: QueryOptions
+    if settings.VECTOR_INDEX_TYPE == "hnsw":
+        options = HNSWQueryOptions(ef_search=settings.VECTOR_INDEX_HNSW_EF_SEARCH)
+    elif settings.VECTOR_INDEX_TYPE == "ivfflat":
+        options = IVFFlatQueryOptions(probes=settings.VECTOR_INDEX_IVFFLAT_PROBES)
+    else:
+        return None
+
+    if settings.VECTOR_INDEX_ITERATIVE_SCAN == "off":
+        return options
+
+    return FilteredQueryOptions(
+        options=options,
+        index_type=settings.VECTOR_INDEX_TYPE,
+        iterative_scan=settings.VECTOR_INDEX_ITERATIVE_SCAN,
+    )
+
+
+def _execute_autocommit(*statements: str) -> None:
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def _create_index_statement(index: BaseIndex, name: str) -> str:
+    return (
+        f'CREATE INDEX CONCURRENTLY "{name}" ON "{EMBEDDING_TABLE}" '
+        f"USING {index.index_type} ({EMBEDDING_COLUMN} {index.get_index_function()}) "
+        f"WITH {index.index_options()}"
+    )
+
+
+def _count_rows() -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f'SELECT count(*) FROM "{EMBEDDING_TABLE}"')).scalar_one()
+
+
+def get_index_status(name: str = VECTOR_INDEX_NAME) -> VectorIndexStatus:
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(
+                """
+                SELECT am.amname, ix.indisvalid, pg_relation_size(c.oid)
+                FROM pg_class c
+                JOIN pg_index ix ON ix.indexrelid = c.oid
+                JOIN pg_am am ON am.oid = c.relam
+                WHERE c.relname = :name
+                """
+            ),
+            {"name": name},
+        ).first()
+
+    return VectorIndexStatus(
+        name=name,
+        exists=row is not None,
+        valid=bool(row and row[1]),
+        method=row[0] if row else None,
+        size_bytes=row[2] if row else 0,
+        row_count=_count_rows(),
+    )
+
+
+def create_vector_index() -> bool:
+    """Create the configured index if it does not exist yet, returns whether it was built."""
+    if settings.VECTOR_INDEX_TYPE == "none":
+        return False
+
+    status = get_index_status()
+    if status.exists and status.valid:
+        return False
+
+    if status.exists:
+        # Left behind by an interrupted concurrent build
+        _execute_autocommit(f'DROP INDEX CONCURRENTLY IF EXISTS "{VECTOR_INDEX_NAME}"')
+
+    if settings.VECTOR_INDEX_TYPE == "ivfflat" and status.row_count < IVFFLAT_MIN_ROWS:
+        print(
+            f"Skipping IVFFlat index creation, the embedding table has "
+            f"{status.row_count} rows and needs at least {IVFFLAT_MIN_ROWS}"
+        )
+        return False
+
+    index = get_vector_index(status.row_count)
+    _execute_autocommit(_create_index_statement(index, VECTOR_INDEX_NAME))
+    return True
+
+
+def rebuild_vector_index() -> None:
+    """
+    Replace the index with one built from the current settings.
+
+    The new index is built next to the old one and swapped in afterwards, so
+    searches keep using an index for the whole rebuild.
+    """
+    if settings.VECTOR_INDEX_TYPE == "none":
+        drop_vector_index()
+        return
+
+    new_name = f"{VECTOR_INDEX_NAME}_new"
+    index = get_vector_index(_count_rows())
+
+    _execute_autocommit(
+        f'DROP INDEX CONCURRENTLY IF EXISTS "{new_name}"',
+        _create_index_statement(index, new_name),
+    )
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP INDEX IF EXISTS "{VECTOR_INDEX_NAME}"'))
+        conn.execute(text(f'ALTER INDEX "{new_name}" RENAME TO "{VECTOR_INDEX_NAME}"'))
+
+
+def reindex_vector_index() -> None:
+    """Rebuild the existing index in place, e.g. after many deletes."""
+    _execute_autocommit(f'REINDEX INDEX CONCURRENTLY "{VECTOR_INDEX_NAME}"')
+
+
+def drop_vector_index() -> None:
+    _execute_autocommit(f'DROP INDEX CONCURRENTLY IF EXISTS "{VECTOR_INDEX_NAME}"')
+
+
+async def ensure_vector_index():
+    """Create the index in the background on startup."""
+    try:
+        if await asyncio.to_thread(create_vector_index):
+            print(f"Created {settings.VECTOR_INDEX_TYPE} index {VECTOR_INDEX_NAME}")
+    except Exception as e:
+        print(f"Could not create the vector index: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the embedding vector index.")
+    parser.add_argument(
+        "command", choices=["status", "create", "rebuild", "reindex", "drop"]
+    )
+    args = parser.parse_args()
+
+    if args.command == "create":
+        if not create_vector_index():
+            print("Nothing to do, the index exists or is disabled")
+    elif args.command == "rebuild":
+        rebuild_vector_index()
+    elif args.command == "reindex":
+        reindex_vector_index()
+    elif args.command == "drop":
+        drop_vector_index()
+
+    status = get_index_status()
+    print(f"configured: {settings.VECTOR_INDEX_TYPE}")
+    print(f"index: {status.name}")
+    print(f"exists: {status.exists}")
+    print(f"valid: {status.valid}")
+    print(f"method: {status.method}")
+    print(f"size: {status.size_bytes / 1024 / 1024:.1f} MB")
+    print(f"rows: {status.row_count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,56 @@
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.core.config import settings
 from app.api.api_router import api_router
+from app.core.async_authorization import async_authorization_resumer
 from app.core.auth import auth_client
 from app.core.db import engine, init_db
+from app.core.embedding_cache import embedding_cache
 from app.core.fga import authorization_manager
+from app.core.fga_outbox import fga_outbox_dispatcher
+from app.core.extraction import pdf_extraction_service
+from app.core.http import http_clients
+from app.core.ingestion import ingestion_pipeline
+from app.core.metrics import (
+    METRICS_ENABLED,
+    RequestMetricsMiddleware,
+    register_stats,
+    render_metrics,
+)
+from app.core.rag import embedding_batcher
+from app.core.vector_index import ensure_vector_index
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     init_db()
+    http_clients.start()
     authorization_manager.connect()
+    fga_outbox_dispatcher.start()
+    ingestion_pipeline.start()
+    if settings.ASYNC_AUTHORIZATION_MODE == "interrupt":
+        async_authorization_resumer.on_error(
+            lambda e: print(f"Could not resume the interrupted threads: {e}")
+        )
+        async_authorization_resumer.start()
+    if settings.VECTOR_INDEX_AUTO_CREATE:
+        # Built concurrently, the app serves requests in the meantime
+        app.state.vector_index_task = asyncio.create_task(ensure_vector_index())
 
     yield
 
     # Shutdown
+    await fga_outbox_dispatcher.stop()
+    await async_authorization_resumer.stop()
+    await ingestion_pipeline.shutdown()
+    pdf_extraction_service.shutdown()
+    await http_clients.aclose()
+    await authorization_manager.close()
 
 
 app = FastAPI(
@@ -33,6 +65,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor of the next page of the documents list
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Set the session middleware
@@ -42,3 +76,18 @@ app.add_middleware(SessionMiddleware, secret_key=settings.AUTH0_SECRET)
 app.state.auth_client = auth_client
 
 app.include_router(api_router, prefix=settings.API_PREFIX)
+
+if METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware)
+
+    # The same components as /api/stats
+    register_stats("embedding_cache", embedding_cache.stats)
+    register_stats("embedding_batcher", embedding_batcher.stats)
+    register_stats("authorization", authorization_manager.stats)
+    register_stats("fga_outbox", fga_outbox_dispatcher.stats)
+    register_stats("async_authorization", async_authorization_resumer.stats)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        content, media_type = render_metrics()
+        return Response(content=content, media_type=media_type)
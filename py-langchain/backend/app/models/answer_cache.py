@@ -0,0 +1,32 @@
+import uuid
+from datetime import datetime
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import Column, Field, SQLModel
+
+
+class CachedAnswer(SQLModel, table=True):
+    """The agent's answer to a knowledge base question of a user."""
+
+    __tablename__ = "answer_cache"
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    user_email: str = Field(index=True)
+    question: str
+    embedding: list[float] = Field(sa_column=Column(Vector(1536)))
+    answer: str
+    # Documents the retrieved chunks came from
+    document_ids: list[str] = Field(default=[], sa_column=Column(ARRAY(String)))
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class AnswerCacheInvalidation(SQLModel, table=True):
+    """When the documents a user can view last changed."""
+
+    __tablename__ = "answer_cache_invalidation"
+
+    user_email: str = Field(primary_key=True)
+    # Answers from before this may not reflect the change yet
+    valid_after: datetime
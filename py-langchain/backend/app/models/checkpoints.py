@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import Dict
+
+from sqlmodel import JSON, Column, Field, SQLModel
+
+
+class AgentCheckpoint(SQLModel, table=True):
+    """A checkpoint of an agent thread, without its channel values."""
+
+    __tablename__ = "agent_checkpoint"
+
+    thread_id: str = Field(primary_key=True)
+    checkpoint_ns: str = Field(default="", primary_key=True)
+    # uuid6, sorts in creation order
+    checkpoint_id: str = Field(primary_key=True)
+    parent_checkpoint_id: str | None = None
+    checkpoint_type: str
+    checkpoint: bytes
+    meta_type: str
+    meta: bytes
+    # Version of each channel value the checkpoint refers to
+    channel_versions: Dict = Field(default={}, sa_column=Column(JSON))
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+class AgentCheckpointBlob(SQLModel, table=True):
+    """A channel value, shared by the checkpoints that refer to its version."""
+
+    __tablename__ = "agent_checkpoint_blob"
+
+    thread_id: str = Field(primary_key=True)
+    checkpoint_ns: str = Field(default="", primary_key=True)
+    channel: str = Field(primary_key=True)
+    version: str = Field(primary_key=True)
+    value_type: str
+    value: bytes
+
+
+class AgentCheckpointWrite(SQLModel, table=True):
+    """A pending write of a task that ran after a checkpoint."""
+
+    __tablename__ = "agent_checkpoint_write"
+
+    thread_id: str = Field(primary_key=True)
+    checkpoint_ns: str = Field(default="", primary_key=True)
+    checkpoint_id: str = Field(primary_key=True)
+    task_id: str = Field(primary_key=True)
+    idx: int = Field(primary_key=True)
+    channel: str
+    value_type: str
+    value: bytes
+    task_path: str = ""
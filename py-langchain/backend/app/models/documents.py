@@ -1,9 +1,9 @@
 import uuid
 from datetime import datetime
-from sqlmodel import Field, SQLModel, ARRAY, Column, String
+from sqlmodel import Field, Index, SQLModel
 
 
-class DocumentWithoutContent(SQLModel):
+class DocumentBase(SQLModel):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     file_name: str
     file_type: str
@@ -11,8 +11,34 @@ class DocumentWithoutContent(SQLModel):
     updated_at: datetime
     user_id: str
     user_email: str
-    shared_with: list[str] = Field(sa_column=Column(ARRAY(String)))
+    status: str = Field(default="ready")
+    error: str | None = None
 
 
-class Document(DocumentWithoutContent, table=True):
-    content: bytes
+class DocumentWithoutContent(DocumentBase):
+    shared_with: list[str] = []
+    # Only the owner can share and delete the document
+    is_owner: bool = False
+
+
+class Document(DocumentBase, table=True):
+    # Serves both the owner lookup and the keyset pagination order
+    __table_args__ = (
+        Index("ix_document_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
+    # Only set for documents uploaded before content moved to the blob store
+    content: bytes | None = None
+    content_ref: str | None = None
+    content_hash: str | None = None
+    content_size: int | None = None
+
+
+class DocumentShare(SQLModel, table=True):
+    __tablename__ = "document_share"
+
+    document_id: uuid.UUID = Field(
+        foreign_key="document.id", ondelete="CASCADE", primary_key=True
+    )
+    user_email: str = Field(primary_key=True, index=True)
+    created_at: datetime = Field(default_factory=datetime.now)
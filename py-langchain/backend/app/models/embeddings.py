@@ -1,4 +1,5 @@
 import uuid
+from datetime import datetime
 from typing import Dict
 from sqlmodel import JSON, Column, Field, SQLModel
 from pgvector.sqlalchemy import Vector
@@ -12,3 +13,14 @@ class Embedding(SQLModel, table=True):
     content: str
     meta: Dict = Field(default={}, sa_column=Column(JSON))
     embedding: list[float] = Field(sa_column=Column(Vector(1536)))
+
+
+class CachedEmbedding(SQLModel, table=True):
+    """Embedding vectors keyed by model and the sha256 of the embedded text."""
+
+    __tablename__ = "embedding_cache"
+
+    model: str = Field(primary_key=True)
+    content_hash: str = Field(primary_key=True)
+    embedding: list[float] = Field(sa_column=Column(Vector(1536)))
+    created_at: datetime = Field(default_factory=datetime.now)
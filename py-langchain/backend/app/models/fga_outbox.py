@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlmodel import Field, SQLModel
+
+
+class FgaOutboxEntry(SQLModel, table=True):
+    """A tuple change waiting to be sent to FGA."""
+
+    __tablename__ = "fga_outbox"
+
+    id: int | None = Field(default=None, primary_key=True)
+    # "write" or "delete"
+    operation: str
+    user_email: str
+    relation: str
+    document_id: str
+    created_at: datetime = Field(default_factory=datetime.now)
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=datetime.now, index=True)
+    # Set while a dispatcher is sending the entry
+    leased_until: datetime | None = None
+    last_error: str | None = None
@@ -1,2 +1,5 @@
+import app.models.answer_cache
+import app.models.checkpoints
 import app.models.documents
 import app.models.embeddings
+import app.models.fga_outbox
@@ -0,0 +1,159 @@
+"""
+Turn latency, memory and storage of agent threads with the in-memory and the Postgres checkpointers.
+
+The benchmark runs a graph shaped like the agent's (a model node followed by a
+tool node, both appending messages) on many threads, with LangGraph's
+in-memory checkpointer and with PostgresCheckpointer on DATABASE_URL. The
+checkpoint tables are created if needed and the benchmark's threads deleted
+afterwards. Besides turn latency it reports the time to store everything,
+the latency of the first turn on a thread loaded back from Postgres and the
+encoded vs stored size of the checkpoints.
+
+    python -m benchmarks.checkpointer --threads 50 --turns 20
+    python -m benchmarks.checkpointer --tool-output-bytes 20000 --json > checkpointer.json
+"""
+
+import argparse
+import asyncio
+import json
+import operator
+import time
+import tracemalloc
+import uuid
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from sqlmodel import SQLModel
+
+from app.core.checkpointer import PostgresCheckpointer
+from app.core.db import engine
+from app.models.checkpoints import (
+    AgentCheckpoint,
+    AgentCheckpointBlob,
+    AgentCheckpointWrite,
+)
+from benchmarks.report import percentiles, print_table
+
+
+class BenchmarkState(TypedDict):
+    messages: Annotated[list, add_messages]
+    turns: Annotated[int, operator.add]
+
+
+def build_graph(tool_output_bytes: int) -> StateGraph:
+    def agent(state: BenchmarkState) -> dict:
+        call_id = str(uuid.uuid4())
+        return {
+            "messages": [
+                AIMessage(
+                    "",
+                    tool_calls=[{"name": "get_context_docs", "args": {}, "id": call_id}],
+                )
+            ]
+        }
+
+    def tools(state: BenchmarkState) -> dict:
+        call_id = state["messages"][-1].tool_calls[0]["id"]
+        words = " ".join(f"passage{i}" for i in range(tool_output_bytes // 10))
+        return {
+            "messages": [
+                ToolMessage(words, tool_call_id=call_id, name="get_context_docs"),
+                AIMessage("Here is what your documents say."),
+            ],
+            "turns": 1,
+        }
+
+    graph = StateGraph(BenchmarkState)
+    graph.add_node("agent", agent)
+    graph.add_node("tools", tools)
+    graph.add_edge(START, "agent")
+    graph.add_edge("agent", "tools")
+    graph.add_edge("tools", END)
+    return graph
+
+
+async def run(backend: str, args) -> dict:
+    if backend == "postgres":
+        saver = PostgresCheckpointer(idle_seconds=10**9, keep_last=10**9, ttl_days=0)
+    else:
+        saver = InMemorySaver()
+    graph = build_graph(args.tool_output_bytes).compile(checkpointer=saver)
+    run_id = uuid.uuid4().hex[:8]
+    thread_ids = [f"benchmark-{run_id}-{i}" for i in range(args.threads)]
+
+    tracemalloc.start()
+    turn_ms: list[float] = []
+    for turn in range(args.turns):
+        for thread_id in thread_ids:
+            started = time.perf_counter()
+            await graph.ainvoke(
+                {"messages": [HumanMessage(f"Question {turn}")]},
+                {"configurable": {"thread_id": thread_id}},
+            )
+            turn_ms.append((time.perf_counter() - started) * 1000)
+    memory_mb = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    result = {
+        "backend": backend,
+        "threads": args.threads,
+        "turns": args.turns,
+        **percentiles(turn_ms),
+        "memory_mb": round(memory_mb, 1),
+    }
+    if backend == "postgres":
+        started = time.perf_counter()
+        await asyncio.to_thread(saver.flush)
+        result["flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        # Threads dropped from memory are loaded back on their next turn
+        saver.evict_idle(time.monotonic() + 1)
+        cold_ms = []
+        for thread_id in thread_ids:
+            started = time.perf_counter()
+            await graph.ainvoke(
+                {"messages": [HumanMessage("One more question")]},
+                {"configurable": {"thread_id": thread_id}},
+            )
+            cold_ms.append((time.perf_counter() - started) * 1000)
+        result.update(percentiles(cold_ms, "cold_"))
+
+        stats = saver.stats()
+        result["encoded_mb"] = round(stats["bytes_encoded"] / 2**20, 2)
+        result["stored_mb"] = round(stats["bytes_stored"] / 2**20, 2)
+        for thread_id in thread_ids:
+            saver.delete_thread(thread_id)
+        await asyncio.to_thread(saver.flush)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--tool-output-bytes", type=int, default=5000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    SQLModel.metadata.create_all(
+        engine,
+        tables=[
+            AgentCheckpoint.__table__,
+            AgentCheckpointBlob.__table__,
+            AgentCheckpointWrite.__table__,
+        ],
+    )
+    results = [asyncio.run(run(backend, args)) for backend in ("memory", "postgres")]
+
+    if args.json:
+        print(json.dumps({"settings": vars(args), "results": results}, indent=2))
+        return
+
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Compare chunking settings on the fixture corpus.
+
+For every configuration the benchmark reports the number of embedding rows the
+corpus produces, the tokens and time spent embedding them, and the recall of the
+fixture questions: the share of questions for which one of the top-k chunks
+comes from the expected document (doc recall) and contains the expected answer
+(answer recall).
+
+    python -m benchmarks.chunking --embedder openai --sizes 100,200,400,800
+    python -m benchmarks.chunking --embedder hashing --json > chunking.json
+
+The `hashing` embedder is a deterministic bag-of-words model that runs offline,
+use `openai` to measure real embedding time and recall.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+import tiktoken
+from langchain_core.documents import Document as LCDocument
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.core.chunking import EMBEDDING_ENCODING, ChunkingConfig, chunk_pages
+from app.core.ingestion import extract_pages
+from benchmarks.report import print_table
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+FILE_TYPES = {
+    ".md": "text/markdown",
+    ".txt": "text/plain",
+    ".pdf": "application/pdf",
+}
+
+
+class HashingEmbeddings:
+    """Deterministic offline embeddings: hashed, signed bag of words."""
+
+    def __init__(self, dimensions: int = 1536):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+
+def get_embedder(name: str):
+    if name == "openai":
+        from app.core.rag import embedding_model
+
+        return embedding_model
+
+    return HashingEmbeddings()
+
+
+def load_corpus(path: Path) -> list[tuple[str, str, list[tuple[int | None, str]]]]:
+    corpus = []
+    for file in sorted(path.iterdir()):
+        file_type = FILE_TYPES.get(file.suffix)
+        if file_type:
+            corpus.append((file.name, file_type, extract_pages(file_type, file.read_bytes())))
+    return corpus
+
+
+def legacy_chunker(file_type: str, pages: list[tuple[int | None, str]]) -> list[LCDocument]:
+    """The original 100 character splitter, kept as a baseline."""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=100, chunk_overlap=10, length_function=len
+    )
+    return splitter.create_documents(["".join(text for _, text in pages)])
+
+
+def token_chunker(chunk_size: int, overlap_ratio: float, structured: bool):
+    def chunker(file_type: str, pages: list[tuple[int | None, str]]) -> list[LCDocument]:
+        config = ChunkingConfig(
+            chunk_size=chunk_size,
+            chunk_overlap=int(chunk_size * overlap_ratio),
+            split_markdown_headers=structured and file_type == "text/markdown",
+        )
+        return chunk_pages(pages, config)
+
+    return chunker
+
+
+async def embed_all(embedder, texts: list[str], batch_size: int = 1000) -> np.ndarray:
+    vectors: list[list[float]] = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(await embedder.aembed_documents(texts[i : i + batch_size]))
+    matrix = np.array(vectors, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+
+
+async def run_config(name, chunker, corpus, queries, query_vectors, embedder, k):
+    encoding = tiktoken.get_encoding(EMBEDDING_ENCODING)
+
+    chunks: list[tuple[str, LCDocument]] = []
+    started = time.perf_counter()
+    for file_name, file_type, pages in corpus:
+        chunks.extend((file_name, chunk) for chunk in chunker(file_type, pages))
+    chunk_seconds = time.perf_counter() - started
+
+    texts = [chunk.page_content for _, chunk in chunks]
+    tokens = sum(len(encoding.encode_ordinary(text)) for text in texts)
+
+    started = time.perf_counter()
+    chunk_vectors = await embed_all(embedder, texts)
+    embed_seconds = time.perf_counter() - started
+
+    top_k = np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :k]
+
+    doc_hits = 0
+    answer_hits = 0
+    for query, indexes in zip(queries, top_k):
+        retrieved = [chunks[i] for i in indexes]
+        if any(file_name == query["document"] for file_name, _ in retrieved):
+            doc_hits += 1
+        if any(
+            file_name == query["document"]
+            and query["answer"].lower() in chunk.page_content.lower()
+            for file_name, chunk in retrieved
+        ):
+            answer_hits += 1
+
+    return {
+        "config": name,
+        "rows": len(chunks),
+        "tokens": tokens,
+        "avg_tokens_per_row": round(tokens / len(chunks), 1) if chunks else 0,
+        "chunk_seconds": round(chunk_seconds, 4),
+        "embed_seconds": round(embed_seconds, 4),
+        f"doc_recall@{k}": round(doc_hits / len(queries), 3),
+        f"answer_recall@{k}": round(answer_hits / len(queries), 3),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", type=Path, default=FIXTURES / "corpus")
+    parser.add_argument("--queries", type=Path, default=FIXTURES / "queries.json")
+    parser.add_argument("--embedder", choices=["hashing", "openai"], default="hashing")
+    parser.add_argument("--sizes", default="100,200,400,800")
+    parser.add_argument("--overlap-ratio", type=float, default=0.1)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    queries = json.loads(args.queries.read_text())
+    embedder = get_embedder(args.embedder)
+    query_vectors = await embed_all(embedder, [query["question"] for query in queries])
+
+    configs = [("legacy-100-chars", legacy_chunker)]
+    for size in (int(size) for size in args.sizes.split(",")):
+        configs.append((f"tokens-{size}", token_chunker(size, args.overlap_ratio, False)))
+        configs.append(
+            (f"tokens-{size}-structured", token_chunker(size, args.overlap_ratio, True))
+        )
+
+    results = [
+        await run_config(name, chunker, corpus, queries, query_vectors, embedder, args.k)
+        for name, chunker in configs
+    ]
+
+    if args.json:
+        print(json.dumps({"embedder": args.embedder, "results": results}, indent=2))
+        return
+
+    print_table(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
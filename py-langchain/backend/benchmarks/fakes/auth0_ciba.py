@@ -0,0 +1,175 @@
+"""
+Stand-in for the Auth0 CIBA endpoints.
+
+It serves /bc-authorize and the CIBA grant of /oauth/token, so purchase
+approvals can run against it by setting ASYNC_AUTHORIZATION_AUTH0_URL to
+http://127.0.0.1:<port>. Requests stay pending until they are approved or
+denied, through POST /_requests/{auth_req_id}/approve or /deny, or after
+--approve-after seconds. Polling faster than the interval answers slow_down,
+GET /_stats returns the counters.
+
+    python -m benchmarks.fakes.auth0_ciba --port 54369 --approve-after 20
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+CIBA_GRANT_TYPE = "urn:openid:params:grant-type:ciba"
+
+
+async def _form(request: Request) -> dict:
+    if request.headers.get("content-type", "").startswith("application/json"):
+        return json.loads(await request.body() or b"{}")
+    return dict(await request.form())
+
+
+def _error(error: str, description: str, status_code: int = 400) -> JSONResponse:
+    return JSONResponse(
+        {"error": error, "error_description": description}, status_code=status_code
+    )
+
+
+class FakeAuth0Ciba:
+    def __init__(
+        self,
+        expires_in: int = 300,
+        interval: int = 5,
+        approve_after: float | None = None,
+    ):
+        self.expires_in = expires_in
+        self.interval = interval
+        self.approve_after = approve_after
+        # auth_req_id -> request state
+        self.requests: dict[str, dict] = {}
+        self.token_polls = 0
+        self.pending_answers = 0
+        self.slow_downs = 0
+        self.tokens_issued = 0
+
+    def approve(self, auth_req_id: str):
+        self.requests[auth_req_id]["status"] = "approved"
+
+    def deny(self, auth_req_id: str):
+        self.requests[auth_req_id]["status"] = "denied"
+
+    async def bc_authorize(self, request: Request):
+        form = await _form(request)
+        if "login_hint" not in form:
+            return _error("invalid_request", "login_hint is required")
+
+        auth_req_id = uuid.uuid4().hex
+        expires_in = int(form.get("requested_expiry") or self.expires_in)
+        now = time.monotonic()
+        self.requests[auth_req_id] = {
+            "status": "pending",
+            "binding_message": form.get("binding_message"),
+            "scope": form.get("scope", ""),
+            "audience": form.get("audience"),
+            "expires_at": now + expires_in,
+            "last_poll": None,
+        }
+        if self.approve_after is not None:
+            self.requests[auth_req_id]["approve_at"] = now + self.approve_after
+        return JSONResponse(
+            {"auth_req_id": auth_req_id, "expires_in": expires_in, "interval": self.interval}
+        )
+
+    async def token(self, request: Request):
+        form = await _form(request)
+        if form.get("grant_type") != CIBA_GRANT_TYPE:
+            return _error("unsupported_grant_type", "Only the CIBA grant is supported")
+
+        self.token_polls += 1
+        state = self.requests.get(form.get("auth_req_id", ""))
+        if state is None:
+            return _error("invalid_grant", "Unknown or already used auth_req_id")
+
+        now = time.monotonic()
+        last_poll, state["last_poll"] = state["last_poll"], now
+        if now >= state["expires_at"]:
+            return _error("expired_token", "The authorization request has expired")
+        if state["status"] == "pending" and now >= state.get("approve_at", float("inf")):
+            state["status"] = "approved"
+
+        if state["status"] == "denied":
+            return _error("access_denied", "The user rejected the request")
+        if state["status"] == "pending":
+            if last_poll is not None and now - last_poll < self.interval:
+                self.slow_downs += 1
+                return _error("slow_down", "You are polling faster than allowed")
+            self.pending_answers += 1
+            return _error("authorization_pending", "The user has not approved yet")
+
+        # Like Auth0, the token of a request is handed out once
+        del self.requests[form["auth_req_id"]]
+        self.tokens_issued += 1
+        return JSONResponse(
+            {
+                "access_token": f"fake-{uuid.uuid4().hex}",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "scope": state["scope"],
+            }
+        )
+
+    async def set_status(self, request: Request):
+        auth_req_id = request.path_params["auth_req_id"]
+        action = request.path_params["action"]
+        if auth_req_id not in self.requests or action not in ("approve", "deny"):
+            return _error("invalid_request", "Unknown request or action", 404)
+        if action == "approve":
+            self.approve(auth_req_id)
+        else:
+            self.deny(auth_req_id)
+        return JSONResponse({"auth_req_id": auth_req_id, **self.requests[auth_req_id]})
+
+    async def stats(self, request: Request):
+        return JSONResponse(
+            {
+                "pending": sum(r["status"] == "pending" for r in self.requests.values()),
+                "token_polls": self.token_polls,
+                "pending_answers": self.pending_answers,
+                "slow_downs": self.slow_downs,
+                "tokens_issued": self.tokens_issued,
+            }
+        )
+
+    def app(self) -> Starlette:
+        return Starlette(
+            routes=[
+                Route("/_stats", self.stats),
+                Route(
+                    "/_requests/{auth_req_id}/{action:str}",
+                    self.set_status,
+                    methods=["POST"],
+                ),
+                Route("/bc-authorize", self.bc_authorize, methods=["POST"]),
+                Route("/oauth/token", self.token, methods=["POST"]),
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=54369)
+    parser.add_argument("--expires-in", type=int, default=300)
+    parser.add_argument("--interval", type=int, default=5)
+    parser.add_argument(
+        "--approve-after", type=float, default=None, help="approve every request after this many seconds"
+    )
+    args = parser.parse_args()
+
+    fake = FakeAuth0Ciba(args.expires_in, args.interval, args.approve_after)
+    uvicorn.run(fake.app(), port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Stand-in for the OpenFGA API, with the `doc` model of app/core/fga_init.py.
+
+Tuples are kept in memory. A user can_view a document they own or view, and
+viewer tuples on `user:*` make a document viewable by everyone. It serves the
+routes the backend and fga_init.py use (write, check, batch-check,
+list-objects, streamed-list-objects, authorization-models) and the
+client credentials token endpoint, so FGA_API_URL and FGA_API_TOKEN_ISSUER can
+both point at it. An optional delay per request stands in for the network,
+GET /_stats returns the request counters.
+
+    python -m benchmarks.fakes.fga --port 54371 --delay-ms 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter, defaultdict
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Relations that can be written, can_view is computed from them
+DIRECT_RELATIONS = ("owner", "viewer")
+# Crockford base32, the alphabet of the ULIDs FGA uses as ids
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def new_ulid() -> str:
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    return "".join(ULID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def _error(code: str, message: str) -> JSONResponse:
+    return JSONResponse({"code": code, "message": message}, status_code=400)
+
+
+class FakeFga:
+    def __init__(self, delay_ms: float = 0):
+        self.delay_ms = delay_ms
+        # (relation, object) -> users
+        self.tuples: dict[tuple[str, str], set[str]] = defaultdict(set)
+        # (user, relation, object) -> time.perf_counter() of its write, for propagation delays
+        self.written_at: dict[tuple[str, str, str], float] = {}
+        self.requests: Counter[str] = Counter()
+        self.tuples_written = 0
+        self.tuples_deleted = 0
+
+    def allowed(self, user: str, relation: str, object: str) -> bool:
+        if relation == "can_view":
+            return any(self.allowed(user, r, object) for r in DIRECT_RELATIONS)
+        users = self.tuples.get((relation, object), ())
+        return user in users or (relation == "viewer" and "user:*" in users)
+
+    def objects(self, user: str, relation: str, type: str) -> list[str]:
+        return sorted(
+            {
+                object
+                for (_, object) in self.tuples
+                if object.startswith(f"{type}:") and self.allowed(user, relation, object)
+            }
+        )
+
+    async def _begin(self, name: str):
+        self.requests[name] += 1
+        if self.delay_ms:
+            await asyncio.sleep(self.delay_ms / 1000)
+
+    async def token(self, request: Request):
+        await self._begin("token")
+        return JSONResponse(
+            {"access_token": "fake-fga-token", "token_type": "Bearer", "expires_in": 86400}
+        )
+
+    async def write_authorization_model(self, request: Request):
+        await self._begin("write_authorization_model")
+        return JSONResponse({"authorization_model_id": new_ulid()}, status_code=201)
+
+    async def write(self, request: Request):
+        await self._begin("write")
+        body = await request.json()
+        writes = body.get("writes") or {}
+        deletes = body.get("deletes") or {}
+
+        # Validate everything first, a write request is applied in full or not at all
+        for key in writes.get("tuple_keys", []):
+            if key["relation"] not in DIRECT_RELATIONS or not key["object"].startswith("doc:"):
+                return _error("validation_error", f"cannot write {key}")
+            exists = key["user"] in self.tuples.get((key["relation"], key["object"]), ())
+            if exists and writes.get("on_duplicate", "error") != "ignore":
+                return _error(
+                    "write_failed_due_to_invalid_input",
+                    f"cannot write a tuple which already exists: {key}",
+                )
+        for key in deletes.get("tuple_keys", []):
+            exists = key["user"] in self.tuples.get((key["relation"], key["object"]), ())
+            if not exists and deletes.get("on_missing", "error") != "ignore":
+                return _error(
+                    "write_failed_due_to_invalid_input",
+                    f"cannot delete a tuple which does not exist: {key}",
+                )
+
+        now = time.perf_counter()
+        for key in writes.get("tuple_keys", []):
+            self.tuples[(key["relation"], key["object"])].add(key["user"])
+            self.written_at.setdefault((key["user"], key["relation"], key["object"]), now)
+            self.tuples_written += 1
+        for key in deletes.get("tuple_keys", []):
+            self.tuples[(key["relation"], key["object"])].discard(key["user"])
+            self.written_at.pop((key["user"], key["relation"], key["object"]), None)
+            self.tuples_deleted += 1
+        return JSONResponse({})
+
+    async def check(self, request: Request):
+        await self._begin("check")
+        key = (await request.json())["tuple_key"]
+        return JSONResponse(
+            {"allowed": self.allowed(key["user"], key["relation"], key["object"])}
+        )
+
+    async def batch_check(self, request: Request):
+        await self._begin("batch_check")
+        body = await request.json()
+        return JSONResponse(
+            {
+                "result": {
+                    check["correlation_id"]: {
+                        "allowed": self.allowed(
+                            check["tuple_key"]["user"],
+                            check["tuple_key"]["relation"],
+                            check["tuple_key"]["object"],
+                        )
+                    }
+                    for check in body.get("checks", [])
+                }
+            }
+        )
+
+    async def list_objects(self, request: Request):
+        await self._begin("list_objects")
+        body = await request.json()
+        return JSONResponse(
+            {"objects": self.objects(body["user"], body["relation"], body["type"])}
+        )
+
+    async def streamed_list_objects(self, request: Request):
+        await self._begin("streamed_list_objects")
+        body = await request.json()
+        objects = self.objects(body["user"], body["relation"], body["type"])
+
+        async def results():
+            for object in objects:
+                yield json.dumps({"result": {"object": object}}) + "\n"
+
+        return StreamingResponse(results(), media_type="application/x-ndjson")
+
+    async def stats(self, request: Request):
+        return JSONResponse(
+            {
+                "requests": dict(self.requests),
+                "tuples": sum(len(users) for users in self.tuples.values()),
+                "tuples_written": self.tuples_written,
+                "tuples_deleted": self.tuples_deleted,
+            }
+        )
+
+    def app(self) -> Starlette:
+        store = "/stores/{store_id}"
+        return Starlette(
+            routes=[
+                Route("/_stats", self.stats),
+                Route("/oauth/token", self.token, methods=["POST"]),
+                Route(
+                    f"{store}/authorization-models",
+                    self.write_authorization_model,
+                    methods=["POST"],
+                ),
+                Route(f"{store}/write", self.write, methods=["POST"]),
+                Route(f"{store}/check", self.check, methods=["POST"]),
+                Route(f"{store}/batch-check", self.batch_check, methods=["POST"]),
+                Route(f"{store}/list-objects", self.list_objects, methods=["POST"]),
+                Route(
+                    f"{store}/streamed-list-objects",
+                    self.streamed_list_objects,
+                    methods=["POST"],
+                ),
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=54371)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    print(f"FGA_STORE_ID={new_ulid()}")
+    print(f"FGA_API_URL=http://127.0.0.1:{args.port}")
+    print(f"FGA_API_TOKEN_ISSUER=http://127.0.0.1:{args.port}")
+    fake = FakeFga(args.delay_ms)
+    uvicorn.run(fake.app(), port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Stand-in for the Google Calendar events.list API.
+
+It serves /calendar/v3/calendars/{calendarId}/events with paging, time bounds
+and sync tokens, so the calendar tool can run against it by setting
+GOOGLE_CALENDAR_API_URL to http://127.0.0.1:<port>/calendar/v3/. Sync tokens
+can be expired to exercise the 410 full resync, and GET /_stats returns the
+request counters.
+
+    python -m benchmarks.fakes.google_calendar --port 54368 --events 500
+"""
+
+import argparse
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def _event_time(value: dict) -> datetime:
+    if "dateTime" in value:
+        return datetime.fromisoformat(value["dateTime"])
+    return datetime.fromisoformat(value["date"]).replace(tzinfo=timezone.utc)
+
+
+class FakeGoogleCalendar:
+    def __init__(self):
+        # event id -> (change sequence number, event)
+        self.events: dict[str, tuple[int, dict]] = {}
+        self.sequence = 0
+        # Sync tokens are "<epoch>:<sequence>", tokens of an older epoch answer 410 Gone
+        self.epoch = 0
+        self.full_lists = 0
+        self.incremental_lists = 0
+        self.items_sent = 0
+
+    def _change(self, event: dict) -> dict:
+        self.sequence += 1
+        event["updated"] = datetime.now(timezone.utc).isoformat()
+        self.events[event["id"]] = (self.sequence, event)
+        return event
+
+    def add_event(self, summary: str, start: datetime, duration: timedelta) -> dict:
+        return self._change(
+            {
+                "id": uuid.uuid4().hex,
+                "status": "confirmed",
+                "summary": summary,
+                "start": {"dateTime": start.isoformat()},
+                "end": {"dateTime": (start + duration).isoformat()},
+            }
+        )
+
+    def update_event(self, event_id: str, **fields) -> dict:
+        _, event = self.events[event_id]
+        return self._change({**event, **fields})
+
+    def cancel_event(self, event_id: str) -> dict:
+        _, event = self.events[event_id]
+        return self._change({"id": event_id, "status": "cancelled", "start": event["start"]})
+
+    def expire_sync_tokens(self):
+        self.epoch += 1
+
+    def seed(self, count: int, days: int = 30):
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        for number in range(count):
+            self.add_event(
+                f"Event {number}",
+                now + timedelta(hours=1 + number * days * 24 // max(count, 1)),
+                timedelta(minutes=30),
+            )
+
+    async def list_events(self, request: Request):
+        params = request.query_params
+        max_results = min(int(params.get("maxResults", 250)), 2500)
+        offset = int(params.get("pageToken") or 0)
+
+        if "syncToken" in params:
+            epoch, since = (int(part) for part in params["syncToken"].split(":"))
+            if epoch != self.epoch:
+                return JSONResponse(
+                    {
+                        "error": {
+                            "code": 410,
+                            "message": "Sync token is no longer valid, a full sync is required.",
+                            "errors": [{"reason": "fullSyncRequired"}],
+                        }
+                    },
+                    status_code=410,
+                )
+            if offset == 0:
+                self.incremental_lists += 1
+            # Every change since the token, cancellations included
+            matching = [event for seq, event in self.events.values() if seq > since]
+        else:
+            if offset == 0:
+                self.full_lists += 1
+            time_min = datetime.fromisoformat(params.get("timeMin", "0001-01-01T00:00:00+00:00"))
+            time_max = datetime.fromisoformat(params.get("timeMax", "9999-12-31T00:00:00+00:00"))
+            matching = [
+                event
+                for _, event in self.events.values()
+                if event["status"] != "cancelled"
+                and _event_time(event["end"]) > time_min
+                and _event_time(event["start"]) < time_max
+            ]
+            matching.sort(key=lambda event: _event_time(event["start"]))
+
+        page = matching[offset : offset + max_results]
+        self.items_sent += len(page)
+        response: dict = {"kind": "calendar#events", "items": page}
+        if offset + max_results < len(matching):
+            response["nextPageToken"] = str(offset + max_results)
+        else:
+            response["nextSyncToken"] = f"{self.epoch}:{self.sequence}"
+        return JSONResponse(response)
+
+    async def stats(self, request: Request):
+        return JSONResponse(
+            {
+                "events": len(self.events),
+                "full_lists": self.full_lists,
+                "incremental_lists": self.incremental_lists,
+                "items_sent": self.items_sent,
+            }
+        )
+
+    def app(self) -> Starlette:
+        return Starlette(
+            routes=[
+                Route("/_stats", self.stats),
+                Route("/calendar/v3/calendars/{calendar_id}/events", self.list_events),
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=54368)
+    parser.add_argument("--events", type=int, default=100)
+    args = parser.parse_args()
+
+    fake = FakeGoogleCalendar()
+    fake.seed(args.events)
+    uvicorn.run(fake.app(), port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Stand-in for the LangGraph API server.
+
+Run streams answer with a configurable number of server-sent events, other
+routes echo the request. Runs created with on_disconnect=cancel count as
+cancelled when their client goes away before the stream ends, GET /_stats
+returns the counters.
+
+    python -m benchmarks.fakes.langgraph --port 54367 --events 200 --event-size 512
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+class FakeLangGraph:
+    def __init__(self, events: int = 100, event_size: int = 512, delay_ms: float = 0):
+        self.events = events
+        self.event_size = event_size
+        self.delay_ms = delay_ms
+        self.runs_started = 0
+        self.runs_completed = 0
+        self.runs_cancelled = 0
+        self.last_body: dict | None = None
+
+    async def stream_run(self, request: Request):
+        body = await request.json()
+        self.last_body = body
+        self.runs_started += 1
+        run_id = str(uuid.uuid4())
+        thread_id = request.path_params.get("thread_id")
+        cancel_on_disconnect = body.get("on_disconnect") == "cancel"
+
+        payload = json.dumps({"content": "x" * self.event_size})
+
+        async def events():
+            try:
+                yield f"event: metadata\ndata: {json.dumps({'run_id': run_id})}\n\n"
+                for _ in range(self.events):
+                    if self.delay_ms:
+                        await asyncio.sleep(self.delay_ms / 1000)
+                    yield f"event: messages\ndata: {payload}\n\n"
+                self.runs_completed += 1
+            except (asyncio.CancelledError, GeneratorExit):
+                if cancel_on_disconnect:
+                    self.runs_cancelled += 1
+                raise
+
+        location = (
+            f"/threads/{thread_id}/runs/{run_id}" if thread_id else f"/runs/{run_id}"
+        )
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Content-Location": location},
+        )
+
+    async def echo(self, request: Request):
+        body = await request.body()
+        return JSONResponse(
+            {
+                "method": request.method,
+                "path": request.url.path,
+                "body": body.decode("utf-8", errors="replace"),
+            }
+        )
+
+    async def stats(self, request: Request):
+        return JSONResponse(
+            {
+                "runs_started": self.runs_started,
+                "runs_completed": self.runs_completed,
+                "runs_cancelled": self.runs_cancelled,
+                "last_body": self.last_body,
+            }
+        )
+
+    def app(self) -> Starlette:
+        methods = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+        return Starlette(
+            routes=[
+                Route("/_stats", self.stats),
+                Route("/threads/{thread_id}/runs/stream", self.stream_run, methods=["POST"]),
+                Route("/runs/stream", self.stream_run, methods=["POST"]),
+                Route("/{path:path}", self.echo, methods=methods),
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=54367)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--event-size", type=int, default=512)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    fake = FakeLangGraph(args.events, args.event_size, args.delay_ms)
+    uvicorn.run(fake.app(), port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Stand-in for the OpenAI embeddings API.
+
+POST /v1/embeddings answers with unit vectors seeded from each input, so the
+same text always gets the same vector, across runs and processes. Inputs can
+be strings or token arrays, as sent by langchain-openai, and both float and
+base64 encodings are served. An optional delay per request stands in for the
+API's latency, GET /_stats returns the request counters.
+
+    python -m benchmarks.fakes.openai --port 54370 --delay-ms 50
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:54370/v1.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class FakeOpenAI:
+    def __init__(self, dimensions: int = 1536, seed: int = 0, delay_ms: float = 0):
+        self.dimensions = dimensions
+        self.seed = seed
+        self.delay_ms = delay_ms
+        self.requests = 0
+        self.inputs = 0
+        self.tokens = 0
+
+    def vector(self, value: str | list[int], dimensions: int | None = None) -> np.ndarray:
+        """The unit vector of an input, seeded by its content."""
+        digest = hashlib.sha256(f"{self.seed}:{json.dumps(value)}".encode("utf-8"))
+        rng = np.random.default_rng(int.from_bytes(digest.digest()[:8], "little"))
+        vector = rng.standard_normal(dimensions or self.dimensions).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    async def embeddings(self, request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        # A single string or token array is one input
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        if not inputs:
+            return JSONResponse(
+                {"error": {"message": "input is required", "type": "invalid_request_error"}},
+                status_code=400,
+            )
+
+        if self.delay_ms:
+            await asyncio.sleep(self.delay_ms / 1000)
+
+        # Token arrays are counted exactly, strings roughly at 4 characters a token
+        tokens = sum(
+            len(value) if isinstance(value, list) else max(1, len(value) // 4)
+            for value in inputs
+        )
+        self.requests += 1
+        self.inputs += len(inputs)
+        self.tokens += tokens
+
+        base64_encoded = body.get("encoding_format") == "base64"
+        data = []
+        for index, value in enumerate(inputs):
+            vector = self.vector(value, body.get("dimensions"))
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": index,
+                    "embedding": (
+                        base64.b64encode(vector.tobytes()).decode("ascii")
+                        if base64_encoded
+                        else vector.tolist()
+                    ),
+                }
+            )
+        return JSONResponse(
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+        )
+
+    async def stats(self, request: Request):
+        return JSONResponse(
+            {"requests": self.requests, "inputs": self.inputs, "tokens": self.tokens}
+        )
+
+    def app(self) -> Starlette:
+        return Starlette(
+            routes=[
+                Route("/_stats", self.stats),
+                Route("/v1/embeddings", self.embeddings, methods=["POST"]),
+            ]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=54370)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(args.dimensions, args.seed, args.delay_ms)
+    uvicorn.run(fake.app(), port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
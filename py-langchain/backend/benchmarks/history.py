@@ -0,0 +1,140 @@
+"""
+Model input size and turn latency of long threads, with and without the history budget.
+
+The benchmark grows synthetic threads turn by turn, each turn retrieving
+documents like get_context_docs does, and runs the pre-model hook before every
+model call. The model is simulated: its latency grows with the input tokens,
+the summarizer answers after a fixed delay. Without the budget the whole
+history is sent on every call.
+
+    python -m benchmarks.history --turns 20,50,100
+    python -m benchmarks.history --tool-output-tokens 3000 --json > history.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from app.agents.history import ConversationHistoryManager, message_text
+from app.core.config import settings
+from benchmarks.report import percentiles, print_table
+
+
+class SlowSummarizer(FakeListChatModel):
+    delay_ms: float = 0
+
+    async def _agenerate(self, *args, **kwargs):
+        await asyncio.sleep(self.delay_ms / 1000)
+        return await super()._agenerate(*args, **kwargs)
+
+
+def make_turn(number: int, tool_output_tokens: int) -> tuple[list, list]:
+    """The user message of a turn, and the messages that follow it."""
+    call_id = str(uuid.uuid4())
+    document = " ".join(f"passage{number}-{word}" for word in range(tool_output_tokens // 3))
+    question = HumanMessage(
+        f"What do my documents say about topic {number}?", id=str(uuid.uuid4())
+    )
+    return [question], [
+        AIMessage(
+            "",
+            tool_calls=[
+                {
+                    "name": "get_context_docs",
+                    "args": {"question": f"topic {number}"},
+                    "id": call_id,
+                }
+            ],
+            id=str(uuid.uuid4()),
+        ),
+        ToolMessage(
+            document, tool_call_id=call_id, name="get_context_docs", id=str(uuid.uuid4())
+        ),
+        AIMessage(
+            f"Topic {number} is covered in section {number} of your notes.",
+            id=str(uuid.uuid4()),
+        ),
+    ]
+
+
+async def run_thread(turns: int, args, budget: bool) -> dict:
+    manager = ConversationHistoryManager(
+        max_tokens=args.max_tokens if budget else 10**12,
+        keep_tokens=args.keep_tokens,
+        tool_output_max_tokens=args.tool_output_max_tokens if budget else 10**12,
+        summary_max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS,
+        summarizer=SlowSummarizer(
+            responses=["The user asked about earlier topics. " * 40], delay_ms=args.summary_ms
+        ),
+    )
+    state: dict = {"messages": []}
+    turn_ms: list[float] = []
+    input_tokens: list[int] = []
+    hook_ms: list[float] = []
+
+    for number in range(turns):
+        question, rest = make_turn(number, args.tool_output_tokens)
+        started = time.perf_counter()
+        # Two model calls per turn, one picks the tool and one answers with its output
+        for new_messages in (question, rest[:2]):
+            state["messages"] = state["messages"] + new_messages
+            hook_started = time.perf_counter()
+            update = await manager(state, {})
+            hook_ms.append((time.perf_counter() - hook_started) * 1000)
+            state.update({k: v for k, v in update.items() if k != "llm_input_messages"})
+
+            tokens = sum(
+                manager.count_tokens(message_text(m)) for m in update["llm_input_messages"]
+            )
+            input_tokens.append(tokens)
+            await asyncio.sleep(tokens / 1000 * args.model_ms_per_1k_tokens / 1000)
+        state["messages"] = state["messages"] + rest[2:]
+        turn_ms.append((time.perf_counter() - started) * 1000)
+
+    # Latency of the last tenth of the thread, where it is longest
+    tail = turn_ms[-max(1, turns // 10) :]
+    return {
+        "turns": turns,
+        "budget": budget,
+        "last_input_tokens": input_tokens[-1],
+        "tokens_saved": manager.stats()["tokens_saved"],
+        "summaries": manager.summaries,
+        **percentiles(hook_ms, "hook_"),
+        **percentiles(tail, "turn_"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", default="20,50,100")
+    parser.add_argument("--tool-output-tokens", type=int, default=1500)
+    parser.add_argument("--max-tokens", type=int, default=settings.HISTORY_MAX_TOKENS)
+    parser.add_argument("--keep-tokens", type=int, default=settings.HISTORY_KEEP_TOKENS)
+    parser.add_argument(
+        "--tool-output-max-tokens", type=int, default=settings.HISTORY_TOOL_OUTPUT_MAX_TOKENS
+    )
+    parser.add_argument("--model-ms-per-1k-tokens", type=float, default=20)
+    parser.add_argument("--summary-ms", type=float, default=800)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(run_thread(int(turns), args, budget))
+        for turns in args.turns.split(",")
+        for budget in (False, True)
+    ]
+
+    if args.json:
+        print(json.dumps({"settings": vars(args), "results": results}, indent=2))
+        return
+
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+"""
+Throughput and latency of uploads, retrieval, sharing and chat streaming against local stand-ins.
+
+The benchmark serves the fakes of the OpenAI embeddings API, FGA and the
+LangGraph server on local ports, points the backend at them and runs the API
+with its lifespan on DATABASE_URL. The session check is replaced by the
+X-Bench-User header, so requests can come from many users. Scenarios:
+
+- upload: concurrent uploads of generated PDFs, the latency of the upload
+  request and the time until each document is ready (extracted, chunked and
+  embedded)
+- share: every document shared with --share-users users, the latency of the
+  share request and the time until its viewer tuples reach FGA
+- retrieval: concurrent get_context_docs calls from the owner and the users
+  the documents were shared with, on the API's event loop
+- chat: agent runs streamed through the /api/agent proxy
+
+share and retrieval work on the uploaded documents, so the upload runs
+whenever they do. The documents' text, the embeddings and the questions are
+seeded, so runs on different commits do the same work. The documents are
+deleted at the end.
+
+Use a database of its own: the API's FGA outbox sends whatever is pending in
+it to the fake FGA.
+
+    python -m benchmarks.load --documents 50 --pages 5 --concurrency 10
+    python -m benchmarks.load --scenarios retrieval,chat --json > load.json
+    python -m benchmarks.load --baseline load.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import Request
+from langchain_openai import OpenAIEmbeddings
+from pydantic import SecretStr
+
+from app.agents.tools.context_docs import get_context_docs
+from app.core.auth import auth_client
+from app.core.config import settings
+from app.core.fga_outbox import fga_outbox_dispatcher
+from app.core.rag import embedding_model
+from app.main import app
+from benchmarks.fakes.fga import FakeFga, new_ulid
+from benchmarks.fakes.langgraph import FakeLangGraph
+from benchmarks.fakes.openai import FakeOpenAI
+from benchmarks.proxy import free_port, serve, stream_run
+from benchmarks.report import percentiles, print_table
+
+SCENARIOS = ("upload", "share", "retrieval", "chat")
+FIXTURES = Path(__file__).parent / "fixtures"
+OWNER = "owner@bench.example"
+
+
+def bench_session(request: Request) -> dict:
+    email = request.headers.get("X-Bench-User", OWNER)
+    return {
+        "user": {"sub": f"bench|{email}", "email": email},
+        "token_sets": [{"access_token": "bench-access-token"}],
+        "refresh_token": "bench-refresh-token",
+    }
+
+
+def use_fake_openai(base_url: str):
+    """Point the embedding model's clients, created on import, at the fake."""
+    fake_model = OpenAIEmbeddings(
+        model=embedding_model.model, api_key=SecretStr("bench"), base_url=base_url
+    )
+    embedding_model.client = fake_model.client
+    embedding_model.async_client = fake_model.async_client
+
+
+def serve_api(port: int) -> tuple[uvicorn.Server, asyncio.AbstractEventLoop, threading.Thread]:
+    """Run the API with its lifespan on its own thread, returns the server, its loop and thread."""
+    loop = asyncio.new_event_loop()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(server.serve(),), daemon=True
+    )
+    thread.start()
+    while not server.started:
+        # uvicorn logs a failed startup and exits the thread
+        if not thread.is_alive():
+            raise RuntimeError("The API did not start")
+        time.sleep(0.01)
+    return server, loop, thread
+
+
+def vocabulary() -> list[str]:
+    words = set()
+    for file in sorted((FIXTURES / "corpus").iterdir()):
+        words.update(re.findall(r"[A-Za-z]{3,}", file.read_text()))
+    return sorted(words)
+
+
+def make_text(rng: np.random.Generator, words: list[str], count: int) -> str:
+    return " ".join(words[i] for i in rng.integers(0, len(words), count))
+
+
+def make_pdf(pages: list[str], line_chars: int = 90, page_lines: int = 50) -> bytes:
+    """A PDF with one Helvetica text page per string, lines wrapped at `line_chars`."""
+    # Catalog, page tree (written once the pages are known) and font
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for text in pages:
+        lines = re.findall(rf".{{1,{line_chars}}}(?:\s|$)", text)[:page_lines]
+        body = "BT /F1 10 Tf 14 TL 50 790 Td " + " ".join(
+            f"({line.strip()}) '" for line in lines
+        ) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % i for i in page_ids),
+        len(page_ids),
+    )
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, content)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(pdf)
+
+
+def summarize(
+    scenario: str,
+    latencies: list[float],
+    elapsed: float,
+    errors: int,
+    concurrency: int,
+    **extra,
+) -> dict:
+    """Throughput and latency percentiles of a scenario, from latencies in seconds."""
+    return {
+        "scenario": scenario,
+        "operations": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        **percentiles([latency * 1000 for latency in latencies]),
+        **extra,
+    }
+
+
+async def gather_limited(concurrency: int, calls) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(one(call) for call in calls), return_exceptions=True)
+
+
+async def run_upload(
+    client: httpx.AsyncClient, args, words: list[str], document_ids: list[str]
+) -> dict:
+    """Upload the documents, their ids are added to `document_ids` as they are created."""
+    rng = np.random.default_rng(args.seed)
+    files = [
+        (
+            f"bench-{number}.pdf",
+            make_pdf([make_text(rng, words, args.words_per_page) for _ in range(args.pages)]),
+        )
+        for number in range(args.documents)
+    ]
+
+    async def upload(name: str, content: bytes) -> tuple[float, float]:
+        started = time.perf_counter()
+        response = await client.post(
+            "documents/upload", files={"file": (name, content, "application/pdf")}
+        )
+        response.raise_for_status()
+        document_id = response.json()["id"]
+        document_ids.append(document_id)
+        uploaded = time.perf_counter() - started
+
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline:
+            status = (await client.get(f"documents/{document_id}/status")).json()
+            if status["status"] == "ready":
+                return uploaded, time.perf_counter() - started
+            if status["status"] == "failed":
+                raise RuntimeError(f"{name} failed: {status.get('error')}")
+            await asyncio.sleep(0.05)
+        raise TimeoutError(f"{name} was not ready after {args.timeout}s")
+
+    started = time.perf_counter()
+    results = await gather_limited(
+        args.concurrency, [lambda f=f: upload(*f) for f in files]
+    )
+    elapsed = time.perf_counter() - started
+
+    done = [r for r in results if not isinstance(r, BaseException)]
+    for error in {str(r) for r in results if isinstance(r, BaseException)}:
+        print(f"upload error: {error}")
+    return summarize(
+        "upload",
+        [r[0] for r in done],
+        elapsed,
+        len(results) - len(done),
+        args.concurrency,
+        **percentiles([r[1] * 1000 for r in done], "ready_"),
+        mb_uploaded=round(sum(len(f[1]) for f in files) / 1024 / 1024, 2),
+    )
+
+
+async def run_share(
+    client: httpx.AsyncClient, args, fga: FakeFga, document_ids: list[str]
+) -> tuple[dict, list[str]]:
+    viewers = [f"viewer-{number}@bench.example" for number in range(args.share_users)]
+
+    async def share(document_id: str) -> tuple[float, float]:
+        started = time.perf_counter()
+        response = await client.post(
+            f"documents/{document_id}/share", json={"email_addresses": viewers}
+        )
+        response.raise_for_status()
+        requested = time.perf_counter() - started
+
+        # The tuples reach FGA through the outbox, after the response
+        keys = [(f"user:{email}", "viewer", f"doc:{document_id}") for email in viewers]
+        deadline = started + args.timeout
+        while time.perf_counter() < deadline:
+            written = [fga.written_at.get(key) for key in keys]
+            if all(written):
+                return requested, max(written) - started
+            await asyncio.sleep(0.02)
+        raise TimeoutError(f"the tuples of {document_id} did not reach FGA in {args.timeout}s")
+
+    started = time.perf_counter()
+    results = await gather_limited(
+        args.concurrency, [lambda d=d: share(d) for d in document_ids]
+    )
+    elapsed = time.perf_counter() - started
+
+    done = [r for r in results if not isinstance(r, BaseException)]
+    for error in {str(r) for r in results if isinstance(r, BaseException)}:
+        print(f"share error: {error}")
+    return (
+        summarize(
+            "share",
+            [r[0] for r in done],
+            elapsed,
+            len(results) - len(done),
+            args.concurrency,
+            **percentiles([r[1] * 1000 for r in done], "propagation_"),
+            tuples=len(done) * len(viewers),
+        ),
+        viewers,
+    )
+
+
+async def run_retrieval(args, users: list[str], words: list[str]) -> dict:
+    """Runs on the API's event loop, where the FGA and embedding clients live."""
+    rng = np.random.default_rng(args.seed + 1)
+    questions = [make_text(rng, words, 12) + "?" for _ in range(args.queries)]
+    returned = []
+
+    async def retrieve(number: int, question: str) -> float:
+        user = users[number % len(users)]
+        started = time.perf_counter()
+        content = await get_context_docs.ainvoke(
+            {"question": question},
+            config={"configurable": {"_credentials": {"user": {"email": user}}}},
+        )
+        returned.append(bool(content))
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = await gather_limited(
+        args.concurrency,
+        [lambda n=n, q=q: retrieve(n, q) for n, q in enumerate(questions)],
+    )
+    elapsed = time.perf_counter() - started
+
+    latencies = [r for r in results if not isinstance(r, BaseException)]
+    for error in {str(r) for r in results if isinstance(r, BaseException)}:
+        print(f"retrieval error: {error}")
+    return summarize(
+        "retrieval",
+        latencies,
+        elapsed,
+        len(results) - len(latencies),
+        args.concurrency,
+        users=len(users),
+        empty_results=returned.count(False),
+    )
+
+
+async def run_chat(client: httpx.AsyncClient, args) -> dict:
+    url = f"{client.base_url}agent/threads/bench/runs/stream"
+
+    started = time.perf_counter()
+    results = await gather_limited(
+        args.concurrency, [lambda: stream_run(client, url) for _ in range(args.runs)]
+    )
+    elapsed = time.perf_counter() - started
+
+    done = [r for r in results if not isinstance(r, BaseException)]
+    for error in {str(r) for r in results if isinstance(r, BaseException)}:
+        print(f"chat error: {error}")
+    return summarize(
+        "chat",
+        [r[1] for r in done],
+        elapsed,
+        len(results) - len(done),
+        args.concurrency,
+        **percentiles([r[0] * 1000 for r in done], "ttfb_"),
+        mb_per_second=round(sum(r[2] for r in done) / elapsed / 1024 / 1024, 2),
+    )
+
+
+async def delete_documents(client: httpx.AsyncClient, args, document_ids: list[str]):
+    await gather_limited(
+        args.concurrency, [lambda d=d: client.delete(f"documents/{d}") for d in document_ids]
+    )
+
+    # The tuple deletes must leave the outbox before FGA goes away
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline:
+        if not (await asyncio.to_thread(fga_outbox_dispatcher.stats))["queue_depth"]:
+            return
+        await asyncio.sleep(0.1)
+    print("The FGA outbox was not drained, the benchmark's tuples are left in it")
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline: dict, file=sys.stdout):
+    """Print the change of throughput and latency against an earlier --json output."""
+    before = {r["scenario"]: r for r in baseline["scenarios"]}
+    print(f"\nagainst {baseline.get('commit') or 'baseline'}:", file=file)
+    for result in results:
+        old = before.get(result["scenario"])
+        if not old:
+            continue
+        changes = []
+        for key in ("per_second", "p50_ms", "p95_ms", "p99_ms"):
+            if old.get(key):
+                change = (result[key] - old[key]) / old[key] * 100
+                changes.append(f"{key} {old[key]} -> {result[key]} ({change:+.1f}%)")
+        print(f"{result['scenario']}: " + ", ".join(changes), file=file)
+
+
+def run(args, scenarios: list[str]) -> dict:
+    """Serve the fakes and the API, run the scenarios and tear everything down."""
+    openai = FakeOpenAI(seed=args.seed, delay_ms=args.openai_delay_ms)
+    fga = FakeFga(delay_ms=args.fga_delay_ms)
+    langgraph = FakeLangGraph(args.events, args.event_size)
+    openai_port = serve(openai.app(), free_port()).config.port
+    fga_port = serve(fga.app(), free_port()).config.port
+    langgraph_port = serve(langgraph.app(), free_port()).config.port
+
+    use_fake_openai(f"http://127.0.0.1:{openai_port}/v1")
+    settings.FGA_API_URL = f"http://127.0.0.1:{fga_port}"
+    settings.FGA_API_TOKEN_ISSUER = settings.FGA_API_URL
+    settings.FGA_STORE_ID = new_ulid()
+    settings.FGA_AUTHORIZATION_MODEL_ID = None
+    settings.LANGGRAPH_API_URL = f"http://127.0.0.1:{langgraph_port}"
+    app.dependency_overrides[auth_client.require_session] = bench_session
+    server, api_loop, api_thread = serve_api(free_port())
+    base_url = f"http://127.0.0.1:{server.config.port}{settings.API_PREFIX}/"
+
+    def client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers={"X-Bench-User": OWNER},
+            limits=httpx.Limits(max_connections=args.concurrency),
+            timeout=None,
+        )
+
+    async def run_http(scenario, *scenario_args):
+        async with client() as http:
+            return await scenario(http, *scenario_args)
+
+    words = vocabulary()
+    results = []
+    document_ids: list[str] = []
+    try:
+        if {"upload", "share", "retrieval"} & set(scenarios):
+            result = asyncio.run(run_http(run_upload, args, words, document_ids))
+            if "upload" in scenarios:
+                results.append(result)
+        users = [OWNER]
+        if "share" in scenarios:
+            result, viewers = asyncio.run(run_http(run_share, args, fga, document_ids))
+            results.append(result)
+            users += viewers
+        if "retrieval" in scenarios:
+            results.append(
+                asyncio.run_coroutine_threadsafe(
+                    run_retrieval(args, users, words), api_loop
+                ).result()
+            )
+        if "chat" in scenarios:
+            results.append(asyncio.run(run_http(run_chat, args)))
+    finally:
+        if document_ids:
+            asyncio.run(run_http(delete_documents, args, document_ids))
+        server.should_exit = True
+        api_thread.join()
+
+    # Checksum of the seeded inputs, runs are only comparable when it matches
+    workload = zlib.crc32(
+        json.dumps(
+            {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+        ).encode()
+    )
+    output = {
+        "commit": current_commit(),
+        "workload": f"{workload:08x}",
+        "settings": {k: v for k, v in vars(args).items() if k != "baseline"},
+        "scenarios": results,
+        "fakes": {
+            "openai": {
+                "requests": openai.requests,
+                "inputs": openai.inputs,
+                "tokens": openai.tokens,
+            },
+            "fga": {"requests": dict(fga.requests), "tuples_written": fga.tuples_written},
+            "langgraph": {"runs_started": langgraph.runs_started},
+        },
+    }
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--share-users", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--event-size", type=int, default=512)
+    parser.add_argument("--openai-delay-ms", type=float, default=0)
+    parser.add_argument("--fga-delay-ms", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--timeout", type=float, default=120, help="seconds to wait for a document or share"
+    )
+    parser.add_argument("--baseline", help="an earlier --json output to compare with")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # The app logs with print(), stdout is kept for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        output = run(args, scenarios)
+    results = output["scenarios"]
+
+    if args.json:
+        print(json.dumps(output, indent=2))
+    else:
+        print_table(results)
+
+    if args.baseline:
+        # Kept off stdout when it carries the JSON
+        file = sys.stderr if args.json else sys.stdout
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("workload") != output["workload"]:
+            print("\nthe baseline ran other settings, it is not comparable", file=file)
+        compare(results, baseline, file)
+
+
+if __name__ == "__main__":
+    main()
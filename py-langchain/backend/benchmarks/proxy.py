@@ -0,0 +1,173 @@
+"""
+Throughput and latency of the /api/agent proxy against a local LangGraph stub.
+
+The benchmark serves the fake LangGraph server and the API on local ports,
+with the session check bypassed, and streams runs through the proxy from
+concurrent clients. Every stream is also fetched from the stub directly as a
+baseline. It finally checks that a client going away mid-stream cancels the
+upstream run.
+
+    python -m benchmarks.proxy --requests 500 --concurrency 50
+    python -m benchmarks.proxy --events 1000 --event-size 2048 --json > proxy.json
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from app.core.auth import auth_client
+from app.core.config import settings
+from app.main import app
+from benchmarks.fakes.langgraph import FakeLangGraph
+from benchmarks.report import percentiles, print_table
+
+FAKE_SESSION = {
+    "user": {"sub": "auth0|bench", "email": "bench@example.com"},
+    "token_sets": [{"access_token": "bench-access-token"}],
+    "refresh_token": "bench-refresh-token",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(asgi_app, port: int) -> uvicorn.Server:
+    """Run an ASGI app on its own thread and event loop."""
+    server = uvicorn.Server(
+        uvicorn.Config(
+            asgi_app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"
+        )
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def stream_run(client: httpx.AsyncClient, url: str) -> tuple[float, float, int]:
+    """Stream one run, returns the time to first byte, total time and bytes received."""
+    started = time.perf_counter()
+    first_byte = None
+    received = 0
+    async with client.stream(
+        "POST",
+        url,
+        json={"input": {"messages": [{"role": "user", "content": "hi"}]}},
+        headers={"Accept": "text/event-stream"},
+    ) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            received += len(chunk)
+    return first_byte or 0.0, time.perf_counter() - started, received
+
+
+async def run_load(url: str, requests: int, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+
+        async def one():
+            async with semaphore:
+                return await stream_run(client, url)
+
+        await asyncio.gather(*(one() for _ in range(min(concurrency, requests))))  # warm up
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    first_bytes = [r[0] * 1000 for r in results]
+    totals = [r[1] * 1000 for r in results]
+    received = sum(r[2] for r in results)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": round(requests / elapsed, 1),
+        "mb_per_second": round(received / elapsed / 1024 / 1024, 2),
+        **percentiles(first_bytes, "ttfb_"),
+        **percentiles(totals, "total_"),
+    }
+
+
+async def check_cancellation(url: str, fake: FakeLangGraph) -> bool:
+    """Leave a slow stream after the first chunk and see whether the run gets cancelled."""
+    delay_ms, fake.delay_ms = fake.delay_ms, 50
+    cancelled = fake.runs_cancelled
+    try:
+        async with httpx.AsyncClient(timeout=None) as client:
+            async with client.stream("POST", url, json={"input": {}}) as response:
+                async for _ in response.aiter_raw():
+                    break
+        for _ in range(100):
+            if fake.runs_cancelled > cancelled:
+                return True
+            await asyncio.sleep(0.05)
+        return False
+    finally:
+        fake.delay_ms = delay_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--event-size", type=int, default=512)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    fake = FakeLangGraph(args.events, args.event_size)
+    fake_port = serve(fake.app(), free_port()).config.port
+    settings.LANGGRAPH_API_URL = f"http://127.0.0.1:{fake_port}"
+
+    app.dependency_overrides[auth_client.require_session] = lambda: FAKE_SESSION
+    api_port = serve(app, free_port()).config.port
+
+    path = "threads/bench/runs/stream"
+    direct_url = f"http://127.0.0.1:{fake_port}/{path}"
+    proxy_url = f"http://127.0.0.1:{api_port}{settings.API_PREFIX}/agent/{path}"
+
+    results = [
+        {"target": "direct", **asyncio.run(run_load(direct_url, args.requests, args.concurrency))},
+        {"target": "proxy", **asyncio.run(run_load(proxy_url, args.requests, args.concurrency))},
+    ]
+    credentials_forwarded = (
+        fake.last_body or {}
+    ).get("config", {}).get("configurable", {}).get("_credentials", {}).get(
+        "access_token"
+    ) == FAKE_SESSION["token_sets"][0]["access_token"]
+    cancelled = asyncio.run(check_cancellation(proxy_url, fake))
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "events": args.events,
+                    "event_size": args.event_size,
+                    "results": results,
+                    "credentials_forwarded": credentials_forwarded,
+                    "cancelled_on_disconnect": cancelled,
+                },
+                indent=2,
+            )
+        )
+        return
+
+    print_table(results)
+    print(f"credentials forwarded: {credentials_forwarded}")
+    print(f"upstream run cancelled on disconnect: {cancelled}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Latency summaries and result tables shared by the benchmarks.
+
+Every benchmark reports the same percentiles, computed the same way (numpy's
+linear interpolation), so their numbers can be compared with each other.
+"""
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentiles(latencies_ms: list[float], prefix: str = "") -> dict:
+    """The `{prefix}p50_ms`, p95 and p99 of latencies in milliseconds."""
+    values = latencies_ms or [0.0]
+    return {
+        f"{prefix}p{p}_ms": round(float(np.percentile(values, p)), 2)
+        for p in PERCENTILES
+    }
+
+
+def print_table(results: list[dict], file=None):
+    """Print one row per result, with the columns of all of them in order."""
+    columns = list(dict.fromkeys(column for result in results for column in result))
+    widths = [
+        max(len(column), *(len(str(result.get(column, ""))) for result in results))
+        for column in columns
+    ]
+    print(
+        " | ".join(column.rjust(width) for column, width in zip(columns, widths)),
+        file=file,
+    )
+    for result in results:
+        print(
+            " | ".join(
+                str(result.get(column, "")).rjust(width)
+                for column, width in zip(columns, widths)
+            ),
+            file=file,
+        )
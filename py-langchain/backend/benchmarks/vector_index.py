@@ -0,0 +1,187 @@
+"""
+Compare approximate vector indexes with exact search as the table grows.
+
+The benchmark fills a scratch table with clustered random vectors, and at every
+size measures exact search, then builds each index and measures recall@k
+against the exact results and the latency of the same queries at several
+ef_search / probes values. It needs a Postgres database with pgvector, by
+default the one in DATABASE_URL; the scratch table is dropped afterwards.
+
+    python -m benchmarks.vector_index --sizes 10000,50000,100000
+    python -m benchmarks.vector_index --dimensions 1536 --json > vector_index.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.vector_index import default_ivfflat_lists
+from benchmarks.report import percentiles, print_table
+
+TABLE = f"bench_vector_index_{os.getpid()}"
+
+
+def make_vectors(rng: np.random.Generator, centers: np.ndarray, count: int) -> np.ndarray:
+    """Vectors scattered around random centers, embeddings of real documents cluster too."""
+    assignments = rng.integers(0, len(centers), count)
+    vectors = centers[assignments] + rng.normal(scale=0.35, size=(count, centers.shape[1]))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def to_pgvector(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{value:.6f}" for value in vector) + "]"
+
+
+def insert_vectors(conn, vectors: np.ndarray, first_id: int):
+    cursor = conn.connection.cursor()
+    with cursor.copy(f"COPY {TABLE} (id, embedding) FROM STDIN") as copy:
+        for offset, vector in enumerate(vectors):
+            copy.write_row((first_id + offset, to_pgvector(vector)))
+    conn.connection.commit()
+
+
+def run_queries(conn, queries: list[str], k: int, setting: str | None = None):
+    """Run every query once, return the result ids and latencies in ms."""
+    results = []
+    latencies = []
+    for query in queries:
+        with conn.begin():
+            if setting:
+                conn.execute(text(f"SET LOCAL {setting}"))
+            started = time.perf_counter()
+            rows = conn.execute(
+                text(
+                    f"SELECT id FROM {TABLE} "
+                    "ORDER BY embedding <=> CAST(:query AS vector) LIMIT :k"
+                ),
+                {"query": query, "k": k},
+            ).all()
+            latencies.append((time.perf_counter() - started) * 1000)
+        results.append([row.id for row in rows])
+    return results, latencies
+
+
+def summarize(name, size, latencies, results=None, exact=None, k=10, build_seconds=None):
+    summary = {
+        "index": name,
+        "rows": size,
+        **percentiles(latencies),
+    }
+    if exact is not None:
+        hits = sum(len(set(a) & set(e)) for a, e in zip(results, exact))
+        summary[f"recall@{k}"] = round(hits / (len(exact) * k), 3)
+    if build_seconds is not None:
+        summary["build_seconds"] = round(build_seconds, 2)
+    return summary
+
+
+def benchmark_index(conn, name, create_sql, settings_to_try, queries, exact, size, k):
+    started = time.perf_counter()
+    conn.execute(text(create_sql))
+    conn.commit()
+    build_seconds = time.perf_counter() - started
+    conn.execute(text(f"ANALYZE {TABLE}"))
+    conn.commit()
+
+    results = []
+    for setting in settings_to_try:
+        run_queries(conn, queries[:5], k, setting)  # warm up
+        found, latencies = run_queries(conn, queries, k, setting)
+        results.append(
+            summarize(f"{name} {setting}", size, latencies, found, exact, k, build_seconds)
+        )
+
+    conn.execute(text(f"DROP INDEX {TABLE}_idx"))
+    conn.commit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ef-search", default="20,40,100")
+    parser.add_argument("--probes", default="1,10,40")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(args.clusters, args.dimensions))
+    queries = [to_pgvector(v) for v in make_vectors(rng, centers, args.queries)]
+
+    engine = create_engine(args.database_url)
+    results = []
+    with engine.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(
+            text(
+                f"CREATE TABLE {TABLE} "
+                f"(id bigint PRIMARY KEY, embedding vector({args.dimensions}))"
+            )
+        )
+        conn.commit()
+
+        try:
+            row_count = 0
+            for size in (int(size) for size in args.sizes.split(",")):
+                insert_vectors(conn, make_vectors(rng, centers, size - row_count), row_count)
+                row_count = size
+                conn.execute(text(f"ANALYZE {TABLE}"))
+                conn.commit()
+
+                run_queries(conn, queries[:5], args.k)  # warm up
+                exact, latencies = run_queries(conn, queries, args.k)
+                results.append(summarize("exact", size, latencies))
+
+                results.extend(
+                    benchmark_index(
+                        conn,
+                        "hnsw",
+                        f"CREATE INDEX {TABLE}_idx ON {TABLE} "
+                        "USING hnsw (embedding vector_cosine_ops) "
+                        f"WITH (m = {settings.VECTOR_INDEX_HNSW_M}, "
+                        f"ef_construction = {settings.VECTOR_INDEX_HNSW_EF_CONSTRUCTION})",
+                        [f"hnsw.ef_search = {ef}" for ef in args.ef_search.split(",")],
+                        queries,
+                        exact,
+                        size,
+                        args.k,
+                    )
+                )
+                results.extend(
+                    benchmark_index(
+                        conn,
+                        "ivfflat",
+                        f"CREATE INDEX {TABLE}_idx ON {TABLE} "
+                        "USING ivfflat (embedding vector_cosine_ops) "
+                        f"WITH (lists = {default_ivfflat_lists(size)})",
+                        [f"ivfflat.probes = {probes}" for probes in args.probes.split(",")],
+                        queries,
+                        exact,
+                        size,
+                        args.k,
+                    )
+                )
+        finally:
+            conn.rollback()
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            conn.commit()
+
+    if args.json:
+        print(json.dumps({"dimensions": args.dimensions, "results": results}, indent=2))
+        return
+
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+from urllib.parse import urlsplit
+
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+from langgraph.prebuilt import ToolNode
+
+from app.agents.tools.shop_online import shop_online
+from app.core.async_authorization import GRAPH_ID, AsyncAuthorizationResumer
+from app.core.config import settings
+from benchmarks.fakes.auth0_ciba import FakeAuth0Ciba
+from benchmarks.proxy import serve
+
+USER_ID = "auth0|test"
+
+
+class GraphThreads:
+    def __init__(self, graph, thread_ids: list[str]):
+        self.graph = graph
+        self.thread_ids = thread_ids
+
+    async def search(self, status=None, metadata=None, limit=10, offset=0, **kwargs):
+        threads = []
+        for thread_id in self.thread_ids:
+            state = await self.graph.aget_state({"configurable": {"thread_id": thread_id}})
+            interrupts = {
+                task.id: [
+                    {"value": interrupt.value, "id": interrupt.interrupt_id}
+                    for interrupt in task.interrupts
+                ]
+                for task in state.tasks
+                if task.interrupts
+            }
+            if status == "interrupted" and not interrupts:
+                continue
+            threads.append(
+                {
+                    "thread_id": thread_id,
+                    "metadata": {"graph_id": GRAPH_ID},
+                    "interrupts": interrupts,
+                }
+            )
+        return threads[offset : offset + limit]
+
+
+class GraphRuns:
+    def __init__(self, graph):
+        self.graph = graph
+        self.waits = 0
+
+    async def wait(self, thread_id, assistant_id, raise_error=True, **kwargs):
+        self.waits += 1
+        return await self.graph.ainvoke(None, config(thread_id))
+
+
+class GraphClient:
+    """The parts of the LangGraph SDK client the resumer uses, on a local graph."""
+
+    def __init__(self, graph, thread_ids: list[str]):
+        self.threads = GraphThreads(graph, thread_ids)
+        self.runs = GraphRuns(graph)
+
+
+def config(thread_id: str) -> dict:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "_credentials": {"user": {"sub": USER_ID}},
+        }
+    }
+
+
+@pytest.fixture
+def ciba():
+    fake = FakeAuth0Ciba(interval=0)
+    server = serve(fake.app(), urlsplit(settings.ASYNC_AUTHORIZATION_AUTH0_URL).port)
+    yield fake
+    server.should_exit = True
+
+
+@pytest.fixture
+def graph():
+    builder = StateGraph(MessagesState)
+    builder.add_node("tools", ToolNode([shop_online]))
+    builder.add_edge(START, "tools")
+    builder.add_edge("tools", END)
+    return builder.compile(checkpointer=InMemorySaver())
+
+
+async def resume(resumer: AsyncAuthorizationResumer):
+    await resumer.loop()
+    await asyncio.gather(*resumer._checking.values())
+
+
+def test_interrupt_resume_approve(ciba, graph):
+    async def run():
+        purchase = AIMessage(
+            content="",
+            tool_calls=[
+                {
+                    "name": "shop_online",
+                    "args": {"product": "socks", "quantity": 2},
+                    "id": "call_1",
+                }
+            ],
+        )
+        await graph.ainvoke({"messages": [purchase]}, config("thread-1"))
+        state = await graph.aget_state(config("thread-1"))
+        assert state.interrupts
+        assert len(ciba.requests) == 1
+
+        client = GraphClient(graph, ["thread-1"])
+        resumer = AsyncAuthorizationResumer(client)
+        errors = []
+        resumer.on_error(errors.append)
+
+        # Not approved yet, the run checks the request and interrupts again
+        await resume(resumer)
+        assert client.runs.waits == 1
+        assert ciba.pending_answers == 2
+        assert (await graph.aget_state(config("thread-1"))).interrupts
+        assert resumer.stats()["pending"] == 1
+
+        ciba.approve(next(iter(ciba.requests)))
+        await resume(resumer)
+        assert client.runs.waits == 2
+        assert ciba.tokens_issued == 1
+        state = await graph.aget_state(config("thread-1"))
+        assert not state.interrupts
+        assert state.values["messages"][-1].content == "Ordered 2 socks"
+
+        # The thread went on, the approval is dropped without another run
+        await resume(resumer)
+        assert client.runs.waits == 2
+        assert resumer.stats()["pending"] == 0
+        assert resumer.stats()["resolved"] == 1
+        assert errors == []
+
+    asyncio.run(run())
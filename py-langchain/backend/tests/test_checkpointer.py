@@ -0,0 +1,126 @@
+import operator
+import os
+import time
+import uuid
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver as MemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph_api.serde import Serializer
+from langgraph_runtime_inmem import checkpoint as runtime_checkpoint
+from sqlmodel import Session, SQLModel, func, select
+
+from app.core.checkpointer import PostgresCheckpointer, compact_checkpoints
+from app.core.db import engine
+from app.models.checkpoints import (
+    AgentCheckpoint,
+    AgentCheckpointBlob,
+    AgentCheckpointWrite,
+)
+
+needs_postgres = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"),
+    reason="set TEST_DATABASE_URL to a Postgres database the tests may write to",
+)
+
+
+class State(TypedDict):
+    turns: Annotated[list[str], operator.add]
+
+
+def answer(state: State) -> dict:
+    return {"turns": [f"answer {len(state['turns'])}"]}
+
+
+def compile_graph(checkpointer):
+    builder = StateGraph(State)
+    builder.add_node("answer", answer)
+    builder.add_edge(START, "answer")
+    builder.add_edge("answer", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_runtime_memory_layout():
+    """The parts of the runtime's checkpointer PostgresCheckpointer builds on."""
+    assert hasattr(runtime_checkpoint, "MEMORY")
+    assert issubclass(runtime_checkpoint.InMemorySaver, MemorySaver)
+
+    saver = MemorySaver(serde=Serializer())
+    compile_graph(saver).invoke({"turns": ["question"]}, config("thread-1"))
+
+    # storage[thread][namespace][checkpoint id] = (checkpoint, metadata, parent id)
+    checkpoints = saver.storage["thread-1"][""]
+    assert len(checkpoints) == 3
+    for (checkpoint_type, data), (meta_type, meta), parent_id in checkpoints.values():
+        assert isinstance(checkpoint_type, str) and isinstance(data, bytes)
+        assert isinstance(meta_type, str) and isinstance(meta, bytes)
+        assert parent_id is None or parent_id in checkpoints
+    # blobs[(thread, namespace, channel, version)] = (type, bytes)
+    for key, (value_type, value) in saver.blobs.items():
+        assert key[:2] == ("thread-1", "") and len(key) == 4
+        assert isinstance(value_type, str) and isinstance(value, bytes)
+    # writes[(thread, namespace, checkpoint id)][(task id, idx)] =
+    # (task id, channel, (type, bytes), task path)
+    for key, writes in saver.writes.items():
+        assert key[:2] == ("thread-1", "") and key[2] in checkpoints
+        for (task_id, idx), (write_task_id, channel, value, path) in writes.items():
+            assert write_task_id == task_id and isinstance(channel, str)
+            assert isinstance(value[0], str) and isinstance(value[1], bytes)
+
+
+def stored_checkpoints(thread_id: str) -> int:
+    with Session(engine) as db_session:
+        return db_session.exec(
+            select(func.count()).where(AgentCheckpoint.thread_id == thread_id)
+        ).one()
+
+
+@needs_postgres
+def test_postgres_round_trip():
+    SQLModel.metadata.create_all(
+        engine,
+        tables=[
+            AgentCheckpoint.__table__,
+            AgentCheckpointBlob.__table__,
+            AgentCheckpointWrite.__table__,
+        ],
+    )
+    thread_id = f"test-{uuid.uuid4()}"
+    saver = PostgresCheckpointer(idle_seconds=0, keep_last=2, ttl_days=0)
+    graph = compile_graph(saver)
+
+    for turn in range(3):
+        graph.invoke({"turns": [f"question {turn}"]}, config(thread_id))
+    saver.flush()
+    turns = graph.get_state(config(thread_id)).values["turns"]
+    assert len(turns) == 6
+    assert stored_checkpoints(thread_id) == 9
+
+    # Stored threads leave memory and come back from Postgres
+    assert saver.evict_idle(time.monotonic() + 1) == 1
+    assert saver.stats()["threads_in_memory"] == 0
+    assert saver.get_tuple(config(thread_id)) is not None
+    assert saver.loads == 1
+    assert graph.get_state(config(thread_id)).values["turns"] == turns
+
+    # Compaction keeps the last checkpoints, enough to go on with the thread
+    compact_checkpoints(keep_last=2, ttl_days=0)
+    assert stored_checkpoints(thread_id) == 2
+    saver.evict_idle(time.monotonic() + 1)
+    assert graph.get_state(config(thread_id)).values["turns"] == turns
+    graph.invoke({"turns": ["question 3"]}, config(thread_id))
+    assert graph.get_state(config(thread_id)).values["turns"] == [
+        *turns,
+        "question 3",
+        "answer 7",
+    ]
+    assert saver.loads == 2
+
+    saver.delete_thread(thread_id)
+    saver.flush()
+    assert stored_checkpoints(thread_id) == 0
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.config import settings
+from app.core.google_calendar import CalendarEventCache
+from benchmarks.fakes.google_calendar import FakeGoogleCalendar
+from benchmarks.proxy import free_port, serve
+
+USER_KEY = "auth0|test"
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    fake = FakeGoogleCalendar()
+    port = free_port()
+    server = serve(fake.app(), port)
+    monkeypatch.setattr(
+        settings, "GOOGLE_CALENDAR_API_URL", f"http://127.0.0.1:{port}/calendar/v3/"
+    )
+    yield fake
+    server.should_exit = True
+
+
+def summaries(events: list[dict]) -> list[str]:
+    return [event["summary"] for event in events]
+
+
+def test_sync_token_cancellations_and_expiry(calendar):
+    now = datetime.now(timezone.utc)
+    standup = calendar.add_event(
+        "Standup", now + timedelta(hours=1), timedelta(minutes=15)
+    )
+    review = calendar.add_event("Review", now + timedelta(hours=2), timedelta(hours=1))
+
+    async def run():
+        cache = CalendarEventCache(max_size=10, window_days=30)
+
+        assert summaries(await cache.upcoming_events(USER_KEY, "token")) == [
+            "Standup",
+            "Review",
+        ]
+        assert calendar.full_lists == 1
+
+        # Only the changes are fetched, cancelled events are dropped
+        calendar.cancel_event(standup["id"])
+        calendar.add_event("Lunch", now + timedelta(hours=3), timedelta(hours=1))
+        assert summaries(await cache.upcoming_events(USER_KEY, "token")) == [
+            "Review",
+            "Lunch",
+        ]
+        assert calendar.full_lists == 1
+        assert calendar.incremental_lists == 1
+
+        # Events that ended or start past the window are not kept
+        calendar.update_event(
+            review["id"],
+            start={"dateTime": (now - timedelta(hours=2)).isoformat()},
+            end={"dateTime": (now - timedelta(hours=1)).isoformat()},
+        )
+        calendar.add_event("Offsite", now + timedelta(days=60), timedelta(hours=8))
+        assert summaries(await cache.upcoming_events(USER_KEY, "token")) == ["Lunch"]
+        assert summaries(list(cache._states[USER_KEY].events.values())) == ["Lunch"]
+
+        # An expired sync token (410 Gone) lists the window again
+        calendar.expire_sync_tokens()
+        calendar.add_event("Retro", now + timedelta(hours=4), timedelta(hours=1))
+        assert summaries(await cache.upcoming_events(USER_KEY, "token")) == [
+            "Lunch",
+            "Retro",
+        ]
+        assert calendar.full_lists == 2
+        assert cache.stats() == {
+            "users": 1,
+            "full_syncs": 2,
+            "incremental_syncs": 2,
+            "expired_sync_tokens": 1,
+            "changes_received": 4,
+        }
+
+    asyncio.run(run())
@@ -14,7 +14,7 @@ import {
 import { Input } from "@/components/ui/input";
 import {
   deleteDocument,
-  getDocumentContent,
+  downloadDocument,
   shareDocument,
   type Document,
 } from "@/lib/documents";
@@ -24,18 +24,6 @@ interface DocumentItemActionsProps {
   onActionComplete?: () => void; // To trigger revalidation on the parent page
 }
 
-/**
- * Converts a base64 string to a Uint8Array.
- */
-function base64toUint8Array(base64: string): Uint8Array {
-  const binaryString = atob(base64);
-  const bytes = new Uint8Array(binaryString.length);
-  for (let i = 0; i < binaryString.length; i++) {
-    bytes[i] = binaryString.charCodeAt(i);
-  }
-  return bytes;
-}
-
 export default function DocumentItemActions({
   doc,
   onActionComplete,
@@ -47,12 +35,7 @@ export default function DocumentItemActions({
   const handleDownload = async () => {
     try {
       // Fetch the document content
-      const content = await getDocumentContent(doc.id);
-      if (!content) {
-        throw new Error("Failed to download document");
-      }
-      const bytes = base64toUint8Array(content);
-      const blob = new Blob([bytes], { type: doc.fileType });
+      const blob = await downloadDocument(doc.id);
       const url = window.URL.createObjectURL(blob);
       const a = document.createElement("a");
       a.href = url;
@@ -112,94 +95,107 @@ export default function DocumentItemActions({
         Download
       </Button>
 
-      <Dialog
-        open={openShareDialog}
-        onOpenChange={(open) => {
-          setOpenShareDialog(open);
-          setEmailToShare("");
-        }}
-      >
-        <DialogTrigger asChild>
-          <Button
-            variant="outline"
-            className="bg-blue-600"
-            size="sm"
-            disabled={isProcessing}
+      {doc.isOwner && (
+        <>
+          <Dialog
+            open={openShareDialog}
+            onOpenChange={(open) => {
+              setOpenShareDialog(open);
+              setEmailToShare("");
+            }}
           >
-            Share
-          </Button>
-        </DialogTrigger>
-        <DialogContent className="sm:max-w-[425px]">
-          <DialogHeader>
-            <DialogTitle>Share {doc.fileName}</DialogTitle>
-            <DialogDescription>
-              Enter the email addresses (comma separated) of the users you want
-              to share this document with. They will get read-only access.
-            </DialogDescription>
-          </DialogHeader>
-          <div className="grid gap-4 py-4">
-            <div className="grid grid-cols-4 items-center gap-4">
-              <label htmlFor="email" className="text-right">
-                Email
-              </label>
-              <Input
-                id="email"
-                type="email"
-                value={emailToShare}
-                onChange={(e) => setEmailToShare(e.target.value)}
-                placeholder="user@example.com"
-                className="col-span-3"
+            <DialogTrigger asChild>
+              <Button
+                variant="outline"
+                className="bg-blue-600"
+                size="sm"
                 disabled={isProcessing}
-              />
-            </div>
-          </div>
-          <DialogFooter>
-            <DialogClose asChild>
-              <Button type="button" variant="outline" disabled={isProcessing}>
-                Cancel
+              >
+                Share
               </Button>
-            </DialogClose>
-            <Button
-              type="submit"
-              onClick={handleShareSubmit}
-              disabled={isProcessing || !emailToShare.trim()}
-            >
-              {isProcessing ? "Sharing..." : "Share Document"}
-            </Button>
-          </DialogFooter>
-        </DialogContent>
-      </Dialog>
+            </DialogTrigger>
+            <DialogContent className="sm:max-w-[425px]">
+              <DialogHeader>
+                <DialogTitle>Share {doc.fileName}</DialogTitle>
+                <DialogDescription>
+                  Enter the email addresses (comma separated) of the users you
+                  want to share this document with. They will get read-only
+                  access.
+                </DialogDescription>
+              </DialogHeader>
+              <div className="grid gap-4 py-4">
+                <div className="grid grid-cols-4 items-center gap-4">
+                  <label htmlFor="email" className="text-right">
+                    Email
+                  </label>
+                  <Input
+                    id="email"
+                    type="email"
+                    value={emailToShare}
+                    onChange={(e) => setEmailToShare(e.target.value)}
+                    placeholder="user@example.com"
+                    className="col-span-3"
+                    disabled={isProcessing}
+                  />
+                </div>
+              </div>
+              <DialogFooter>
+                <DialogClose asChild>
+                  <Button
+                    type="button"
+                    variant="outline"
+                    disabled={isProcessing}
+                  >
+                    Cancel
+                  </Button>
+                </DialogClose>
+                <Button
+                  type="submit"
+                  onClick={handleShareSubmit}
+                  disabled={isProcessing || !emailToShare.trim()}
+                >
+                  {isProcessing ? "Sharing..." : "Share Document"}
+                </Button>
+              </DialogFooter>
+            </DialogContent>
+          </Dialog>
 
-      <Dialog>
-        <DialogTrigger asChild>
-          <Button variant="destructive" size="sm" disabled={isProcessing}>
-            Delete
-          </Button>
-        </DialogTrigger>
-        <DialogContent>
-          <DialogHeader>
-            <DialogTitle>Are you absolutely sure?</DialogTitle>
-            <DialogDescription>
-              This action cannot be undone. This will permanently delete the
-              document ({doc.fileName}) and its associated data.
-            </DialogDescription>
-          </DialogHeader>
-          <DialogFooter>
-            <DialogClose disabled={isProcessing}>
-              <Button type="button" variant="outline" disabled={isProcessing}>
-                Cancel
+          <Dialog>
+            <DialogTrigger asChild>
+              <Button variant="destructive" size="sm" disabled={isProcessing}>
+                Delete
               </Button>
-            </DialogClose>
-            <Button
-              onClick={handleDeleteConfirm}
-              disabled={isProcessing}
-              variant="destructive"
-            >
-              {isProcessing ? "Deleting..." : "Yes, delete document"}
-            </Button>
-          </DialogFooter>
-        </DialogContent>
-      </Dialog>
+            </DialogTrigger>
+            <DialogContent>
+              <DialogHeader>
+                <DialogTitle>Are you absolutely sure?</DialogTitle>
+                <DialogDescription>
+                  This action cannot be undone. This will permanently delete the
+                  document ({doc.fileName}) and its associated data.
+                </DialogDescription>
+              </DialogHeader>
+              <DialogFooter>
+                <DialogClose disabled={isProcessing}>
+                  <Button
+                    type="button"
+                    variant="outline"
+                    disabled={isProcessing}
+                  >
+                    Cancel
+                  </Button>
+                </DialogClose>
+                <Button
+                  onClick={handleDeleteConfirm}
+                  disabled={isProcessing}
+                  variant="destructive"
+                >
+                  {isProcessing ? "Deleting..." : "Yes, delete document"}
+                </Button>
+              </DialogFooter>
+            </DialogContent>
+          </Dialog>
+        </>
+      )}
     </div>
   );
 }
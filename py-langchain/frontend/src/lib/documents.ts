@@ -9,19 +9,30 @@ export type Document = {
   userId: string;
   userEmail: string;
   sharedWith: string[];
+  // Only the owner can share and delete the document
+  isOwner: boolean;
+};
+
+export type DocumentsPage = {
+  documents: Document[];
+  nextCursor: string | null;
 };
 
 /**
- * Fetches a list of documents for a given user.
+ * Fetches a page of the documents owned by or shared with the user.
  */
-export async function getDocumentsForUser(): Promise<Document[]> {
-  const response = await apiClient.get("/api/documents");
+export async function getDocumentsForUser(
+  cursor?: string | null,
+): Promise<DocumentsPage> {
+  const response = await apiClient.get("/api/documents", {
+    params: cursor ? { cursor } : {},
+  });
 
   if (response.status !== 200) {
     throw new Error("Failed to fetch documents");
   }
 
-  return response.data.map((doc: any) => ({
+  const documents = response.data.map((doc: any) => ({
     id: doc.id,
     fileName: doc.file_name,
     fileType: doc.file_type,
@@ -30,19 +41,29 @@ export async function getDocumentsForUser(): Promise<Document[]> {
     userId: doc.user_id,
     userEmail: doc.user_email,
     sharedWith: doc.shared_with,
+    isOwner: doc.is_owner,
   }));
+
+  return {
+    documents,
+    nextCursor: response.headers["x-next-cursor"] ?? null,
+  };
 }
 
 /**
- * Fetches the content of a document.
+ * Downloads the raw content of a document.
  */
-export async function getDocumentContent(documentId: string): Promise<string> {
-  const response = await apiClient.get(`/api/documents/${documentId}/content`);
+export async function downloadDocument(documentId: string): Promise<Blob> {
+  const response = await apiClient.get(
+    `/api/documents/${documentId}/download`,
+    { responseType: "blob" },
+  );
   return response.data;
 }
 
 /**
- * Shares a document with a list of email addresses.
+ * Shares a document with a list of email addresses, access is granted in the
+ * background shortly after.
  */
 export async function shareDocument(
   documentId: string,
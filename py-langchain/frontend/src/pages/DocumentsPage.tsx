@@ -6,22 +6,28 @@ import useAuth, { getLoginUrl, getSignupUrl } from "@/lib/use-auth";
 import DocumentUploadForm from "@/components/document-upload-form";
 import DocumentItemActions from "@/components/document-item-actions";
 import { getDocumentsForUser } from "@/lib/documents";
-import { useQuery, useQueryClient } from "@tanstack/react-query";
+import { useInfiniteQuery, useQueryClient } from "@tanstack/react-query";
 
 export default function DocumentsPage() {
   const queryClient = useQueryClient();
   const { user } = useAuth();
   const {
-    data: documents,
+    data,
     isLoading,
     isError,
-  } = useQuery({
+    hasNextPage,
+    isFetchingNextPage,
+    fetchNextPage,
+  } = useInfiniteQuery({
     queryKey: ["documents"],
-    queryFn: async () => {
-      return await getDocumentsForUser();
+    queryFn: async ({ pageParam }) => {
+      return await getDocumentsForUser(pageParam);
     },
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.nextCursor,
     enabled: !!user,
   });
+  const documents = data?.pages.flatMap((page) => page.documents);
 
   if (isLoading) {
     return <p>Loading...</p>;
@@ -119,6 +125,17 @@ export default function DocumentsPage() {
             </p>
           </div>
         )}
+        {hasNextPage && (
+          <div className="flex justify-center mt-6">
+            <Button
+              variant="outline"
+              onClick={() => fetchNextPage()}
+              disabled={isFetchingNextPage}
+            >
+              {isFetchingNextPage ? "Loading..." : "Load more"}
+            </Button>
+          </div>
+        )}
       </section>
     </div>
   );